@@ -5,7 +5,8 @@ import asyncio
 import aiosqlite
 import csv
 import os
-from config import DB_PATH, logger
+from config import logger
+from database import get_db, iter_rows, count_users, run_job
 from datetime import datetime
 from pathlib import Path
 
@@ -31,22 +32,16 @@ async def export_users_to_csv():
     csv_filepath = data_dir / filename
     
     # Получаем данные пользователей из базы
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_db() as db:
         db.row_factory = aiosqlite.Row  # Чтобы получать результаты в виде словаря
         
-        cursor = await db.execute("""
-            SELECT UserID, Username, FirstName, LastName, Approve 
-            FROM Users
-            ORDER BY Approve DESC, UserID
-        """)
+        users_count = await count_users(db)
         
-        users = await cursor.fetchall()
-        
-        if not users:
+        if not users_count:
             logger.info("Пользователи в базе не найдены")
             return
             
-        logger.info(f"Найдено {len(users)} пользователей в базе")
+        logger.info(f"Найдено {users_count} пользователей в базе")
         
         # Записываем данные в CSV
         with open(csv_filepath, 'w', newline='', encoding='utf-8') as csvfile:
@@ -57,8 +52,12 @@ async def export_users_to_csv():
             # Записываем заголовок
             writer.writeheader()
             
-            # Записываем данные пользователей
-            for user in users:
+            # Записываем данные пользователей, потоково читая их порциями
+            async for user in iter_rows(db, """
+                SELECT UserID, Username, FirstName, LastName, Approve 
+                FROM Users
+                ORDER BY Approve DESC, UserID
+            """):
                 writer.writerow({
                     'UserID': user['UserID'],
                     'Username': user['Username'] or '',  # Защита от None
@@ -67,7 +66,7 @@ async def export_users_to_csv():
                     'Approve': 'Да' if user['Approve'] else 'Нет'
                 })
         
-        logger.info(f"Данные {len(users)} пользователей экспортированы в файл {csv_filepath}")
+        logger.info(f"Данные {users_count} пользователей экспортированы в файл {csv_filepath}")
         return csv_filepath
 
 async def main():
@@ -89,4 +88,4 @@ async def main():
         logger.info("Скрипт завершен")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(run_job(main)) 
\ No newline at end of file
@@ -8,23 +8,25 @@ import os
 import asyncio
 import csv
 from pathlib import Path
-from aiogram import Bot
 from aiogram.exceptions import TelegramAPIError
 
 # Отладка: проверяем загрузку переменных до импорта config
 print(f"До импорта config - TELEGRAM_API_TOKEN из os.environ: {os.environ.get('TELEGRAM_API_TOKEN', 'НЕ НАЙДЕН')}")
 
 from config import logger, API_TOKEN, COMPANY_CHANNEL_ID
+from database import get_db, run_job
+from utils.membership import MembershipIndex
+from utils.tg_client import TelegramClient
 
 print(f"После импорта config - API_TOKEN: {API_TOKEN}")
 print(f"После импорта config - COMPANY_CHANNEL_ID: {COMPANY_CHANNEL_ID}")
 
 
-async def check_bot_permissions(bot: Bot, channel_id: str) -> bool:
+async def check_bot_permissions(client: TelegramClient, channel_id: str) -> bool:
     """Проверяет права бота в канале"""
     try:
         # Получаем информацию о боте в канале
-        bot_member = await bot.get_chat_member(channel_id, bot.id)
+        bot_member = await client.get_chat_member(channel_id, client.bot.id)
         
         logger.info(f"Статус бота в канале: {bot_member.status}")
         
@@ -38,7 +40,7 @@ async def check_bot_permissions(bot: Bot, channel_id: str) -> bool:
         
         # Пробуем получить количество участников (тест функциональности)
         try:
-            member_count = await bot.get_chat_member_count(channel_id)
+            member_count = await client.get_chat_member_count(channel_id)
             logger.info(f"Тест: количество участников канала: {member_count}")
         except TelegramAPIError as e:
             logger.error(f"Бот не может получить информацию об участниках: {e}")
@@ -51,16 +53,21 @@ async def check_bot_permissions(bot: Bot, channel_id: str) -> bool:
         logger.error(f"Ошибка при проверке прав бота: {e}")
         return False
 
-async def check_user_in_channel(bot: Bot, channel_id: str, user_id: int) -> bool:
-    """Проверяет, является ли пользователь участником канала"""
+async def get_user_channel_status(client: TelegramClient, channel_id: str, user_id: int) -> str | None:
+    """Возвращает статус пользователя в канале или None, если проверить не удалось"""
     try:
-        member = await bot.get_chat_member(channel_id, user_id)
-        return member.status not in ['left', 'kicked']
+        member = await client.get_chat_member(channel_id, user_id)
+        return member.status
     except TelegramAPIError as e:
         if "user not found" in str(e).lower() or "chat not found" in str(e).lower():
-            return False
+            return None
         logger.warning(f"Ошибка при проверке пользователя {user_id}: {e}")
-        return False
+        return None
+
+async def check_user_in_channel(client: TelegramClient, channel_id: str, user_id: int) -> bool:
+    """Проверяет, является ли пользователь участником канала"""
+    status = await get_user_channel_status(client, channel_id, user_id)
+    return status is not None and status not in ['left', 'kicked']
 
 def read_users_from_csv(filename: str) -> list[dict]:
     """Читает пользователей из CSV файла с разделителем ;"""
@@ -102,13 +109,13 @@ async def main():
         logger.error("Не задан COMPANY_CHANNEL_ID")
         return
     logger.info(f"COMPANY_CHANNEL_ID: {COMPANY_CHANNEL_ID}, API_TOKEN: {API_TOKEN}")
-    # Инициализируем бота
-    bot = Bot(token=API_TOKEN)
+    # Инициализируем клиент Bot API (лимиты запросов и повторы после 429 — внутри клиента)
+    client = TelegramClient()
     
     try:
         # Проверяем права бота в канале
         logger.info("Проверка прав бота в канале...")
-        if not await check_bot_permissions(bot, COMPANY_CHANNEL_ID):
+        if not await check_bot_permissions(client, COMPANY_CHANNEL_ID):
             logger.error("Недостаточно прав для работы с каналом. Завершение работы.")
             return
         
@@ -123,27 +130,38 @@ async def main():
         
         # Получаем общее количество участников канала для справки
         try:
-            member_count = await bot.get_chat_member_count(COMPANY_CHANNEL_ID)
+            member_count = await client.get_chat_member_count(COMPANY_CHANNEL_ID)
             logger.info(f"Общее количество участников канала: {member_count}")
         except TelegramAPIError as e:
             logger.warning(f"Не удалось получить количество участников: {e}")
         
-        # Проверяем каждого пользователя
+        # Проверяем каждого пользователя: сначала по индексу ChatMembership,
+        # живой запрос — только если записи нет или она устарела
         processed_count = 0
-        for user in users:
-            user_id = int(user['UserID'])
-            
-            # Проверяем наличие в канале
-            in_channel = await check_user_in_channel(bot, COMPANY_CHANNEL_ID, user_id)
-            user['in channel'] = str(in_channel)
-            
-            processed_count += 1
-            
-            if processed_count % 10 == 0:
-                logger.info(f"Обработано {processed_count} пользователей...")
+        async with get_db() as db:
+            index = MembershipIndex(db)
+            channel_id = int(COMPANY_CHANNEL_ID)
+            for user in users:
+                user_id = int(user['UserID'])
+                
+                status = await index.fresh_status(channel_id, user_id)
+                index.count(status)
+                if status is None:
+                    status = await get_user_channel_status(client, COMPANY_CHANNEL_ID, user_id)
+                    if status is not None:
+                        index.record(channel_id, user_id, status)
+                
+                in_channel = status is not None and status not in ['left', 'kicked']
+                user['in channel'] = str(in_channel)
+                
+                processed_count += 1
+                
+                if processed_count % 10 == 0:
+                    logger.info(f"Обработано {processed_count} пользователей...")
             
-            # Небольшая задержка чтобы не превысить лимиты API
-            await asyncio.sleep(0.1)
+            await index.flush()
+            await db.commit()
+            index.log_stats("check_channel_users")
         
         # Записываем результат обратно в тот же файл
         write_users_to_csv(users, users_file)
@@ -161,8 +179,9 @@ async def main():
         logger.error(f"Ошибка при выполнении: {e}")
     finally:
         # Закрываем сессию бота
-        await bot.session.close()
+        await client.close()
+        client.log_stats("check_channel_users")
         logger.info("Сессия бота закрыта")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(run_job(main))
\ No newline at end of file
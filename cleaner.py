@@ -6,17 +6,23 @@ cleaner.py
 Изменения:
  - В начале проверяем ряд условий (check_if_need_to_skip).
  - Если что-то не так, записываем в SyncHistory причину skip и выходим.
- - Иначе чистим тех, у кого Approve=FALSE, Banned=FALSE.
- - Пишем запись в SyncHistory.
+ - Иначе чистим тех, у кого Approve=FALSE, Banned=FALSE: пользователей из очереди PendingBans
+   (её заполняют import.py и проверка исключений), раз в CLEANER_FULL_SCAN_DAYS дней — всех.
+ - Сначала строится план (пары группа–пользователь с действием ban/check/skip по индексу
+   ChatMembership), затем пул обработчиков его выполняет: skip закрываются в SQL, ban банят без проверки,
+   check проверяют членство. В MAINTENANCE_MODE=1 строится только план.
+ - План и прогресс прогона хранятся в CleanerRuns/CleanerTasks: после падения
+   или перезапуска контейнера прогон продолжается с последнего checkpoint.
+ - Пишем запись в SyncHistory за весь прогон (счётчики) и поимённые действия в SyncAction.
 """
+import os
 import asyncio
 import aiosqlite
-from aiogram import Bot
 from dotenv import load_dotenv
 
 load_dotenv()
-from config import logger, API_TOKEN, DB_PATH, EXCLUDED_EMAILS, MAINTENANCE_MODE
-from database import get_emails_by_user_ids, get_group_titles_by_chat_ids, get_user_email 
+from config import logger, MAINTENANCE_MODE, LOG_DIR
+from database import get_db, get_group_titles_by_chat_ids, count_users, temp_id_table, run_job, EXCLUDED_SQL
 
 # Импортируем из need_clean.py
 from utils.need_clean import (
@@ -24,27 +30,33 @@ from utils.need_clean import (
     write_skip_history,
     get_eligible_groups,
 )
+from utils.ban_engine import BanEngine
+from utils.tg_client import TelegramClient
+from utils.membership import MembershipIndex
+from utils.pending_bans import prune_pending_bans, PENDING_USERS_SQL
+from utils.cleaner_runs import (
+    PHASE_REGULAR,
+    PHASE_NEW_GROUPS,
+    ACTION_BAN,
+    ACTION_CHECK,
+    ACTION_SKIP,
+    RunCheckpoint,
+    find_resumable_run,
+    needs_full_scan,
+    create_run,
+    skip_no_longer_eligible,
+    complete_skipped_tasks,
+    iter_pending_users,
+    get_pending_counts,
+    get_phase_chats,
+    get_run_new_groups,
+    get_run_summary,
+    get_plan_summary,
+    write_plan_file,
+    finish_run,
+)
 
-async def check_user_membership(bot: Bot, chat_id: int, user_id: int) -> bool:
-    """
-    Проверяет, является ли пользователь членом группы.
-    Возвращает True, если пользователь в группе, False в противном случае.
-    """
-    try:
-        member = await bot.get_chat_member(chat_id, user_id)
-        # Проверяем статус: member, administrator, creator - пользователь в группе
-        # left, kicked - пользователь не в группе
-        return member.status in ['member', 'administrator', 'creator']
-    except Exception as e:
-        # Если не удалось получить информацию, считаем что пользователя нет в группе
-        logger.debug(f"Не удалось проверить членство user_id={user_id} в chat_id={chat_id}: {e}")
-        return False
-
-import asyncio
-import aiosqlite
-from pathlib import Path
-from config import logger, DB_PATH
-from utils.file_ops import parse_csv_users  # Функция для чтения user_id из CSV-файла
+from utils.snapshots import read_import_ids  # user_id импорта из снимка (или из архивного CSV)
 
 async def check_import_users_in_db(db: aiosqlite.Connection):
     """
@@ -57,39 +69,39 @@ async def check_import_users_in_db(db: aiosqlite.Connection):
         FROM SyncHistory
         WHERE SyncType='import'
         AND Comment LIKE 'success%'
-        AND SyncDate >= DATETIME('now', 'localtime', '-12 hours')
+        AND SyncDate >= DATETIME('now', 'localtime', '-24 hours')
         ORDER BY SyncDate DESC
         LIMIT 1
     """)
     row = await cursor.fetchone()
     if not row:
-        logger.warning("Нет записей об успешном импорте за 12 часов.")
-        await write_skip_history(db, "Нет записей об успешном импорте за 12 часов.")
+        # import_watcher.py может обработать файл в любое время дня, поэтому окно — сутки
+        logger.warning("Нет записей об успешном импорте за 24 часа.")
+        await write_skip_history(db, "Нет записей об успешном импорте за 24 часа.")
         return False  # Если импорта не было, продолжаем работу
 
     import_filename = row[0]
-    archived_path = Path("./import/archived") / import_filename
 
-    if not archived_path.is_file():
-        logger.error(f"Файл {archived_path} не найден в архиве.")
-        await write_skip_history(db, f"Файл {archived_path} не найден в архиве.")
+    # 2. Читаем user_id импорта: из снимка ./import/snapshots, без него — из архивного CSV
+    import_user_ids = read_import_ids(import_filename)
+    if import_user_ids is None:
+        logger.error(f"Ни снимка, ни файла {import_filename} в архиве не найдено.")
+        await write_skip_history(db, f"Ни снимка, ни файла {import_filename} в архиве не найдено.")
         return False
-    
-    # 2. Читаем user_id из файла импорта
-    # Превращаем «./import/archived/…» в путь относительно ./import:
-    archived_rel = archived_path.relative_to("./import")
-    import_user_ids = set(parse_csv_users(str(archived_rel)))
     if not import_user_ids:
         logger.warning("Не удалось прочитать user_id из файла импорта.")
         await write_skip_history(db, "Не удалось прочитать user_id из файла импорта.")
         return False
 
-    # 3. Получаем user_id из таблицы Users
-    cursor = await db.execute("SELECT UserID FROM Users")
-    db_user_ids = set(row[0] for row in await cursor.fetchall())
-
-    # 4. Проверяем, все ли user_id из импорта есть в базе
-    missing_ids = import_user_ids - db_user_ids
+    # 3-4. Проверяем, все ли user_id из импорта есть в таблице Users
+    async with temp_id_table(db, import_user_ids) as import_table:
+        cursor = await db.execute(f"""
+            SELECT t.ID
+              FROM {import_table} t
+              LEFT JOIN Users u ON u.UserID = t.ID
+             WHERE u.UserID IS NULL
+        """)
+        missing_ids = {row[0] for row in await cursor.fetchall()}
     if missing_ids:
         logger.error(f"В базе отсутствуют user_id из импорта: {missing_ids}")
         await write_skip_history(db, f"В базе отсутствуют user_id из импорта: {missing_ids}")
@@ -98,264 +110,233 @@ async def check_import_users_in_db(db: aiosqlite.Connection):
         logger.info("Все user_id из импорта присутствуют в базе.")
         return True
 
-async def clean_new_groups(db: aiosqlite.Connection, bot: Bot):
+async def run_task(engine: BanEngine, chat_id: int, group_name: str, tag: str, row) -> tuple[int, bool]:
     """
-    Очищает все группы с пометкой New=TRUE от пользователей с Approve=FALSE
-    Возвращает (количество_удаленных, список_забаненных_user_id)
+    Выполняет задачу плана (UserID, Email, Action): ban — бан без проверки (по индексу пользователь в чате),
+    check — живая проверка членства, затем бан. Возвращает (user_id, удалён ли пользователь).
     """
-    # Получаем список новых групп
-    cursor = await db.execute("""
-        SELECT ChatID
-        FROM Groups
-        WHERE New=TRUE AND can_restrict_members=TRUE
-    """)
-    new_groups = [row[0] for row in await cursor.fetchall()]
-    
+    user_id, plain_email, action = row
+    if action == ACTION_BAN:
+        return user_id, await engine.ban(chat_id, user_id, plain_email or "", group_name, tag)
+    return user_id, await engine.remove(chat_id, user_id, plain_email or "", group_name, tag, known={})
+
+async def clean_new_groups(db: aiosqlite.Connection, engine: BanEngine, checkpoint: RunCheckpoint):
+    """
+    Очищает новые группы прогона от пользователей с Approve=FALSE по плану (при NEW_GROUPS_SWEEP=members
+    в плане только известные по ChatMembership участники группы, которую индекс ведёт дольше TTL).
+    Группы обрабатываются одновременно,
+    каждая своим конвейером. Уже выполненные задачи (до перезапуска) пропускаются;
+    после группы снимается пометка New.
+    """
+    run_id = checkpoint.run_id
+    new_groups = await get_run_new_groups(db, run_id)
     if not new_groups:
         logger.info("Нет новых групп для полной очистки")
-        return 0, []
+        return
 
-    # Получаем всех пользователей с Approve=FALSE
-    cursor = await db.execute("""
-        SELECT UserID
-        FROM Users
-        WHERE Approve=FALSE
-    """)
-    unapproved_users = [row[0] for row in await cursor.fetchall()]
-    
-    if not unapproved_users:
-        logger.info("Нет пользователей с Approve=FALSE для очистки новых групп")
-        return 0, []
-    
-    # Фильтруем пользователей: исключаем тех, кто в EXCLUDED_EMAILS
-    filtered_users = []
-    for user_id in unapproved_users:
-        plain_email = await get_user_email(user_id)
-        if plain_email:
-            email_lower = plain_email.strip().lower()
-            if email_lower in [ex.strip().lower() for ex in EXCLUDED_EMAILS if ex.strip()]:
-                logger.info(f"[clean_new_groups] Пользователь {user_id}:{plain_email} пропущен - в EXCLUDED_EMAILS")
-                continue
-        filtered_users.append(user_id)
-    
-    if not filtered_users:
-        logger.info("После фильтрации EXCLUDED_EMAILS не осталось пользователей для очистки новых групп")
-        return 0, []
-
-    # Получаем email пользователей и названия групп пакетно
-    user_emails = await get_emails_by_user_ids(filtered_users)
     group_titles = await get_group_titles_by_chat_ids(new_groups)
+    # Группы без невыполненных задач тоже проходят через конвейер, чтобы снять с них пометку New
+    pending = await get_pending_counts(db, run_id, PHASE_NEW_GROUPS)
+    totals = {chat_id: pending.get(chat_id, 0) for chat_id in new_groups}
+
+    async def clean_group(chat_id: int, progress):
+        group_name = progress.title
+
+        async def remove_user(row):
+            user_id, removed = await run_task(engine, chat_id, group_name, "cleaner:new_groups", row)
+            await checkpoint.add(PHASE_NEW_GROUPS, user_id, {chat_id: removed})
+            progress.add(removed)
+
+        # Потоково читаем невыполненные задачи группы и проверяем пользователей пулом группы
+        await engine.run(iter_pending_users(db, run_id, PHASE_NEW_GROUPS, chat_id), remove_user, engine.group_workers)
+
+        # Снимаем пометку New с группы в той же транзакции, что и последние результаты её задач
+        await checkpoint.finish_group(chat_id)
+        logger.info(f"Группа {chat_id}:{group_name} очищена и помечена как не новая")
+
+    await engine.run_groups(totals, group_titles, clean_group, "cleaner:new_groups")
+
+async def plan_run(db: aiosqlite.Connection, simulation: bool) -> int | None:
+    """
+    Проверки перед новым прогоном и его план. Возвращает run_id или None, если чистить не нужно
+    (причина уже записана в SyncHistory).
+    """
+    # Проверяем наличие всех user_id из импорта в базе
+    if not await check_import_users_in_db(db):
+        logger.error("Очистка прервана.")
+        return None
     
-    removed_count = 0
-    banned_users = []
-    
-    for chat_id in new_groups:
-        group_name = group_titles.get(chat_id, f"Group_{chat_id}")
-        for user_id in filtered_users:
-            try:
-                user_email = user_emails.get(user_id, "")
-                
-                # Проверяем, является ли пользователь членом группы
-                is_member = await check_user_membership(bot, chat_id, user_id)
-                
-                if not is_member:
-                    logger.debug(f"[cleaner:new_groups] user_id={user_id}:{user_email} не является членом чата={chat_id}:{group_name}, пропускаем")
-                    continue
-                
-                if MAINTENANCE_MODE == "1":
-                    # Симуляция удаления в режиме отладки
-                    logger.info(f"[cleaner:new_groups] [SIMULATION] Удалён user_id={user_id}:{user_email} из нового чата={chat_id}:{group_name}")
-                else:
-                    # Реальное удаление в рабочем режиме
-                    await bot.ban_chat_member(chat_id, user_id)
-                    logger.info(f"[cleaner:new_groups] Удалён user_id={user_id}:{user_email} из нового чата={chat_id}:{group_name}")
-                removed_count += 1
-                if user_id not in banned_users:
-                    banned_users.append(user_id)
-            except Exception as e:
-                user_email = user_emails.get(user_id, "")
-                if MAINTENANCE_MODE == "1":
-                    logger.warning(f"[cleaner:new_groups] [SIMULATION] Не удалось удалить user_id={user_id}:{user_email} из {chat_id}:{group_name}: {e}")
-                else:
-                    logger.warning(f"[cleaner:new_groups] Не удалось удалить user_id={user_id}:{user_email} из {chat_id}:{group_name}: {e}")
-
-        # Снимаем пометку New с группы
+    # Проверяем, нужно ли пропускать cleaner.py
+    skip, skip_reason = await check_if_need_to_skip(db)
+    if skip:
+        logger.info(f"SKIP cleaner: {skip_reason}")
+        await write_skip_history(db, skip_reason)
+        return None
+
+    # 1) Список групп, где бот может ограничивать
+    eligible_groups = await get_eligible_groups(db)
+    if not eligible_groups:
+        logger.info("Нет групп с необходимыми правами (can_restrict_members=TRUE). Выходим.")
+        await write_skip_history(db, "No groups with restrict_members")
+        return None
+
+    # 2) Ищем тех, кто Approve=FALSE AND Banned=FALSE: только очередь PendingBans,
+    #    а раз в CLEANER_FULL_SCAN_DAYS дней — всех (на случай пропусков очереди)
+    full_scan = await needs_full_scan(db)
+    pruned = await prune_pending_bans(db)
+    await db.commit()
+    if pruned:
+        logger.info(f"Из очереди PendingBans убрано {pruned} пользователей, которых уже не нужно удалять.")
+    candidates_sql = "Approve=FALSE AND Banned=FALSE" if full_scan else f"Approve=FALSE AND Banned=FALSE AND {PENDING_USERS_SQL}"
+    unapproved_count = await count_users(db, candidates_sql)
+    if not unapproved_count:
+        logger.info("Нет пользователей Approve=FALSE и Banned=FALSE. Выходим.")
         await db.execute("""
-            UPDATE Groups
-            SET New=FALSE
-            WHERE ChatID=?
-        """, (chat_id,))
+            INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
+            VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
+        """, ("cleaner", "-", 0, "no unapproved users"))
         await db.commit()
-        logger.info(f"Группа {chat_id}:{group_name} очищена и помечена как не новая")
+        return None
+
+    logger.info(f"Найдено {unapproved_count} пользователей для проверки и удаления из групп.")
 
-    return removed_count, banned_users
+    # 3) План прогона: пары (группа, пользователь) без тех, кто в EXCLUDED_EMAILS
+    excluded_count = await count_users(db, f"{candidates_sql} AND {EXCLUDED_SQL}")
+    if excluded_count:
+        logger.info(f"Исключено из очистки {excluded_count} пользователей из EXCLUDED_EMAILS.")
+
+    if unapproved_count == excluded_count:
+        logger.info("После фильтрации EXCLUDED_EMAILS не осталось пользователей для удаления.")
+        await db.execute("""
+            INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
+            VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
+        """, ("cleaner", "-", 0, "no users after EXCLUDED_EMAILS filter"))
+        await db.commit()
+        return None
+
+    run_id, user_count = await create_run(db, simulation, full_scan)
+    logger.info(f"Будет обработано {user_count} пользователей после фильтрации EXCLUDED_EMAILS.")
+    return run_id
+
+async def report_plan(db: aiosqlite.Connection, run_id: int) -> dict[str, dict[str, int]]:
+    """Пишет сводку плана в лог и план для просмотра в ./logs/cleaner_plan_<run_id>.csv."""
+    plan_summary = await get_plan_summary(db, run_id)
+    for phase, actions in plan_summary.items():
+        logger.info(f"[cleaner] План run_id={run_id}, фаза {phase}: " +
+                    ", ".join(f"{action}={count}" for action, count in sorted(actions.items())))
+    plan_path = os.path.join(LOG_DIR, f"cleaner_plan_{run_id}.csv")
+    rows = await write_plan_file(db, run_id, plan_path)
+    logger.info(f"[cleaner] План для просмотра ({rows} задач ban/check): {plan_path}")
+    return plan_summary
+
+async def finish_simulation(db: aiosqlite.Connection, run_id: int):
+    """Режим отладки: только сводка плана и запись в SyncHistory, без запросов к Bot API и без изменений Users/Groups."""
+    plan_summary = await report_plan(db, run_id)
+    regular, new_groups = plan_summary.get(PHASE_REGULAR, {}), plan_summary.get(PHASE_NEW_GROUPS, {})
+    planned_bans = regular.get(ACTION_BAN, 0) + new_groups.get(ACTION_BAN, 0)
+    comment = (f"[SIMULATION] plan run_id={run_id}: "
+               f"regular ban/check/skip={regular.get(ACTION_BAN, 0)}/{regular.get(ACTION_CHECK, 0)}/{regular.get(ACTION_SKIP, 0)}, "
+               f"new_groups ban/check/skip={new_groups.get(ACTION_BAN, 0)}/{new_groups.get(ACTION_CHECK, 0)}/{new_groups.get(ACTION_SKIP, 0)}")
+    await finish_run(db, run_id, planned_bans, comment)
+    logger.info(f"[cleaner] [SIMULATION] Построен только план прогона run_id={run_id}, очистка не выполнялась")
 
 async def main():
     logger.info("=== [cleaner.py] Запущен сценарий очистки ===")
-    if MAINTENANCE_MODE == "1":
-        logger.info("🔧 РЕЖИМ ОТЛАДКИ: Все операции ban_chat_member будут симулированы")
+    simulation = MAINTENANCE_MODE == "1"
+    if simulation:
+        logger.info("🔧 РЕЖИМ ОТЛАДКИ: Будет построен только план очистки, без запросов к Telegram")
     else:
         logger.info("⚡ РАБОЧИЙ РЕЖИМ: Будут выполнены реальные операции удаления")
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Проверяем наличие всех user_id из импорта в базе
-        if not await check_import_users_in_db(db):
-            logger.error("Очистка прервана.")
-            return
-        
-        # Проверяем, нужно ли пропускать cleaner.py
-        skip, skip_reason = await check_if_need_to_skip(db)
-        if skip:
-            logger.info(f"SKIP cleaner: {skip_reason}")
-            await write_skip_history(db, skip_reason)
-            return
-
-        # Если дошли сюда - значит, мы НЕ пропускаем чистку
-        bot = Bot(token=API_TOKEN)
-        regular_removed_count = 0
-        new_groups_removed_count = 0
-
-        try:
-            # 1) Список групп, где бот может ограничивать
-            eligible_groups = await get_eligible_groups(db)
-            if not eligible_groups:
-                logger.info("Нет групп с необходимыми правами (can_restrict_members=TRUE). Выходим.")
-                await write_skip_history(db, "No groups with restrict_members")
+    async with get_db() as db:
+        # Незавершённый прогон (падение или перезапуск контейнера) продолжаем с последнего checkpoint,
+        # проверки перед запуском для него уже пройдены
+        run_id = await find_resumable_run(db, simulation)
+        if run_id is not None:
+            # Прогон симуляции прерван после сохранения плана: план уже построен целиком,
+            # завершаем его так же, как новый, без запросов к Bot API
+            if simulation:
+                logger.info(f"[cleaner] [SIMULATION] Завершаем прерванный прогон run_id={run_id}")
+                await finish_simulation(db, run_id)
                 return
-
-            # 2) Ищем всех, кто Approve=FALSE AND Banned=FALSE
-            cursor = await db.execute("""
-                SELECT UserID
-                  FROM Users
-                 WHERE Approve=FALSE
-                   AND Banned=FALSE
-            """)
-            unapproved_users = [row[0] for row in await cursor.fetchall()]
-            if not unapproved_users:
-                logger.info("Нет пользователей Approve=FALSE и Banned=FALSE. Выходим.")
-                await db.execute("""
-                    INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
-                    VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
-                """, ("cleaner", "-", 0, "no unapproved users"))
-                await db.commit()
+            skipped = await skip_no_longer_eligible(db, run_id)
+            logger.info(f"[cleaner] Продолжаем прогон run_id={run_id}, снято задач неактуальных пользователей: {skipped}")
+        else:
+            run_id = await plan_run(db, simulation)
+            if run_id is None:
                 return
-
-            logger.info(f"Найдено {len(unapproved_users)} пользователей для проверки и удаления из групп.")
-
-            # Фильтруем пользователей: исключаем тех, кто в EXCLUDED_EMAILS
-            filtered_users = []
-            excluded_users = []
-            
-            for user_id in unapproved_users:
-                plain_email = await get_user_email(user_id)
-                if plain_email:
-                    email_lower = plain_email.strip().lower()
-                    if email_lower in [ex.strip().lower() for ex in EXCLUDED_EMAILS if ex.strip()]:
-                        excluded_users.append(user_id)
-                        logger.info(f"Пользователь {user_id}:{plain_email} пропущен - в EXCLUDED_EMAILS")
-                        continue
-                filtered_users.append(user_id)
-            
-            if excluded_users:
-                logger.info(f"Исключено из очистки {len(excluded_users)} пользователей из EXCLUDED_EMAILS.")
-            
-            if not filtered_users:
-                logger.info("После фильтрации EXCLUDED_EMAILS не осталось пользователей для удаления.")
-                await db.execute("""
-                    INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
-                    VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
-                """, ("cleaner", "-", 0, "no users after EXCLUDED_EMAILS filter"))
-                await db.commit()
+            # В режиме отладки строим только план: без запросов к Bot API и без изменений Users/Groups
+            if simulation:
+                await finish_simulation(db, run_id)
                 return
+            await report_plan(db, run_id)
+
+        # Задачи skip (по индексу пользователя в чате нет) закрываются одним запросом, в конвейеры
+        # попадают только ban и check
+        completed = await complete_skipped_tasks(db, run_id)
+        if completed:
+            logger.info(f"[cleaner] Задач skip отмечено выполненными без запросов к Bot API: {completed}")
 
-            logger.info(f"После фильтрации осталось {len(filtered_users)} пользователей для удаления из групп.")
+        client = TelegramClient()
+        # Членство берём из ChatMembership (обновления chat_member), Bot API — только для устаревших записей
+        engine = BanEngine(client, index=MembershipIndex(db))
+        checkpoint = RunCheckpoint(db, run_id, engine.index)
+        total_removed = 0
 
-            # Получаем email пользователей и названия групп пакетно
-            user_emails = await get_emails_by_user_ids(filtered_users)
+        try:
+            eligible_groups = await get_phase_chats(db, run_id, PHASE_REGULAR)
             group_titles = await get_group_titles_by_chat_ids(eligible_groups)
 
-            # 3) Удаляем отфильтрованных пользователей из групп
-            regular_removed_count = 0
-            regular_banned_users = []
-            
-            for user_id in filtered_users:
-                user_email = user_emails.get(user_id, "")
-                user_actually_removed_from_groups = False
-                
-                for chat_id in eligible_groups:
-                    group_name = group_titles.get(chat_id, f"Group_{chat_id}")
-                    try:
-                        # Проверяем, является ли пользователь членом группы
-                        is_member = await check_user_membership(bot, chat_id, user_id)
-                        
-                        if not is_member:
-                            logger.debug(f"[cleaner] user_id={user_id}:{user_email} не является членом чата={chat_id}:{group_name}, пропускаем")
-                            continue
-                        
-                        if MAINTENANCE_MODE == "1":
-                            # Симуляция удаления в режиме отладки
-                            logger.info(f"[cleaner] [SIMULATION] Удалён user_id={user_id}:{user_email} из чата={chat_id}:{group_name}")
-                        else:
-                            # Реальное удаление в рабочем режиме
-                            await bot.ban_chat_member(chat_id, user_id)
-                            logger.info(f"[cleaner] Удалён user_id={user_id}:{user_email} из чата={chat_id}:{group_name}")
-                        
-                        user_actually_removed_from_groups = True
-                        regular_removed_count += 1
-                        
-                    except Exception as e:
-                        if MAINTENANCE_MODE == "1":
-                            logger.warning(f"[cleaner] [SIMULATION] Не удалось удалить user_id={user_id}:{user_email} из {chat_id}:{group_name}: {e}")
-                        else:
-                            logger.warning(f"[cleaner] Не удалось удалить user_id={user_id}:{user_email} из {chat_id}:{group_name}: {e}")
-
-                # Ставим Banned=TRUE (независимо от того, был ли пользователь удален из групп)
-                await db.execute("""
-                    UPDATE Users
-                       SET Banned=TRUE
-                     WHERE UserID=?
-                """, (user_id,))
-                
-                regular_banned_users.append(user_id)
-                
-                if not user_actually_removed_from_groups:
-                    logger.info(f"[cleaner] user_id={user_id}:{user_email} не был членом ни одной из групп, помечен как Banned=TRUE")
-
-            await db.commit()
-
-            # 4) Очистка новых групп
-            new_groups_removed_count, new_groups_banned_users = await clean_new_groups(db, bot)
+            # 4) Конвейер на каждую группу: группы чистятся одновременно, каждая в пределах своего лимита
+            #    на чат и общего лимита бота. Прогресс фиксируется порциями по CLEANER_CHECKPOINT_USERS задач.
+            async def clean_group(chat_id: int, progress):
+                group_name = progress.title
+
+                async def remove_user(row):
+                    user_id, removed = await run_task(engine, chat_id, group_name, "cleaner", row)
+                    # Banned=TRUE ставится, когда пользователь обработан во всех группах
+                    # (независимо от того, был ли он удалён хоть из одной)
+                    await checkpoint.add(PHASE_REGULAR, user_id, {chat_id: removed}, ban=True)
+                    progress.add(removed)
+
+                await engine.run(iter_pending_users(db, run_id, PHASE_REGULAR, chat_id), remove_user, engine.group_workers)
+
+            await engine.run_groups(await get_pending_counts(db, run_id, PHASE_REGULAR), group_titles, clean_group, "cleaner")
+            await checkpoint.flush()
+
+            # 5) Очистка новых групп
+            await clean_new_groups(db, engine, checkpoint)
             
-            # 5) Формируем комментарий для SyncHistory
-            all_banned_users = list(set(regular_banned_users + new_groups_banned_users))
+            # 6) Итоги всего прогона (включая выполненное до перезапуска) и комментарий для SyncHistory
+            regular_removed_count, new_groups_removed_count, banned_count = await get_run_summary(db, run_id)
             total_removed = regular_removed_count + new_groups_removed_count
             
-            # Формируем комментарий с указанием режима работы
-            mode_prefix = "[SIMULATION] " if MAINTENANCE_MODE == "1" else ""
+            # Формируем комментарий с указанием режима работы: только счётчики, поимённо — в SyncAction
+            mode_prefix = "[SIMULATION] " if simulation else ""
+            comment = f"{mode_prefix}regular:{regular_removed_count}, new_groups:{new_groups_removed_count}"
+            if banned_count:
+                comment += f"; banned: {banned_count}"
             
-            if all_banned_users:
-                banned_emails = await get_emails_by_user_ids(all_banned_users)
-                banned_list = ", ".join(f"{uid}:{banned_emails.get(uid, '')}" for uid in all_banned_users)
-                comment = f"{mode_prefix}regular:{regular_removed_count}, new_groups:{new_groups_removed_count}; banned: {len(all_banned_users)} ({banned_list})"
-            else:
-                comment = f"{mode_prefix}regular:{regular_removed_count}, new_groups:{new_groups_removed_count}"
-            
-            # Пишем в SyncHistory общий результат
-            await db.execute("""
-                INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
-                VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
-            """, ("cleaner", "-", total_removed, comment))
-            await db.commit()
+            # Закрываем прогон и пишем в SyncHistory и SyncAction общий результат
+            await finish_run(db, run_id, total_removed, comment)
 
         except Exception as e:
-            logger.exception(f"Неожиданная ошибка в cleaner.py: {e}")
+            logger.exception(f"Неожиданная ошибка в cleaner.py: {e}. Прогон run_id={run_id} будет продолжен при следующем запуске.")
+            # Сохраняем результаты уже обработанных пользователей, чтобы не повторять их запросы
+            try:
+                await db.rollback()
+                await checkpoint.flush()
+            except Exception as flush_error:
+                logger.warning(f"Не удалось сохранить прогресс прогона run_id={run_id}: {flush_error}")
         finally:
-            await bot.session.close()
-            mode_text = "симулировано" if MAINTENANCE_MODE == "1" else "выполнено"
-            if 'all_banned_users' in locals() and all_banned_users:
-                logger.info(f"Сессия бота закрыта. {mode_text.capitalize()} всего {total_removed} удалений (regular:{regular_removed_count}, new_groups:{new_groups_removed_count}). Забанено пользователей: {len(all_banned_users)}")
+            await client.close()
+            client.log_stats("cleaner")
+            engine.index.log_stats("cleaner")
+            mode_text = "симулировано" if simulation else "выполнено"
+            if 'banned_count' in locals() and banned_count:
+                logger.info(f"Сессия бота закрыта. {mode_text.capitalize()} всего {total_removed} удалений (regular:{regular_removed_count}, new_groups:{new_groups_removed_count}). Забанено пользователей: {banned_count}")
             else:
-                logger.info(f"Сессия бота закрыта. {mode_text.capitalize()} всего удалений: 0")
+                logger.info(f"Сессия бота закрыта. {mode_text.capitalize()} всего удалений: {total_removed}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(run_job(main, lock="cleaner"))
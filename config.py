@@ -37,8 +37,64 @@ COMPANY_CHANNEL_ID = (os.getenv("COMPANY_CHANNEL_ID"))
 WORK_MAIL = os.getenv("WORK_MAIL")
 UNI_EMAIL = os.getenv("UNI_EMAIL")
 EXCLUDED_EMAILS = os.getenv("EXCLUDED_EMAILS", "").split(",")
+# Нормализованные исключения (strip + lower), собираются один раз на процесс
+EXCLUDED_EMAILS_NORM = frozenset(email.strip().lower() for email in EXCLUDED_EMAILS if email.strip())
 DB_PATH = os.getenv("DB_PATH")
 MAINTENANCE_MODE=os.getenv("MAINTENANCE_MODE")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))  # Тёплые соединения с SQLite на процесс
+
+# Профиль PRAGMA для всех соединений (бот и cron работают с одним файлом БД)
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # В режиме WAL NORMAL безопасен и не делает fsync на каждый commit
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "10000"))  # Сколько ждать снятия блокировки, мс
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))  # Кэш страниц на соединение, КБ
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))  # Размер memory-map, байт
+DB_JOURNAL_SIZE_LIMIT = int(os.getenv("DB_JOURNAL_SIZE_LIMIT", str(64 * 1024 * 1024)))  # До какого размера обрезать WAL, байт
+DB_CHECKPOINT_INTERVAL = int(os.getenv("DB_CHECKPOINT_INTERVAL", "300"))  # Период checkpoint WAL в боте, сек
+
+DB_CHUNK_SIZE = int(os.getenv("DB_CHUNK_SIZE", "1000"))  # Размер порции строк в пакетных скриптах
+
+# Групповая запись из хэндлеров бота (write-behind): одна транзакция на окно или на порцию строк
+DB_WRITE_BATCH_MS = int(os.getenv("DB_WRITE_BATCH_MS", "10"))  # Сколько копить записи после первой, мс
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "500"))  # Максимум записей в одной транзакции
+
+# Telegram Bot API: адрес сервера (пусто — api.telegram.org) и лимиты запросов пакетных скриптов
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "")  # Например, http://localhost:8081 (локальный Bot API или fake-сервер)
+TG_GLOBAL_RPS = float(os.getenv("TG_GLOBAL_RPS", "25"))  # Запросов в секунду на бота
+TG_CHAT_RPS = float(os.getenv("TG_CHAT_RPS", "5"))  # Запросов в секунду на один чат
+TG_MIN_RPS = float(os.getenv("TG_MIN_RPS", "1"))  # Нижняя граница общего лимита после 429
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "5"))  # Повторов запроса после 429 или временной ошибки
+TG_BACKOFF_BASE = float(os.getenv("TG_BACKOFF_BASE", "0.5"))  # Первая задержка повтора после временной ошибки, сек
+TG_BACKOFF_MAX = float(os.getenv("TG_BACKOFF_MAX", "30"))  # Максимальная задержка повтора, сек
+CLEANER_GROUP_WORKERS = int(os.getenv("CLEANER_GROUP_WORKERS", "4"))  # Параллельных обработчиков на одну группу в cleaner.py
+CLEANER_CHECKPOINT_USERS = int(os.getenv("CLEANER_CHECKPOINT_USERS", "50"))  # Задач (пользователь в группе) между commit прогресса cleaner.py
+CLEANER_RESUME_HOURS = int(os.getenv("CLEANER_RESUME_HOURS", "30"))  # Сколько часов незавершённый прогон cleaner.py можно продолжить (больше суток: его подхватит следующий запуск по cron)
+CLEANER_FULL_SCAN_DAYS = int(os.getenv("CLEANER_FULL_SCAN_DAYS", "7"))  # Раз в сколько дней cleaner.py сверяет всех Approve=FALSE, а не только очередь PendingBans (0 — каждый прогон)
+NEW_GROUPS_SWEEP = os.getenv("NEW_GROUPS_SWEEP", "members")  # members — известные участники новой группы (если индекс ведёт её дольше MEMBERSHIP_TTL_HOURS, иначе как all), all — все Approve=FALSE
+MEMBERSHIP_TTL_HOURS = int(os.getenv("MEMBERSHIP_TTL_HOURS", "168"))  # Через сколько часов запись ChatMembership требует живой проверки
+
+# Импорт списка сотрудников: обычно применяется только дельта к предыдущему снимку
+IMPORT_FULL_RECONCILE_DAYS = int(os.getenv("IMPORT_FULL_RECONCILE_DAYS", "7"))  # Раз в сколько дней import.py сверяет всех пользователей со списком целиком (0 — каждый импорт)
+
+# Выгрузка для компании
+EXPORT_GZIP = os.getenv("EXPORT_GZIP", "0") == "1"  # Сжимать файл export.py в .csv.gz
+IMPORT_WATCH_INTERVAL = float(os.getenv("IMPORT_WATCH_INTERVAL", "30"))  # Период опроса ./import в import_watcher.py, сек
+IMPORT_SETTLE_SECONDS = float(os.getenv("IMPORT_SETTLE_SECONDS", "10"))  # Сколько размер и mtime файла не должны меняться перед импортом, сек
+
+# Взаимоисключение пакетных заданий (import.py, cleaner.py, import_watcher.py)
+JOB_LOCK_FILE = os.getenv("JOB_LOCK_FILE", os.path.join(os.path.dirname(DB_PATH or "") or ".", "batch_jobs.lock"))  # Файл flock, общий для контейнеров с томом базы
+JOB_LOCK_TIMEOUT = float(os.getenv("JOB_LOCK_TIMEOUT", "3600"))  # Сколько ждать завершения другого задания, сек
+
+# Статистика SQL-запросов: сводка в конце каждого cron-скрипта и при остановке бота
+SQL_STATS = os.getenv("SQL_STATS", "1") == "1"  # Оборачивать соединения в InstrumentedConnection
+SQL_SLOW_QUERY_MS = int(os.getenv("SQL_SLOW_QUERY_MS", "500"))  # Порог лога медленных запросов, мс (0 — выключен)
+SQL_STATS_TOP = int(os.getenv("SQL_STATS_TOP", "15"))  # Сколько отпечатков выводить в сводке
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+
+# Кэш статусов пользователей в боте (/start, /check, «Перейти в канал»)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))  # Максимум записей
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))  # Время жизни записи, сек
 
 # Проверка наличия обязательных переменных
 required_env_vars = ["API_TOKEN", "WORK_MAIL", "UNI_EMAIL", "COMPANY_CHANNEL_ID", "DB_PATH", "MAINTENANCE_MODE"]
@@ -1,12 +1,357 @@
 # database.py
+import asyncio
 import aiosqlite
+from contextlib import asynccontextmanager
 from config import logger
 from utils.mask import mask_email
+from utils.migrations import apply_migrations
+from utils.user_cache import UserStatus, user_cache, publish_invalidation
+from utils.sql_stats import sql_stats, connect_instrumented
+from utils.job_lock import job_lock, JobLockTimeout
 import os
-from config import DB_PATH
+import sys
+from config import (
+    EXCLUDED_EMAILS_NORM, DB_PATH, DB_POOL_SIZE, DB_SYNCHRONOUS, DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE, DB_JOURNAL_SIZE_LIMIT, DB_CHECKPOINT_INTERVAL, DB_CHUNK_SIZE,
+    DB_WRITE_BATCH_MS, DB_WRITE_BATCH_SIZE, SQL_STATS, SQL_STATS_TOP
+)
+
+# Пул «тёплых» соединений процесса. Поднимается в initialize_db(),
+# закрывается в close_db(). Пока пул не поднят, get_db() открывает разовое соединение.
+_pool: asyncio.Queue | None = None
+
+# Очередь групповой записи бота (см. queue_write). Пока writer не запущен, запись идёт напрямую.
+_write_queue: asyncio.Queue | None = None
+_writer_task: asyncio.Task | None = None
+# UserID -> ещё не закоммиченные записи этого пользователя (для read-your-writes)
+_pending_writes: dict[int, set[asyncio.Future]] = {}
+_write_stats = {"rows": 0, "commits": 0, "errors": 0}
+
+# Применяются к каждому соединению, поэтому одинаковы в контейнерах bot и cron.
+# journal_mode=WAL хранится в самом файле БД и включается в initialize_db().
+_PRAGMAS = (
+    f"PRAGMA synchronous={DB_SYNCHRONOUS}",
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size={DB_MMAP_SIZE}",
+    f"PRAGMA journal_size_limit={DB_JOURNAL_SIZE_LIMIT}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Условия для WHERE по Users: email входит / не входит в ExcludedEmails.
+# NOT EXISTS, а не NOT IN, чтобы пользователи без email (EmailNorm IS NULL) не выпадали.
+EXCLUDED_SQL = "EmailNorm IN (SELECT EmailNorm FROM ExcludedEmails)"
+NOT_EXCLUDED_SQL = "NOT EXISTS (SELECT 1 FROM ExcludedEmails e WHERE e.EmailNorm = Users.EmailNorm)"
+
+
+async def _connect() -> aiosqlite.Connection:
+    """Открывает новое соединение с базой и применяет профиль PRAGMA."""
+    if SQL_STATS:
+        db = await connect_instrumented(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    else:
+        db = await aiosqlite.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    for pragma in _PRAGMAS:
+        await db.execute(pragma)
+    return db
+
+
+async def open_pool(size: int = DB_POOL_SIZE):
+    """
+    Создаёт пул из size соединений. Повторный вызов ничего не делает.
+    """
+    global _pool
+    if _pool is not None:
+        return
+    pool = asyncio.Queue()
+    for _ in range(max(size, 1)):
+        pool.put_nowait(await _connect())
+    _pool = pool
+    logger.info(f"Пул соединений с БД открыт: {pool.qsize()} соединений.")
+
+
+async def close_db():
+    """
+    Закрывает все соединения пула. Вызывается при остановке бота и в конце cron-скриптов.
+    """
+    global _pool
+    await stop_write_behind()
+    if _pool is None:
+        return
+    pool, _pool = _pool, None
+    checkpointed = False
+    while not pool.empty():
+        db = pool.get_nowait()
+        if not checkpointed:
+            # После пакетных записей cron-скриптов сбрасываем WAL в основной файл
+            checkpointed = True
+            try:
+                await checkpoint_wal(db)
+            except Exception as e:
+                logger.warning(f"Ошибка WAL checkpoint при закрытии пула: {e}")
+        await db.close()
+    logger.info("Пул соединений с БД закрыт.")
+
+
+@asynccontextmanager
+async def get_db():
+    """
+    Выдаёт соединение из пула на время блока `async with get_db() as db:`.
+    Если свободных соединений нет, открывает временное (overflow) и закрывает его после блока.
+    Незакоммиченная транзакция откатывается, чтобы следующий владелец получил чистое соединение.
+    """
+    if _pool is None:
+        db = await _connect()
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+
+    pool = _pool
+    try:
+        db = pool.get_nowait()
+        overflow = False
+    except asyncio.QueueEmpty:
+        db = await _connect()
+        overflow = True
+
+    try:
+        yield db
+    finally:
+        try:
+            if db.in_transaction:
+                await db.rollback()
+            db.row_factory = None
+        finally:
+            if overflow or pool is not _pool:
+                await db.close()
+            else:
+                pool.put_nowait(db)
+
+
+async def checkpoint_wal(db: aiosqlite.Connection, mode: str = "TRUNCATE"):
+    """
+    Переносит страницы из WAL в основной файл БД и (в режиме TRUNCATE) обрезает WAL.
+    """
+    cursor = await db.execute(f"PRAGMA wal_checkpoint({mode})")
+    busy, log_pages, checkpointed = await cursor.fetchone()
+    if busy:
+        logger.info(f"WAL checkpoint({mode}) не завершён: БД занята, перенесено {checkpointed} из {log_pages} страниц.")
+    else:
+        logger.debug(f"WAL checkpoint({mode}): перенесено {checkpointed} из {log_pages} страниц.")
+
+
+async def checkpoint_loop(interval: int = DB_CHECKPOINT_INTERVAL):
+    """
+    Фоновая задача бота: периодический checkpoint, чтобы WAL не разрастался
+    во время ночных пакетных записей cron-контейнера.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with get_db() as db:
+                await checkpoint_wal(db)
+        except Exception as e:
+            logger.warning(f"Ошибка WAL checkpoint: {e}")
+
+
+def start_write_behind():
+    """
+    Запускает фоновую групповую запись. Вызывается ботом после initialize_db().
+    Повторный вызов ничего не делает.
+    """
+    global _write_queue, _writer_task
+    if _writer_task is not None:
+        return
+    _write_queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_write_behind_loop(_write_queue))
+    logger.info(f"Групповая запись запущена: окно {DB_WRITE_BATCH_MS} мс, до {DB_WRITE_BATCH_SIZE} записей.")
+
+
+async def stop_write_behind():
+    """Дописывает всё, что осталось в очереди, и останавливает writer. Вызывается из close_db()."""
+    global _write_queue, _writer_task
+    if _writer_task is None:
+        return
+    queue, task = _write_queue, _writer_task
+    _write_queue = _writer_task = None
+    queue.put_nowait(None)
+    await task
+    logger.info(f"Групповая запись остановлена: {write_behind_stats()}")
+
+
+def write_behind_stats() -> dict:
+    return dict(_write_stats)
+
+
+async def queue_write(query: str, params=(), user_id: int | None = None):
+    """
+    Выполняет INSERT/UPDATE через общую транзакцию writer-а и ждёт её commit.
+    Конкурентные записи хэндлеров попадают в одну транзакцию (окно DB_WRITE_BATCH_MS
+    или DB_WRITE_BATCH_SIZE записей), поэтому commit делится между ними.
+    Ошибка конкретного оператора (например, UNIQUE) пробрасывается только его автору.
+    user_id нужен для read-your-writes: чтения этого пользователя дождутся commit (см. wait_user_writes).
+    """
+    if _write_queue is None:
+        async with get_db() as db:
+            await db.execute(query, params)
+            await db.commit()
+        return
+
+    future = asyncio.get_running_loop().create_future()
+    if user_id is not None:
+        pending = _pending_writes.setdefault(user_id, set())
+        pending.add(future)
+        future.add_done_callback(lambda f: _forget_pending(user_id, f))
+    _write_queue.put_nowait((query, params, future))
+    await future
+
+
+def _forget_pending(user_id: int, future: asyncio.Future):
+    pending = _pending_writes.get(user_id)
+    if pending is not None:
+        pending.discard(future)
+        if not pending:
+            del _pending_writes[user_id]
+
+
+async def wait_user_writes(user_id: int):
+    """Ждёт commit всех поставленных в очередь записей пользователя (ошибки записей не пробрасывает)."""
+    pending = _pending_writes.get(user_id)
+    if pending:
+        await asyncio.wait(list(pending))
+
+
+async def _write_behind_loop(queue: asyncio.Queue):
+    """
+    Забирает записи из очереди порциями: первая запись открывает окно DB_WRITE_BATCH_MS,
+    порция закрывается по окончании окна или на DB_WRITE_BATCH_SIZE записях.
+    None в очереди — сигнал остановки: оставшиеся записи дописываются.
+    """
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        item = await queue.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = loop.time() + DB_WRITE_BATCH_MS / 1000
+        while len(batch) < DB_WRITE_BATCH_SIZE:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        await _apply_writes(batch)
+
+
+async def _execute_group(db: aiosqlite.Connection, query: str, items: list) -> list:
+    """
+    Выполняет записи с одинаковым запросом одним executemany.
+    Если executemany упал, повторяет их по одной внутри SAVEPOINT, чтобы ошибка
+    (например, UNIQUE) досталась только автору своей записи.
+    """
+    await db.execute("SAVEPOINT write_group")
+    try:
+        await db.executemany(query, [params for params, _ in items])
+        await db.execute("RELEASE write_group")
+        return [(future, None) for _, future in items]
+    except Exception:
+        await db.execute("ROLLBACK TO write_group")
+        await db.execute("RELEASE write_group")
+
+    results = []
+    for params, future in items:
+        try:
+            await db.execute(query, params)
+            results.append((future, None))
+        except Exception as e:
+            # Откатывается только этот оператор, транзакция порции продолжается
+            results.append((future, e))
+    return results
+
+
+async def _apply_writes(batch: list):
+    # Подряд идущие записи с одинаковым запросом (INSERT из /start, UPDATE из set_user_email)
+    # выполняются одним executemany: один переход в поток aiosqlite вместо одного на запись
+    groups = []
+    for query, params, future in batch:
+        if groups and groups[-1][0] == query:
+            groups[-1][1].append((params, future))
+        else:
+            groups.append((query, [(params, future)]))
+
+    results = []
+    try:
+        async with get_db() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            for query, items in groups:
+                results.extend(await _execute_group(db, query, items))
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Ошибка групповой записи ({len(batch)} записей): {e}")
+        _write_stats["errors"] += len(batch)
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    _write_stats["commits"] += 1
+    for future, error in results:
+        if error is None:
+            _write_stats["rows"] += 1
+        else:
+            _write_stats["errors"] += 1
+        if future.done():
+            continue
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
+async def run_job(main, lock: str | None = None):
+    """
+    Обёртка для cron-скриптов: поднимает пул и схему, выполняет main(), закрывает пул
+    и пишет в лог сводку по SQL-запросам задания.
+    lock — имя задания для общей блокировки пакетных заданий (utils.job_lock): main() выполняется,
+    только когда не работает другое такое задание; если дождаться не удалось, задание пропускается.
+    Использование: asyncio.run(run_job(main)) или asyncio.run(run_job(main, lock="cleaner"))
+    """
+    if lock is not None:
+        try:
+            async with job_lock(lock):
+                return await run_job(main)
+        except JobLockTimeout as e:
+            logger.error(f"{e}. Задание пропущено.")
+            return None
+
+    await initialize_db()
+    try:
+        return await main()
+    finally:
+        await close_db()
+        sql_stats.log_summary(os.path.basename(sys.argv[0]) or getattr(main, "__name__", "job"), SQL_STATS_TOP)
+
 
 async def initialize_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    await open_pool()
+    async with get_db() as db:
+        # WAL: читатели не блокируют писателя и наоборот (бот и cron делят один файл)
+        cursor = await db.execute("PRAGMA journal_mode=WAL")
+        (journal_mode,) = await cursor.fetchone()
+        if journal_mode.lower() != "wal":
+            logger.warning(f"Не удалось включить WAL, journal_mode={journal_mode}")
+
         # Создание таблицы Users (если её ещё нет)
         await db.execute('''
             CREATE TABLE IF NOT EXISTS Users (
@@ -52,19 +397,156 @@ async def initialize_db():
         ''')    
 
         await db.commit()
-    logger.info("База данных инициализирована.")
+
+        schema_version = await apply_migrations(db)
+        await sync_excluded_emails(db)
+    logger.info(f"База данных инициализирована, версия схемы: {schema_version}.")
+
+async def sync_excluded_emails(db: aiosqlite.Connection):
+    """
+    Приводит таблицу ExcludedEmails к EXCLUDED_EMAILS_NORM из окружения.
+    Пишет только при расхождении, поэтому обычный старт процесса обходится одним SELECT.
+    """
+    cursor = await db.execute("SELECT EmailNorm FROM ExcludedEmails")
+    current = {row[0] for row in await cursor.fetchall()}
+    if current == EXCLUDED_EMAILS_NORM:
+        return
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        await db.execute("DELETE FROM ExcludedEmails")
+        await db.executemany(
+            "INSERT INTO ExcludedEmails (EmailNorm) VALUES (?)",
+            ((email,) for email in EXCLUDED_EMAILS_NORM)
+        )
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    logger.info(f"Таблица ExcludedEmails обновлена: {len(EXCLUDED_EMAILS_NORM)} адресов.")
+
+async def iter_rows(db: aiosqlite.Connection, query: str, params=(), chunk_size: int = DB_CHUNK_SIZE):
+    """
+    Выполняет query и отдаёт строки по одной, читая их из курсора порциями по chunk_size.
+    Память не зависит от размера выборки. Пока итерация не закончена, не изменяйте
+    через это же соединение таблицы, которые читает query (для этого есть iter_users).
+    """
+    cursor = await db.execute(query, params)
+    try:
+        while True:
+            rows = await cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        await cursor.close()
+
+
+async def iter_users(db: aiosqlite.Connection, columns: str = "UserID", where: str = "1",
+                     params=(), chunk_size: int = DB_CHUNK_SIZE):
+    """
+    Отдаёт строки Users, подходящие под where, порциями по chunk_size в порядке UserID.
+    Первая колонка в columns обязана быть UserID: каждая порция — отдельный запрос
+    «UserID > последний», поэтому между порциями можно писать в Users через это же соединение.
+    """
+    last_user_id = None
+    while True:
+        if last_user_id is None:
+            query = f"SELECT {columns} FROM Users WHERE ({where}) ORDER BY UserID LIMIT ?"
+            query_params = (*params, chunk_size)
+        else:
+            query = f"SELECT {columns} FROM Users WHERE ({where}) AND UserID > ? ORDER BY UserID LIMIT ?"
+            query_params = (*params, last_user_id, chunk_size)
+        cursor = await db.execute(query, query_params)
+        rows = await cursor.fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last_user_id = rows[-1][0]
+
+
+@asynccontextmanager
+async def temp_id_table(db: aiosqlite.Connection, ids, name: str = "tmp_ids"):
+    """
+    Загружает набор id во временную таблицу temp.<name>(ID INTEGER PRIMARY KEY)
+    одним executemany и удаляет её после блока:
+
+        async with temp_id_table(db, user_ids) as ids_table:
+            await db.execute(f"... WHERE UserID IN (SELECT ID FROM {ids_table})")
+
+    В отличие от IN (?, ?, ...) работает с набором любого размера и не упирается
+    в лимит переменных SQLite. Таблица видна только этому соединению.
+    """
+    table = f"temp.{name}"
+    await db.execute(f"DROP TABLE IF EXISTS {table}")
+    await db.execute(f"CREATE TEMP TABLE {name} (ID INTEGER PRIMARY KEY)")
+    try:
+        await db.executemany(f"INSERT OR IGNORE INTO {table} (ID) VALUES (?)", ((i,) for i in ids))
+        yield table
+    finally:
+        await db.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+async def count_users(db: aiosqlite.Connection, where: str = "1", params=()) -> int:
+    """Возвращает количество строк Users, подходящих под where."""
+    cursor = await db.execute(f"SELECT COUNT(*) FROM Users WHERE ({where})", params)
+    (count,) = await cursor.fetchone()
+    return count
+
+
+async def get_user_status(user_id: int) -> UserStatus | None:
+    """
+    Возвращает Approve, WasApproved, InviteCount и Email пользователя.
+    Сначала смотрит в кэш процесса, при промахе читает БД и кладёт результат в кэш.
+    Возвращает None, если пользователя нет в базе (отсутствие не кэшируется).
+    """
+    status = user_cache.get(user_id)
+    if status is not None:
+        return status
+
+    await wait_user_writes(user_id)
+    generation = user_cache.generation
+    async with get_db() as db:
+        cursor = await db.execute("""
+            SELECT Approve, WasApproved, InviteCount, Email
+              FROM Users
+             WHERE UserID=?
+        """, (user_id,))
+        row = await cursor.fetchone()
+    if not row:
+        return None
+
+    approve, was_approved, invite_count, email = row
+    status = UserStatus(bool(approve), bool(was_approved), invite_count or 0, email or "")
+    user_cache.put(user_id, status, generation)
+    return status
+
+
+async def invalidate_user_status(user_ids=None, publish: bool = False):
+    """
+    Сбрасывает кэш статусов для user_ids (или целиком, если None).
+    publish=True дополнительно рассылает инвалидацию другим процессам через Redis —
+    так пакетные скрипты cron-контейнера сообщают об изменениях боту.
+    """
+    if user_ids is not None:
+        user_ids = list(user_ids)
+    user_cache.invalidate(user_ids)
+    if publish:
+        await publish_invalidation(user_ids)
+
 
 async def set_user_email(user_id: int, plain_email: str):
     """
     Записывает plain_email в поле Email для данного user_id.
     """
     final_email = plain_email.strip().lower()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE Users SET Approve = TRUE, WasApproved = TRUE, Email=? WHERE UserID=?",
-            (final_email, user_id)
-        )
-        await db.commit()
+    await queue_write(
+        "UPDATE Users SET Approve = TRUE, WasApproved = TRUE, Email=?, EmailNorm=? WHERE UserID=?",
+        (final_email, final_email or None, user_id),
+        user_id=user_id
+    )
+    await invalidate_user_status([user_id])
     logger.info(f"set_user_email: user_id={user_id}, email={final_email}")
 
 
@@ -73,7 +555,8 @@ async def get_user_email(user_id: int) -> str:
     Читает поле Email и возвращает его значение.
     Возвращает email (или пустую строку).
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    await wait_user_writes(user_id)
+    async with get_db() as db:
         cursor = await db.execute("SELECT Email FROM Users WHERE UserID=?", (user_id,))
         row = await cursor.fetchone()
         if row and row[0]:
@@ -86,11 +569,14 @@ async def get_emails_by_user_ids(user_ids: list[int]) -> dict[int, str]:
     """
     if not user_ids:
         return {}
-    placeholders = ",".join(["?"] * len(user_ids))
-    query = f"SELECT UserID, Email FROM Users WHERE UserID IN ({placeholders})"
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(query, tuple(user_ids))
-        rows = await cursor.fetchall()
+    async with get_db() as db:
+        async with temp_id_table(db, user_ids) as ids_table:
+            cursor = await db.execute(f"""
+                SELECT u.UserID, u.Email
+                  FROM {ids_table} t
+                  JOIN Users u ON u.UserID = t.ID
+            """)
+            rows = await cursor.fetchall()
     return {user_id: email for user_id, email in rows}
 
 async def get_group_titles_by_chat_ids(chat_ids: list[int]) -> dict[int, str]:
@@ -101,7 +587,7 @@ async def get_group_titles_by_chat_ids(chat_ids: list[int]) -> dict[int, str]:
         return {}
     placeholders = ",".join(["?"] * len(chat_ids))
     query = f"SELECT ChatID, Title FROM Groups WHERE ChatID IN ({placeholders})"
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_db() as db:
         cursor = await db.execute(query, tuple(chat_ids))
         rows = await cursor.fetchall()
     return {chat_id: title or f"Group_{chat_id}" for chat_id, title in rows}
\ No newline at end of file
@@ -1,38 +1,37 @@
 import asyncio
-import aiosqlite
 from aiogram import Bot
-from config import logger, DB_PATH, EXCLUDED_EMAILS, WORK_MAIL, COMPANY_CHANNEL_ID
+from config import logger, EXCLUDED_EMAILS_NORM, WORK_MAIL, COMPANY_CHANNEL_ID
+from database import get_db, invalidate_user_status, iter_users, count_users, EXCLUDED_SQL, NOT_EXCLUDED_SQL
 from utils.unban import unban_user
+from utils.tg_client import TelegramClient
+from utils.sync_log import (
+    insert_sync_history,
+    insert_sync_actions,
+    ACTION_RESTORED,
+    ACTION_UNBANNED,
+    ACTION_APPROVED,
+    ACTION_UNAPPROVED,
+)
+from utils.pending_bans import enqueue_pending_bans, SOURCE_NON_CORPORATE
 from combine.reply import get_restoration_invite_link
 from combine.answer import status_restored
 
-async def process_excluded_users(db, excluded_emails_lower, bot):
-    """Обрабатывает пользователей из EXCLUDED_EMAILS согласно их статусам."""
-    restored_count = 0
-    unbanned_count = 0
-    approved_count = 0
+async def process_excluded_users(db, bot):
+    """
+    Обрабатывает пользователей из EXCLUDED_EMAILS согласно их статусам.
+    Возвращает списки user_id: (восстановленные, разбаненные, активированные).
+    """
     restored_users = []
+    unbanned_users = []
+    approved_users = []
     
-    # Получаем всех пользователей с их email и статусами одним запросом
-    cursor = await db.execute("""
-        SELECT UserID, Email, Approve, Banned, WasApproved FROM Users 
-        WHERE Email IS NOT NULL AND Email != ''
-    """)
-    all_users = await cursor.fetchall()
+    # Потоково читаем только пользователей, чей email есть в ExcludedEmails (индекс по EmailNorm)
+    users_count = await count_users(db, EXCLUDED_SQL)
+    logger.info(f"Проверяем {users_count} пользователей из исключений...")
     
-    logger.info(f"Проверяем {len(all_users)} пользователей для исключений...")
-    
-    for user_id, email, approve, banned, was_approved in all_users:
-        logger.info(f"Обрабатываем пользователя {user_id}:{email}")
-        if not email:
-            logger.info(f"Пропускаем {user_id} - нет email")
-            continue
-            
-        email_lower = email.strip().lower()
-        if email_lower not in excluded_emails_lower:
-            logger.info(f"Пропускаем {user_id} - email не в исключениях")
-            continue
-        
+    async for user_id, email, approve, banned, was_approved in iter_users(
+        db, "UserID, Email, Approve, Banned, WasApproved", EXCLUDED_SQL
+    ):
         logger.info(f"Пользователь {user_id} найден в исключениях, статус: approve={approve}, banned={banned}, was_approved={was_approved}")
         
         # Логика обработки по статусам:
@@ -44,8 +43,10 @@ async def process_excluded_users(db, excluded_emails_lower, bot):
             # Approve=TRUE, Banned=TRUE - профилактический unban
             await unban_user(user_id, bot)
             await db.execute("UPDATE Users SET Banned = FALSE WHERE UserID = ?", (user_id,))
+            # Коммитим сразу: unban_user следующего пользователя пишет через другое соединение
+            await db.commit()
             logger.info(f"Профилактический unban для {user_id}:{email}")
-            unbanned_count += 1
+            unbanned_users.append(user_id)
             
         elif not approve and banned and was_approved:
             # Approve=FALSE, Banned=TRUE, WasApproved=TRUE - полное восстановление
@@ -53,6 +54,7 @@ async def process_excluded_users(db, excluded_emails_lower, bot):
             await db.execute("""
                 UPDATE Users SET Approve = TRUE, Banned = FALSE WHERE UserID = ?
             """, (user_id,))
+            await db.commit()
             
             # Отправляем уведомление о восстановлении
             logger.info(f"Начинаем отправку уведомления для {user_id}:{email}")
@@ -63,9 +65,9 @@ async def process_excluded_users(db, excluded_emails_lower, bot):
                 
                 if invite_markup:
                     logger.info(f"Отправляем сообщение пользователю {user_id}")
-                    await bot.send_message(
-                        chat_id=user_id,
-                        text=status_restored,
+                    await TelegramClient.for_bot(bot).send_message(
+                        user_id,
+                        status_restored,
                         parse_mode="Markdown",
                         reply_markup=invite_markup
                     )
@@ -76,7 +78,6 @@ async def process_excluded_users(db, excluded_emails_lower, bot):
                 logger.error(f"Ошибка при отправке уведомления {user_id}:{email}: {e}")
             
             restored_users.append(user_id)
-            restored_count += 1
             
         elif not approve and banned and not was_approved:
             # Approve=FALSE, Banned=TRUE, WasApproved=FALSE - только unban
@@ -84,74 +85,65 @@ async def process_excluded_users(db, excluded_emails_lower, bot):
             await db.execute("""
                 UPDATE Users SET Approve = TRUE, Banned = FALSE WHERE UserID = ?
             """, (user_id,))
+            await db.commit()
             logger.info(f"Unban и активация для {user_id}:{email}")
-            unbanned_count += 1
+            unbanned_users.append(user_id)
             
         elif not approve and not banned:
             # Approve=FALSE, Banned=FALSE - установка Approve=TRUE
             await unban_user(user_id, bot)
             await db.execute("UPDATE Users SET Approve = TRUE WHERE UserID = ?", (user_id,))
+            await db.commit()
             logger.info(f"Активация для {user_id}:{email}")
-            approved_count += 1
+            approved_users.append(user_id)
     
-    return restored_count, unbanned_count, approved_count, restored_users
+    return restored_users, unbanned_users, approved_users
 
 async def process_non_corporate_emails(db):
-    """Снимает доступ у пользователей с некорпоративными email."""
-    excluded_emails_lower = [email.strip().lower() for email in EXCLUDED_EMAILS if email.strip()]
-    unapproved_count = 0
+    """Снимает доступ у пользователей с некорпоративными email. Возвращает их user_id."""
+    unapproved_users = []
+    where = f"Approve=TRUE AND EmailNorm IS NOT NULL AND {NOT_EXCLUDED_SQL}"
     
-    # Получаем всех пользователей с их email и статусом одним запросом
-    cursor = await db.execute("SELECT UserID, Email, Approve FROM Users WHERE Email IS NOT NULL AND Email != ''")
-    all_users = await cursor.fetchall()
+    # Потоково читаем верифицированных пользователей с email не из исключений порциями
+    users_count = await count_users(db, where)
+    logger.info(f"Проверяем {users_count} пользователей с email...")
     
-    logger.info(f"Проверяем {len(all_users)} пользователей с email...")
-    
-    for user_id, email, approve in all_users:
-        if not email:
-            continue
-            
-        email_lower = email.strip().lower()
-        
-        # Проверяем только некорпоративные email, не входящие в исключения
-        if (not email_lower.endswith(f"@{WORK_MAIL.lower()}") and 
-            email_lower not in excluded_emails_lower):
-            
-            if approve == 1:  # Если был Approve=TRUE
-                await db.execute("UPDATE Users SET Approve = FALSE WHERE UserID = ?", (user_id,))
-                logger.info(f"Снят доступ у {user_id}:{email} - некорпоративный email")
-                unapproved_count += 1
-    
-    return unapproved_count
+    async for user_id, email, email_norm in iter_users(db, "UserID, Email, EmailNorm", where):
+        # Проверяем только некорпоративные email
+        if not email_norm.endswith(f"@{WORK_MAIL.lower()}"):
+            await db.execute("UPDATE Users SET Approve = FALSE WHERE UserID = ?", (user_id,))
+            logger.info(f"Снят доступ у {user_id}:{email} - некорпоративный email")
+            unapproved_users.append(user_id)
+
+    # cleaner.py удалит их из групп по очереди PendingBans
+    await enqueue_pending_bans(db, unapproved_users, SOURCE_NON_CORPORATE)
+    return unapproved_users
 
 async def check_exclusions(bot: Bot):
     logger.info("=== Начало проверки исключений при старте бота ===")
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Приводим исключения к нижнему регистру для корректного сравнения
-        excluded_emails_lower = [email.strip().lower() for email in EXCLUDED_EMAILS if email.strip()]
-        
-        if not excluded_emails_lower:
+    async with get_db() as db:
+        if not EXCLUDED_EMAILS_NORM:
             logger.info("EXCLUDED_EMAILS пуст, выполняем только проверку некорпоративных email.")
         else:
-            logger.info(f"Список исключений: {excluded_emails_lower}")
+            logger.info(f"Список исключений: {sorted(EXCLUDED_EMAILS_NORM)}")
 
         # 1. Обрабатываем исключенных пользователей
-        if excluded_emails_lower:
-            restored_count, unbanned_count, approved_count, restored_users = await process_excluded_users(
-                db, excluded_emails_lower, bot
-            )
+        if EXCLUDED_EMAILS_NORM:
+            restored_users, unbanned_users, approved_users = await process_excluded_users(db, bot)
         else:
-            restored_count = unbanned_count = approved_count = 0
-            restored_users = []
+            restored_users, unbanned_users, approved_users = [], [], []
+        restored_count, unbanned_count, approved_count = len(restored_users), len(unbanned_users), len(approved_users)
         
         # 2. Обрабатываем некорпоративные email
         logger.info("Начинаем обработку некорпоративных email...")
-        unapproved_count = await process_non_corporate_emails(db)
+        unapproved_users = await process_non_corporate_emails(db)
+        unapproved_count = len(unapproved_users)
         logger.info(f"Обработка некорпоративных email завершена. Результат: {unapproved_count}")
         
         # Фиксируем изменения в базе
         logger.info("Фиксируем изменения в базе данных...")
         await db.commit()
+        await invalidate_user_status()
         logger.info("Изменения в БД зафиксированы")
         logger.info("=== Обработка исключений полностью завершена ===")
 
@@ -172,10 +164,10 @@ async def check_exclusions(bot: Bot):
             
             comment = "; ".join(comment_parts)
             
-            await db.execute("""
-                INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
-                VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
-            """, ("exclusion_check", "-", total_processed, comment))
+            sync_id = await insert_sync_history(db, "exclusion_check", "-", total_processed, comment)
+            for action, user_ids in ((ACTION_RESTORED, restored_users), (ACTION_UNBANNED, unbanned_users),
+                                     (ACTION_APPROVED, approved_users), (ACTION_UNAPPROVED, unapproved_users)):
+                await insert_sync_actions(db, sync_id, action, user_ids)
             await db.commit()
             
             if restored_users:
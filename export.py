@@ -4,116 +4,138 @@ export.py
 Запускается раз в сутки в 08:00 (cron).
 1) Выбирает пользователей: Approve=TRUE и Synced=FALSE,
 2) Пропускает, если email в EXCLUDED_EMAILS,
-3) Выгружает (UserID;email) в ./export/export_YYYYmmDD_HHMMSS.csv,
+3) Выгружает (UserID;email) в ./export/export_YYYYmmDD_HHMM.csv (.csv.gz при EXPORT_GZIP=1),
 4) Ставит Synced=TRUE,
 5) Пишет запись в SyncHistory (или лог).
+
+Шаги 1-3 — один проход по строкам в читающей транзакции (снимок WAL, бот при этом пишет свободно).
+Файл пишется в ./export/.partial и появляется в ./export через os.replace только целиком,
+поэтому компания не может забрать недописанную выгрузку. Шаги 4-5 — короткая транзакция
+BEGIN IMMEDIATE по набору UserID, выгруженных в файл.
 """
+import io
 import os
-import asyncio
 import csv
-import aiosqlite
+import gzip
+import asyncio
 import datetime
+from array import array
 from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from database import get_user_email, get_emails_by_user_ids
-from config import EXCLUDED_EMAILS, logger, DB_PATH
+from database import get_db, iter_rows, count_users, temp_id_table, run_job, NOT_EXCLUDED_SQL
+from config import logger, EXPORT_GZIP
+from utils.file_ops import EXPORT_DIR, EXPORT_PARTIAL_DIR
+from utils.sync_log import insert_sync_history, insert_sync_actions, ACTION_EXPORTED
 
-OUTPUT_DIR = "./export"
+OUTPUT_DIR = EXPORT_DIR
+
+# Кого выгружать
+EXPORT_SQL = f"Approve=TRUE AND Synced=FALSE AND {NOT_EXCLUDED_SQL}"
 
-async def main():
-    logger.info("=== [export.py] Начинаем экспорт пользователей для компании ===")
-    logger.info(f"Current working directory: {os.getcwd()}")
-    
-    today_str = datetime.date.today().strftime("%Y%m%d")
-    # Добавляем время в формате HHMM для уникальности имени файла
-    time_str = datetime.datetime.now().strftime("%H%M")
-    out_filename = f"export_{today_str}_{time_str}.csv"
-    outpath = Path(OUTPUT_DIR) / out_filename
-    
-    logger.info(f"Attempting to create file: {outpath.absolute()}")  # Добавляем эту строку
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        # 1) Находим всех, кто Approve=TRUE, Synced=FALSE
-        #    и не входит в EXCLUDED_EMAILS
-        cursor = await db.execute("""
-            SELECT ID, UserID, Email
-              FROM Users
-             WHERE Approve=TRUE
-               AND Synced=FALSE
-        """)
-        rows = await cursor.fetchall()
-
-        if not rows:
-            logger.info("Нет пользователей для экспорта (Approve=TRUE, Synced=FALSE).")
-            # Записываем в SyncHistory даже при отсутствии пользователей
-            await db.execute("""
-                INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
-                VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
-            """, ("export", out_filename, 0, "Нет пользователей для экспорта"))
-            await db.commit()
-            return
 
-        to_update_ids = []
-        exported_count = 0
+def export_filename() -> str:
+    """Имя новой выгрузки; если файл за эту минуту ещё не забран, добавляются секунды."""
+    now = datetime.datetime.now()
+    suffix = ".csv.gz" if EXPORT_GZIP else ".csv"
+    out_filename = f"export_{now:%Y%m%d_%H%M}{suffix}"
+    if (Path(OUTPUT_DIR) / out_filename).exists():
+        out_filename = f"export_{now:%Y%m%d_%H%M%S}{suffix}"
+    return out_filename
 
-        # 2) Пишем CSV
-        with outpath.open("w", encoding="utf-8", newline="") as f:
-            writer = csv.writer(f, delimiter=";")
-            writer.writerow(["UserID", "Email"])  # заголовок
 
-            for row_id, user_id, enc_email in rows:
-                # Получаем email пользователя
-                plain_email = await get_user_email(user_id)
-                export_email = plain_email.strip().lower()
+def open_partial(raw):
+    """Текстовый поток для csv.writer поверх открытого на запись файла (с gzip при EXPORT_GZIP=1)."""
+    if EXPORT_GZIP:
+        # mtime=0 и пустое имя в заголовке gzip: одинаковые данные дают одинаковый файл
+        return io.TextIOWrapper(gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0),
+                                encoding="utf-8", newline="")
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
 
-                # Пропускаем, если email в EXCLUDED_EMAILS
-                if export_email in [ex.strip().lower() for ex in EXCLUDED_EMAILS if ex.strip()]:
-                    continue
 
-                writer.writerow([user_id, export_email])
-                to_update_ids.append(row_id)
-                exported_count += 1
+def finish_partial(raw, f: io.TextIOWrapper):
+    """Дописывает буферы (и хвост gzip) и сбрасывает файл на диск, не закрывая raw."""
+    f.flush()
+    stream = f.detach()
+    if stream is not raw:
+        # GzipFile.close() дописывает CRC и размер, но не закрывает переданный fileobj
+        stream.close()
+    raw.flush()
+    os.fsync(raw.fileno())
 
-        logger.info(f"Создан файл: {outpath}. Экспортировано {exported_count} пользователей.")
+
+async def main():
+    logger.info("=== [export.py] Начинаем экспорт пользователей для компании ===")
+    logger.info(f"Current working directory: {os.getcwd()}")
+
+    out_filename = export_filename()
+    outpath = Path(OUTPUT_DIR) / out_filename
+    os.makedirs(EXPORT_PARTIAL_DIR, exist_ok=True)
+    partial_path = Path(EXPORT_PARTIAL_DIR) / out_filename
+
+    logger.info(f"Attempting to create file: {outpath.absolute()}")
+
+    async with get_db() as db:
+        # Читающая транзакция: выгрузка и проверка «почему пусто» видят один снимок базы,
+        # а блокировку записи не держим, пока пишем и сжимаем файл
+        await db.execute("BEGIN")
+        try:
+            user_ids = array("q")
+            with partial_path.open("wb") as raw:
+                f = open_partial(raw)
+                writer = csv.writer(f, delimiter=";")
+                writer.writerow(["UserID", "Email"])  # заголовок
+                async for user_id, email_norm in iter_rows(db, f"SELECT UserID, EmailNorm FROM Users WHERE {EXPORT_SQL}"):
+                    writer.writerow([user_id, email_norm or ""])
+                    user_ids.append(user_id)
+                finish_partial(raw, f)
+
+            exported_count = len(user_ids)
+            waiting_count = 0 if exported_count else await count_users(db, "Approve=TRUE AND Synced=FALSE")
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            partial_path.unlink(missing_ok=True)
+            raise
 
         if exported_count == 0:
-            logger.info("Фактически никто не попал в выгрузку (из-за EXCLUDED_EMAILS). Прерываем.")
-            # Записываем в SyncHistory при отсутствии экспортированных пользователей
-            await db.execute("""
-                INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
-                VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
-            """, ("export", out_filename, 0, "Фактически никто не попал в выгрузку (из-за EXCLUDED_EMAILS)"))
+            partial_path.unlink()
+            if waiting_count:
+                comment = "Фактически никто не попал в выгрузку (из-за EXCLUDED_EMAILS)"
+            else:
+                comment = "Нет пользователей для экспорта"
+            logger.info(f"{comment}. Файл не создаётся.")
+            await insert_sync_history(db, "export", out_filename, 0, comment)
             await db.commit()
             return
 
-        # 3) Обновляем Synced=TRUE
-        placeholders = ",".join("?" * len(to_update_ids))
-        query = f"UPDATE Users SET Synced=TRUE WHERE ID IN ({placeholders})"
-        await db.execute(query, tuple(to_update_ids))
-        await db.commit()
-
-        # Получаем список UserID для комментария
-        cursor = await db.execute("""
-            SELECT UserID FROM Users WHERE ID IN ({})
-        """.format(placeholders), tuple(to_update_ids))
-        user_ids = [row[0] for row in await cursor.fetchall()]
-        # Получаем email'ы пакетно
-        user_emails = await get_emails_by_user_ids(user_ids)
-        user_ids_str = ", ".join(f"{uid}:{user_emails.get(uid, '')}" for uid in user_ids)
-
-        # Логируем список UserID для отладки
-        logger.info(f"Экспортированные UserID: {user_ids_str}")
-
-        await db.execute("""
-            INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
-            VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
-        """, ("export", out_filename, exported_count, f"UserIDs: {user_ids_str}"))
-        await db.commit()
-    
+        # Публикуем файл до отметки Synced: если запись не пройдёт, пользователи останутся Synced=FALSE
+        # и попадут в следующую выгрузку повторно, но ни один не потеряется
+        try:
+            os.replace(partial_path, outpath)
+        except BaseException:
+            partial_path.unlink(missing_ok=True)
+            raise
+
+        # Отмечаем ровно тех, кто попал в файл: одобренные после снимка уйдут в следующую выгрузку
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            async with temp_id_table(db, user_ids, "tmp_exported") as ids_table:
+                await db.execute(f"UPDATE Users SET Synced=TRUE WHERE UserID IN (SELECT ID FROM {ids_table})")
+            # Выгруженные пользователи в SyncAction: по ним import.py в режиме дельты проверяет тех,
+            # кто получил Synced=TRUE после предыдущего импорта
+            sync_id = await insert_sync_history(db, "export", out_filename, exported_count,
+                                                f"Экспортировано: {exported_count}")
+            await insert_sync_actions(db, sync_id, ACTION_EXPORTED, user_ids)
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+    logger.info(f"Создан файл: {outpath}. Экспортировано {exported_count} пользователей.")
     logger.info("=== Экспорт завершён. ===\n")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(run_job(main))
@@ -12,15 +12,14 @@ export_all_emails.py
 import os
 import asyncio
 import csv
-import aiosqlite
 import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from database import get_user_email
-from config import EXCLUDED_EMAILS, logger, DB_PATH
+from database import get_db, iter_rows, count_users, run_job, NOT_EXCLUDED_SQL
+from config import logger
 
 OUTPUT_DIR = "./export"
 
@@ -35,17 +34,9 @@ async def main():
     
     logger.info(f"Attempting to create file: {outpath.absolute()}")
     
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Находим всех пользователей с непустым Email
-        cursor = await db.execute("""
-            SELECT ID, UserID, Email
-              FROM Users
-             WHERE Email IS NOT NULL
-               AND Email != ''
-        """)
-        rows = await cursor.fetchall()
-
-        if not rows:
+    async with get_db() as db:
+        # Проверяем, есть ли пользователи с непустым Email
+        if not await count_users(db, "EmailNorm IS NOT NULL"):
             logger.info("Нет пользователей с email.")
             return
 
@@ -56,19 +47,15 @@ async def main():
             writer = csv.writer(f, delimiter=";")
             writer.writerow(["UserID", "Email"])  # Только стандартные колонки
 
-            for row_id, user_id, enc_email in rows:
-                # Получаем email пользователя
-                plain_email = await get_user_email(user_id)
-                
-                # Пропускаем, если email в EXCLUDED_EMAILS
-                if plain_email.strip().lower() in [ex.strip().lower() for ex in EXCLUDED_EMAILS if ex.strip()]:
-                    continue
-                
-                plain_email = plain_email.strip().lower()
-                if plain_email == "":
-                    continue
-                
-                writer.writerow([user_id, plain_email])
+            # Потоково читаем всех пользователей с непустым email,
+            # пропуская тех, кто в EXCLUDED_EMAILS
+            async for user_id, email_norm in iter_rows(db, f"""
+                SELECT UserID, EmailNorm
+                  FROM Users
+                 WHERE EmailNorm IS NOT NULL
+                   AND {NOT_EXCLUDED_SQL}
+            """):
+                writer.writerow([user_id, email_norm])
                 exported_count += 1
 
         logger.info(f"Создан файл: {outpath}. Экспортировано {exported_count} пользователей.")
@@ -87,4 +74,4 @@ async def main():
     logger.info("=== Экспорт всех email завершён. ===\n")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(run_job(main)) 
\ No newline at end of file
@@ -11,6 +11,7 @@ from .code_handler import router as code_handler
 from .block_handler import router as block_handler
 from .confirm_handler import router as confirm_handler
 from .chat_handler import router as chat_handler
+from .member_handler import router as member_handler
 
 
 __all__ = [
@@ -25,4 +26,5 @@ __all__ = [
     "group_handler",
     "general_handler",
     "chat_handler",
+    "member_handler",
 ]   
@@ -1,9 +1,9 @@
 # handlers/callback_handler.py
 from aiogram import Router, types, F
 from aiogram.filters.callback_data import CallbackData
-from config import logger, DB_PATH
+from config import logger
+from database import get_db, invalidate_user_status
 from utils.email_sender import send_email
-import aiosqlite
 from datetime import datetime, timedelta
 import random
 from combine.answer import not_registered, block_time
@@ -22,7 +22,7 @@ async def handle_callback(callback_query: types.CallbackQuery):
 
     logger.info(f"Пользователь {user_id} вызвал callback с данными: {data}")
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_db() as db:
         # Проверяем, есть ли пользователь в базе
         cursor = await db.execute("SELECT Email, Code, Approve, BlockedUntil FROM Users WHERE UserID = ?", (user_id,))
         user = await cursor.fetchone()
@@ -65,10 +65,11 @@ async def handle_callback(callback_query: types.CallbackQuery):
             # Логика изменения email
             logger.info(f"Пользователь {user_id} запросил изменение email.")
             await db.execute(
-                "UPDATE Users SET WaitingForEmail = TRUE, Email = NULL, Code = NULL, WaitingForCode = FALSE WHERE UserID = ?",
+                "UPDATE Users SET WaitingForEmail = TRUE, Email = NULL, EmailNorm = NULL, Code = NULL, WaitingForCode = FALSE WHERE UserID = ?",
                 (user_id,)
             )
             await db.commit()
+            await invalidate_user_status([user_id])
             await set_flag(user_id, "WAITING_EMAIL", db)
             await callback_query.answer("Введите новый email для изменения текущего адреса.")
             await callback_query.message.answer("Введите ваш новый рабочий email.")
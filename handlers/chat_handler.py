@@ -3,8 +3,8 @@
 from aiogram import Router
 from aiogram.types import ChatMemberUpdated, ChatMemberAdministrator, ChatMemberMember, ChatMemberOwner
 from aiogram.enums import ChatMemberStatus, ChatType
-import aiosqlite
-from config import logger, DB_PATH
+from config import logger
+from database import get_db
 
 router = Router()
 
@@ -81,7 +81,7 @@ async def handle_my_chat_member(update: ChatMemberUpdated):
         update_expr = ", ".join(f"{c}=?" for c in col_names)     # "Title=?,Type=?,Status=?,..."
         values_list = [fields[c] for c in col_names]             # Собираем значения по порядку
 
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with get_db() as db:
             cursor = await db.execute("SELECT ChatID FROM Groups WHERE ChatID=?", (chat_id,))
             row = await cursor.fetchone()
 
@@ -1,9 +1,8 @@
 # handlers/check_handler.py
 
-import aiosqlite
 from aiogram import Router, types
 from aiogram.filters.command import Command
-from config import logger, COMPANY_CHANNEL_ID, DB_PATH
+from config import logger, COMPANY_CHANNEL_ID
 from combine.reply import remove_keyboard
 from combine.answer import (
     not_registered,
@@ -15,7 +14,7 @@ from combine.answer import (
 from aiogram.enums import ChatMemberStatus
 from utils.invite import generate_and_send_invite
 from aiogram.fsm.context import FSMContext
-from database import get_user_email
+from database import get_user_status
 from utils.mask import mask_email
 
 router = Router()
@@ -25,14 +24,8 @@ async def check_status(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     logger.info(f"[check_handler] Пользователь {user_id} вызвал команду /check")
 
-    # 1) Ищем пользователя в базе
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("""
-            SELECT Approve, WasApproved, InviteCount
-            FROM Users
-            WHERE UserID = ?
-        """, (user_id,))
-        result = await cursor.fetchone()
+    # 1) Ищем пользователя в базе (через кэш статусов)
+    result = await get_user_status(user_id)
 
     if not result:
         # Пользователь не найден
@@ -40,7 +33,7 @@ async def check_status(message: types.Message, state: FSMContext):
         await message.answer(not_registered, reply_markup=remove_keyboard())
         return
 
-    approve, was_approved, invite_count = result
+    approve, was_approved, invite_count = result.approve, result.was_approved, result.invite_count
 
     # 2) Разбираем логику
     if not approve:
@@ -57,7 +50,7 @@ async def check_status(message: types.Message, state: FSMContext):
 
     # Если мы здесь, значит Approve=TRUE
     # Достаем email для наглядности
-    dec_email = await get_user_email(user_id)
+    dec_email = result.email
     masked_email = mask_email(dec_email)
     logger.info(f"[check_handler] Пользователь {user_id} имеет approve=TRUE, email={masked_email}.")
 
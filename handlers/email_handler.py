@@ -6,7 +6,7 @@ from datetime import datetime
 from utils.mask import mask_email
 from combine.answer import email_confirm, email_invalid, block_released
 from combine.reply import remove_keyboard, email_keyboard
-from config import logger, EXCLUDED_EMAILS, WORK_MAIL
+from config import logger, EXCLUDED_EMAILS_NORM, WORK_MAIL
 from states import Verification
 from handlers.block_handler import check_if_still_blocked
 
@@ -27,7 +27,7 @@ def is_valid_work_email(email: str) -> bool:
         return False
 
     # Если email входит в EXCLUDED_EMAILS, считаем тоже валидным (по условию, возможно, HR почты или что-то ещё)
-    if any(email.strip().lower() == ex.strip().lower() for ex in EXCLUDED_EMAILS if ex.strip()):
+    if email.strip().lower() in EXCLUDED_EMAILS_NORM:
         return True
 
     domain = WORK_MAIL.lower()
@@ -5,8 +5,8 @@ from combine.answer import bot_commands
 from combine.reply import remove_keyboard
 from aiogram.fsm.context import FSMContext
 from utils.invite import generate_and_send_invite
-import aiosqlite
-from config import logger, COMPANY_CHANNEL_ID, DB_PATH
+from config import logger, COMPANY_CHANNEL_ID
+from database import get_user_status
 
 router = Router()
 
@@ -18,13 +18,7 @@ async def handle_text(message: types.Message, state: FSMContext):
         user_id = message.from_user.id
 
         # Шаг 1: Проверяем, есть ли пользователь в базе и верифицирован ли он
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("""
-                SELECT Approve
-                FROM Users
-                WHERE UserID = ?
-            """, (user_id,))
-            row = await cursor.fetchone()
+        row = await get_user_status(user_id)
 
         if not row:
             # Пользователь не найден в базе
@@ -35,7 +29,7 @@ async def handle_text(message: types.Message, state: FSMContext):
             )
             return
 
-        approve = row[0]
+        approve = row.approve
         if not approve:
             # Пользователь есть в базе, но не верифицирован
             logger.info(f"[general_handler] User {user_id} is not approved => deny invite.")
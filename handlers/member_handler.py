@@ -0,0 +1,53 @@
+# handlers/member_handler.py
+
+from aiogram import Router, F
+from aiogram.types import ChatMemberUpdated, Message
+from aiogram.enums import ChatType
+from config import logger
+from utils.membership import record_chat_member
+
+router = Router()
+
+@router.chat_member()
+async def handle_chat_member(update: ChatMemberUpdated):
+    """
+    Хэндлер вызывается при изменении статуса участника в чате, где бот администратор
+    (вступление, выход, бан). Сохраняем статус в ChatMembership, чтобы cleaner.py
+    не спрашивал Telegram о каждом пользователе.
+    """
+    if update.chat.type == ChatType.PRIVATE:
+        return
+
+    chat_id = update.chat.id
+    user_id = update.new_chat_member.user.id
+    status = update.new_chat_member.status
+
+    try:
+        await record_chat_member(chat_id, user_id, status)
+        logger.debug(f"[chat_member] chat_id={chat_id}, user_id={user_id}, "
+                     f"{update.old_chat_member.status} -> {status}")
+    except Exception as e:
+        logger.exception(f"Ошибка при сохранении статуса user_id={user_id} в chat_id={chat_id}: {e}")
+
+
+@router.message(F.new_chat_members)
+async def handle_new_chat_members(message: Message):
+    """
+    Служебное сообщение о вступлении в группу. Приходит и там, где бот не администратор
+    (chat_member оттуда не приходят), поэтому тоже сохраняем участников в ChatMembership.
+    """
+    for user in message.new_chat_members:
+        try:
+            await record_chat_member(message.chat.id, user.id, "member")
+        except Exception as e:
+            logger.exception(f"Ошибка при сохранении вступления user_id={user.id} в chat_id={message.chat.id}: {e}")
+
+
+@router.message(F.left_chat_member)
+async def handle_left_chat_member(message: Message):
+    """Служебное сообщение о выходе из группы."""
+    user = message.left_chat_member
+    try:
+        await record_chat_member(message.chat.id, user.id, "left")
+    except Exception as e:
+        logger.exception(f"Ошибка при сохранении выхода user_id={user.id} из chat_id={message.chat.id}: {e}")
@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 """
 import.py
-Запускается раз в сутки в 20:00
+Запускается раз в сутки в 20:00, а файл, появившийся раньше, сразу обрабатывает import_watcher.py
 """
 import os
 import asyncio
-from pathlib import Path
-from config import logger, DB_PATH
+from config import logger, IMPORT_FULL_RECONCILE_DAYS
 from utils.file_ops import (
     is_export_empty,
     find_import_file,
@@ -14,41 +13,61 @@ from utils.file_ops import (
     archive_import_file,
     parse_csv_users
 )
-from utils.import_logic import process_unapproved_in_db, restore_banned_users, protect_excluded_users, unban_excluded_users
+from utils.import_logic import reconcile_import, reconcile_import_delta
+from utils.id_set import IdSet
+from utils.snapshots import write_snapshot, read_import_ids, find_latest_import
 from utils.notify import notify_newly_fired
-import aiosqlite
-from database import get_user_email, get_emails_by_user_ids
+from utils.sync_log import (
+    write_sync_history,
+    ACTION_FIRED,
+    ACTION_RESTORED,
+    ACTION_PROTECTED,
+    ACTION_UNBANNED,
+    ACTION_NOTIFIED,
+    ACTION_EXPORTED,
+    ACTION_BANNED,
+    ACTION_UNAPPROVED,
+    get_last_sync_id,
+    get_action_users_since,
+)
+from database import get_db, get_emails_by_user_ids, invalidate_user_status, iter_rows, run_job
 
 os.getcwd()
 
-async def compare_with_previous_import(current_user_ids: set[int]) -> bool:
-    """
-    Сравнивает текущий список user_id с последним успешным импортом.
-    Возвращает True, если различия допустимы, и False, если они слишком велики.
-    """
-    archived_dir = Path("./import/archived")
-    archived_files = sorted(
-        archived_dir.glob("active_users_*.csv"),
-        key=lambda x: x.stem.split('_')[-1],
-        reverse=True
-    )
+# Кому после предыдущего импорта могло понадобиться восстановление: Approve=FALSE ставят только очередь
+# PendingBans (/start, проверка исключений), Banned=TRUE — cleaner.py (пока его прогон не закончен,
+# пользователь тоже ещё в очереди). Параметр — ID строки SyncHistory предыдущего импорта
+RESTORE_CANDIDATES_SQL = f"""
+    SELECT UserID FROM Users
+    WHERE (Approve=FALSE OR Banned=TRUE)
+      AND (UserID IN (SELECT UserID FROM PendingBans)
+           OR UserID IN (SELECT UserID FROM SyncAction
+                         WHERE SyncID > ? AND Action IN ('{ACTION_BANNED}', '{ACTION_UNAPPROVED}')))
+"""
 
-    if not archived_files:
+def load_previous_import(filename: str) -> tuple[str, IdSet] | None:
+    """Имя и user_id последнего успешного импорта до filename (по снимку в ./import/snapshots)."""
+    last_import = find_latest_import(exclude=filename)
+    if not last_import:
         logger.info("Нет предыдущих файлов для сравнения. Продолжаем.")
-        return True
+        return None
 
-    last_archived_file = archived_files[0]
-    previous_user_ids = parse_csv_users(last_archived_file.name)
+    previous_user_ids = read_import_ids(last_import)
 
     if not previous_user_ids:
-        logger.warning(f"Не удалось прочитать {last_archived_file}. Продолжаем.")
-        return True
+        logger.warning(f"Не удалось прочитать {last_import}. Продолжаем.")
+        return None
+    return last_import, previous_user_ids
 
-    # Вычисляем различия
-    added = len(current_user_ids - previous_user_ids)
-    removed = len(previous_user_ids - current_user_ids)
+
+async def compare_with_previous_import(added_ids: IdSet, removed_ids: IdSet, previous_count: int) -> bool:
+    """
+    Проверяет дельту с последним успешным импортом: добавленные и пропавшие user_id.
+    Возвращает True, если различия допустимы, и False, если они слишком велики.
+    """
+    added = len(added_ids)
+    removed = len(removed_ids)
     total_changes = added + removed
-    previous_count = len(previous_user_ids)
 
     # Порог: 50% изменений
     if previous_count > 0 and (total_changes / previous_count) > 0.5:
@@ -59,10 +78,75 @@ async def compare_with_previous_import(current_user_ids: set[int]) -> bool:
         return True
 
 
-async def main():
+async def find_delta_base(previous_import: str | None) -> int | None:
+    """
+    ID строки SyncHistory предыдущего импорта, если можно применить только дельту к нему.
+    None — нужна полная сверка: нет предыдущего импорта, IMPORT_FULL_RECONCILE_DAYS=0
+    или полной сверки не было дольше IMPORT_FULL_RECONCILE_DAYS дней.
+    """
+    if previous_import is None or IMPORT_FULL_RECONCILE_DAYS <= 0:
+        return None
+    async with get_db() as db:
+        since_sync_id = await get_last_sync_id(db, "import", previous_import)
+        cursor = await db.execute("""
+            SELECT 1 FROM SyncHistory
+            WHERE SyncType='import' AND Comment LIKE 'success (full%'
+              AND SyncDate >= DATETIME('now', 'localtime', ?)
+            LIMIT 1
+        """, (f"-{IMPORT_FULL_RECONCILE_DAYS} days",))
+        recent_full = await cursor.fetchone()
+    if since_sync_id is None or recent_full is None:
+        return None
+    return since_sync_id
+
+
+async def reconcile(user_ids: IdSet, delta: tuple[IdSet, IdSet] | None, since_sync_id: int | None):
+    """
+    Полная сверка (since_sync_id is None) или только дельта: увольнение проверяется для пропавших
+    из списка и выгруженных export.py после предыдущего импорта. Восстановление — для появившихся
+    в списке и для тех, кто был в нём и раньше, но после предыдущего импорта получил Approve=FALSE
+    или Banned=TRUE (RESTORE_CANDIDATES_SQL: нажал /start, снят проверкой исключений, забанен cleaner.py).
+    Предыдущий импорт восстановил всех из своего списка, поэтому результат совпадает с полной сверкой,
+    а стоимость зависит от изменений с прошлого импорта: ни список, ни все Approve=FALSE не перебираются.
+    Изменения в обход бота и пакетных заданий (правка базы вручную) подберёт полная сверка
+    раз в IMPORT_FULL_RECONCILE_DAYS дней.
+    """
+    if since_sync_id is None:
+        return await reconcile_import(user_ids)
+
+    added_ids, removed_ids = delta
+    async with get_db() as db:
+        exported = await get_action_users_since(db, ACTION_EXPORTED, since_sync_id)
+        # Изменившиеся после предыдущего импорта: вхождение в список — бинарный поиск по IdSet
+        changed = [
+            user_id async for (user_id,) in iter_rows(db, RESTORE_CANDIDATES_SQL, (since_sync_id,))
+            if user_id in user_ids
+        ]
+    restore_candidates = [*added_ids, *changed]
+    exported_missing = [uid for uid in exported if uid not in user_ids]
+    logger.info(f"Дельта: добавлено {len(added_ids)}, удалено {len(removed_ids)}, "
+                f"выгружено после предыдущего импорта и нет в списке: {len(exported_missing)}, "
+                f"в списке и получили Approve=FALSE или Banned=TRUE после него: {len(changed)}")
+    return await reconcile_import_delta([*removed_ids, *exported_missing], restore_candidates)
+
+
+async def imported_today() -> bool:
+    """Был ли сегодня успешный импорт (например, файл уже обработал import_watcher.py)."""
+    async with get_db() as db:
+        cursor = await db.execute("""
+            SELECT 1 FROM SyncHistory
+            WHERE SyncType='import' AND Comment LIKE 'success%'
+              AND date(SyncDate) = date('now', 'localtime')
+            LIMIT 1
+        """)
+        return await cursor.fetchone() is not None
+
+
+async def main(filename: str | None = None):
+    """Импорт файла filename из ./import; без него — файла active_users_<сегодня>.csv (запуск по cron)."""
     logger.info("=== [import.py] Начинаем обработку файла от компании ===")
 
-    filename = find_import_file()
+    filename = filename or find_import_file()
     if filename:
         logger.info(f"Filename type: {type(filename)}, value: {filename}")
     
@@ -78,6 +162,9 @@ async def main():
 
     # 1) Проверяем наличие файла
     if not filename:
+        if await imported_today():
+            logger.info("Файла для импорта нет, сегодняшний импорт уже выполнен. Выходим.")
+            return
         logger.warning("Файл импортa не найден или неправильно назван. Выходим.")
         await write_sync_history("import-skipped", "no file found", 0, comment="Файл импортa не найден или неправильно назван")
         return
@@ -93,54 +180,61 @@ async def main():
 
     logger.info(f"Прочитано {len(user_ids)} актуальных user_id из {filename}.")
 
-    # Сравниваем с предыдущим
-    if not await compare_with_previous_import(user_ids):
+    # Сравниваем с предыдущим импортом: дельта нужна и для проверки порога, и для сверки
+    previous = load_previous_import(filename)
+    delta = None
+    if previous:
+        previous_import, previous_user_ids = previous
+        delta = (user_ids - previous_user_ids, previous_user_ids - user_ids)
+    if delta and not await compare_with_previous_import(*delta, len(previous_user_ids)):
         logger.critical("Обнаружены аномальные различия. Обработка прервана.")
         await write_sync_history("import-skipped", filename, 0, comment="Обнаружены аномальные различия. Обработка прервана.")
         return
     # Если все ок, продолжаем
     logger.info("Обработка продолжается...")
     
-    # 3) Снимаем Approve=TRUE тем, кто не в списке (и не в EXCLUDED_EMAILS)
-    changed_users = await process_unapproved_in_db(user_ids, filename)
+    # 3) Сверяем Users со списком одной транзакцией:
+    #    снимаем Approve=TRUE тем, кто не в списке (и не в EXCLUDED_EMAILS),
+    #    восстанавливаем доступ тем, кто снова в списке,
+    #    защищаем и разбаниваем пользователей из EXCLUDED_EMAILS.
+    #    Обычно проверяется только дельта к предыдущему импорту, раз в IMPORT_FULL_RECONCILE_DAYS дней — все
+    since_sync_id = await find_delta_base(previous[0] if previous else None)
+    mode = "full" if since_sync_id is None else "delta"
+    logger.info(f"Режим сверки: {'полная' if since_sync_id is None else 'дельта'}")
+    changed_users, restored_users, protected_users, unbanned_excluded = await reconcile(user_ids, delta, since_sync_id)
     if changed_users:
         changed_emails = await get_emails_by_user_ids(changed_users)
         changed_ids_str = ", ".join(f"{uid}:{changed_emails.get(uid, '')}" for uid in changed_users)
         logger.info(f"Уволено {len(changed_users)} пользователей: {changed_ids_str}")
     else:
-        changed_ids_str = ""
         logger.info("Нет пользователей для увольнения.")
     
-    # 3.1) Восстанавливаем доступ пользователям, которые ранее были забанены, но теперь в списке
-    restored_users = await restore_banned_users(user_ids)
     if restored_users:
         restored_emails = await get_emails_by_user_ids(restored_users)
         restored_ids_str = ", ".join(f"{uid}:{restored_emails.get(uid, '')}" for uid in restored_users)
         logger.info(f"Восстановлен доступ для {len(restored_users)} пользователей: {restored_ids_str}")
     else:
-        restored_ids_str = ""
         logger.info("Нет пользователей для восстановления доступа.")
     
-    # 3.2) Дополнительная защита: обеспечиваем доступ для всех пользователей из EXCLUDED_EMAILS
-    protected_users = await protect_excluded_users()
     if protected_users:
         protected_emails = await get_emails_by_user_ids(protected_users)
         protected_ids_str = ", ".join(f"{uid}:{protected_emails.get(uid, '')}" for uid in protected_users)
         logger.info(f"Защищено {len(protected_users)} исключенных пользователей: {protected_ids_str}")
     else:
-        protected_ids_str = ""
         logger.info("Дополнительная защита исключенных пользователей не требовалась.")
     
-    # 3.3) Дополнительная проверка: разбаниваем пользователей из EXCLUDED_EMAILS, 
-    # которые могли быть забанены между cleaner и import
-    unbanned_excluded = await unban_excluded_users()
     if unbanned_excluded:
         unbanned_emails = await get_emails_by_user_ids(unbanned_excluded)
         unbanned_ids_str = ", ".join(f"{uid}:{unbanned_emails.get(uid, '')}" for uid in unbanned_excluded)
         logger.info(f"Разбанено {len(unbanned_excluded)} исключенных пользователей: {unbanned_ids_str}")
     else:
-        unbanned_ids_str = ""
         logger.info("Дополнительная разблокировка исключенных пользователей не требовалась.")
+
+    # Сообщаем боту, чьи статусы изменились, чтобы он сбросил их в кэше
+    await invalidate_user_status(
+        set(changed_users) | set(restored_users) | set(protected_users) | set(unbanned_excluded),
+        publish=True
+    )
     
     # 4) Отправляем уведомления только тем, кому ещё не отправляли
     notified_users = []
@@ -152,27 +246,35 @@ async def main():
             notified_ids_str = ", ".join(f"{uid}:{notified_emails.get(uid, '')}" for uid in notified_users)
             logger.info(f"Отправлены уведомления {len(notified_users)} пользователям: {notified_ids_str}")
         else:
-            notified_ids_str = ""
             logger.info("Уведомления не были отправлены.")
     else:
-        notified_ids_str = ""
         logger.info("Никому не нужно отправлять уведомления.")
 
-    # Формируем комментарий для SyncHistory
-    comment_parts = []
-    if restored_users:
-        comment_parts.append(f"восстановлено: {len(restored_users)} ({restored_ids_str})")
-    if changed_users:
-        comment_parts.append(f"уволено: {len(changed_users)} ({changed_ids_str})")
-    if protected_users:
-        comment_parts.append(f"защищено: {len(protected_users)} ({protected_ids_str})")
-    if unbanned_excluded:
-        comment_parts.append(f"разбанено: {len(unbanned_excluded)} ({unbanned_ids_str})")
-    if notified_users:
-        comment_parts.append(f"уведомлено: {len(notified_users)} ({notified_ids_str})")
+    # Формируем комментарий для SyncHistory: только счётчики, поимённо — в SyncAction
+    actions = {
+        ACTION_RESTORED: restored_users,
+        ACTION_FIRED: changed_users,
+        ACTION_PROTECTED: protected_users,
+        ACTION_UNBANNED: unbanned_excluded,
+        ACTION_NOTIFIED: notified_users,
+    }
+    counter_names = {
+        ACTION_RESTORED: "восстановлено",
+        ACTION_FIRED: "уволено",
+        ACTION_PROTECTED: "защищено",
+        ACTION_UNBANNED: "разбанено",
+        ACTION_NOTIFIED: "уведомлено",
+    }
+    comment_parts = [f"{counter_names[action]}: {len(users)}" for action, users in actions.items() if users]
     
-    comment = f"success ({'; '.join(comment_parts)})" if comment_parts else "success"
-    await write_sync_history("import", filename, len(user_ids), comment=comment)
+    # Режим сверки и размер дельты идут первыми: по «success (full» find_delta_base ищет последнюю полную сверку
+    if delta:
+        mode += f", +{len(delta[0])}/-{len(delta[1])}"
+    comment = f"success ({'; '.join([mode, *comment_parts])})"
+    await write_sync_history("import", filename, len(user_ids), comment=comment, actions=actions)
+
+    # Снимок для сравнения со следующим импортом, проверки cleaner.py и scripts/recover.py
+    write_snapshot(user_ids, filename)
 
     # 5) Переносим обработанный файл в ./import/archived
     archive_import_file(filename, success=True)
@@ -180,14 +282,5 @@ async def main():
     logger.info("=== Импорт завершён ===")
 
 
-async def write_sync_history(sync_type: str, filename: str, count: int, comment: str = ""):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
-            VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
-        """, (sync_type, filename, count, comment))
-        await db.commit()
-
-
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(run_job(main, lock="import"))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+import_watcher.py
+Постоянно работает в контейнере import_watcher (ROLE=import_watcher).
+
+ - Раз в IMPORT_WATCH_INTERVAL секунд опрашивает ./import и ищет файлы active_users_YYYYmmdd.csv.
+ - Файл считается записанным, когда его размер и mtime не изменились между двумя опросами
+   и не менялись последние IMPORT_SETTLE_SECONDS секунд. Файл, который выкладывают под временным
+   именем и переименовывают, попадает под шаблон только после переименования.
+ - Готовый файл сразу проходит тот же конвейер, что и import.py по cron, под общей блокировкой
+   пакетных заданий (не одновременно с cleaner.py). Если готовых файлов несколько, импортируется
+   самый свежий по дате в имени, остальные переносятся в ./import/skipped.
+ - Пока компания не забрала файлы из ./export, импорт откладывается (cron в 20:00 в этом случае
+   пропустит файл, как и раньше).
+"""
+import time
+import asyncio
+import importlib
+import functools
+from pathlib import Path
+from config import logger, IMPORT_WATCH_INTERVAL, IMPORT_SETTLE_SECONDS
+from database import run_job
+from utils.file_ops import IMPORT_DIR, is_export_empty, skip_import_file
+from utils.sync_log import write_sync_history
+
+import_job = importlib.import_module("import")
+
+IMPORT_FILE_PATTERN = "active_users_*.csv"
+
+
+def scan_import_dir() -> dict[str, tuple[int, int]]:
+    """Файлы импорта в ./import (без подпапок): {имя: (размер, mtime_ns)}."""
+    files = {}
+    for path in Path(IMPORT_DIR).glob(IMPORT_FILE_PATTERN):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if path.is_file():
+            files[path.name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def file_date(name: str) -> str:
+    return Path(name).stem.split('_')[-1]
+
+
+def ready_files(current: dict[str, tuple[int, int]], previous: dict[str, tuple[int, int]]) -> list[str]:
+    """Файлы, дописанные до конца: непустые, не изменились с прошлого опроса и дольше IMPORT_SETTLE_SECONDS."""
+    now_ns = time.time_ns()
+    return sorted(
+        (name for name, (size, mtime_ns) in current.items()
+         if size > 0 and previous.get(name) == (size, mtime_ns)
+         and now_ns - mtime_ns >= IMPORT_SETTLE_SECONDS * 1e9),
+        key=file_date
+    )
+
+
+async def import_ready(names: list[str]) -> bool:
+    """
+    Импортирует самый свежий из готовых файлов, более старые переносит в ./import/skipped.
+    Выполняется под блокировкой, поэтому сначала проверяет, что файлы ещё на месте: пока ждали
+    блокировку, их мог обработать import.py по cron. Возвращает True, когда импорт выполнен
+    (или делать уже нечего).
+    """
+    names = [name for name in names if (Path(IMPORT_DIR) / name).is_file()]
+    if not names:
+        logger.info("[import_watcher] Файлы уже обработаны другим заданием, импорт не нужен.")
+        return True
+    newest = names[-1]
+    for name in names[:-1]:
+        logger.warning(f"[import_watcher] Файл {name} старее {newest}, пропускаем.")
+        skip_import_file(name)
+        await write_sync_history("import-skipped", name, 0, comment=f"Пропущен: есть более новый файл {newest}")
+    await import_job.main(newest)
+    return True
+
+
+async def main():
+    logger.info(f"=== [import_watcher.py] Следим за {IMPORT_DIR}/{IMPORT_FILE_PATTERN}, "
+                f"опрос раз в {IMPORT_WATCH_INTERVAL:g} с ===")
+    previous: dict[str, tuple[int, int]] = {}
+    # Версии файлов (имя, размер, mtime), импорт которых отработал: файл, оставшийся в ./import
+    # после отказа (например, аномальные различия), не импортируется повторно, пока компания
+    # его не заменит. Если блокировку не дождались или импорт упал, файл пробуем снова
+    handled: set[tuple[str, int, int]] = set()
+    export_busy = False
+
+    while True:
+        current = scan_import_dir()
+        ready = [name for name in ready_files(current, previous) if (name, *current[name]) not in handled]
+        if ready:
+            if not is_export_empty():
+                if not export_busy:
+                    logger.info(f"[import_watcher] Готов {ready[-1]}, но компания ещё не забрала файлы из ./export. Ждём.")
+                export_busy = True
+            else:
+                export_busy = False
+                logger.info(f"[import_watcher] Файл {ready[-1]} записан полностью, запускаем импорт.")
+                try:
+                    if await run_job(functools.partial(import_ready, ready), lock="import"):
+                        handled.update((name, *current[name]) for name in ready)
+                    else:
+                        logger.warning(f"[import_watcher] Импорт {ready[-1]} не выполнен, повторим при следующем опросе.")
+                except Exception as e:
+                    logger.exception(f"[import_watcher] Ошибка импорта {ready[-1]}, повторим при следующем опросе: {e}")
+        previous = current
+        await asyncio.sleep(IMPORT_WATCH_INTERVAL)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
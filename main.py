@@ -1,13 +1,15 @@
 import asyncio
 from aiogram import Bot, Dispatcher
-from config import API_TOKEN, logger
-from database import initialize_db
+from config import API_TOKEN, REDIS_HOST, REDIS_PORT, SQL_STATS_TOP, logger
+from database import initialize_db, close_db, checkpoint_loop, start_write_behind
 from exclusions import check_exclusions
+from utils.user_cache import user_cache, listen_invalidations
+from utils.sql_stats import sql_stats
 from handlers import (
     start_handler, check_handler, manual_handler, 
     email_handler, code_handler, confirm_handler, #callback_handler, 
     general_handler, group_handler, block_handler,
-    chat_handler
+    chat_handler, member_handler
 )
 from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder
 from redis.asyncio import Redis
@@ -17,7 +19,7 @@ async def main():
     await initialize_db()
     
     # Инициализация Redis и бота в самом начале
-    redis = Redis(host='redis', port=6379, db=5)
+    redis = Redis(host=REDIS_HOST, port=REDIS_PORT, db=5)
     bot = Bot(token=API_TOKEN)
     storage = RedisStorage(redis=redis, key_builder=DefaultKeyBuilder(prefix="pulse_fsm"))    
     dp = Dispatcher(storage=storage)
@@ -28,6 +30,7 @@ async def main():
 
     # Регистрация хэндлеров
     dp.include_router(chat_handler)
+    dp.include_router(member_handler)
     dp.include_router(group_handler)
     dp.include_router(block_handler)
     dp.include_router(start_handler)
@@ -40,13 +43,22 @@ async def main():
     dp.include_router(general_handler)
 
     logger.info("Бот успешно запущен!")
+    start_write_behind()
+    checkpoint_task = asyncio.create_task(checkpoint_loop())
+    invalidation_task = asyncio.create_task(listen_invalidations(redis))
     
     try:
-        await dp.start_polling(bot)
+        # chat_member не приходит без явной подписки, поэтому передаём все используемые типы обновлений
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        checkpoint_task.cancel()
+        invalidation_task.cancel()
+        logger.info(f"Кэш статусов пользователей: {user_cache.stats()}")
         # Закрываем все соединения при завершении
         await bot.session.close()
         await redis.aclose()
+        await close_db()
+        sql_stats.log_summary("бота", SQL_STATS_TOP)
         logger.info("Все соединения закрыты.")
 
 if __name__ == "__main__":
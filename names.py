@@ -2,9 +2,26 @@
 # names.py - скрипт для добавления данных Username, FirstName и LastName существующим пользователям
 
 import asyncio
-import aiosqlite
-from config import DB_PATH, API_TOKEN, logger
-from aiogram import Bot
+from config import logger
+from database import get_db, iter_users, count_users, run_job
+from utils.tg_client import TelegramClient
+
+# Сколько обновлений копить перед записью. Запросы к Telegram идут вне транзакции,
+# а запись — короткая транзакция из одного executemany
+NAMES_FLUSH_ROWS = 50
+
+
+async def flush_updates(db, updates: list[tuple]):
+    """Записывает накопленные (Username, FirstName, LastName, UserID) одной транзакцией и очищает список."""
+    if not updates:
+        return
+    await db.executemany("""
+        UPDATE Users 
+        SET Username = ?, FirstName = ?, LastName = ? 
+        WHERE UserID = ?
+    """, updates)
+    await db.commit()
+    updates.clear()
 
 async def update_users_data():
     """
@@ -12,53 +29,48 @@ async def update_users_data():
     для всех существующих пользователей в базе данных.
     """
     logger.info("Запуск обновления данных пользователей")
-    bot = Bot(token=API_TOKEN)
+    client = TelegramClient()
     
     try:
         # Получаем всех пользователей без данных
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Получаем список UserID всех пользователей
-            cursor = await db.execute("""
-                SELECT UserID FROM Users
-            """)
-            users = await cursor.fetchall()
+        async with get_db() as db:
+            # Считаем пользователей; сами UserID читаем потоково ниже
+            users_count = await count_users(db)
             
-            if not users:
+            if not users_count:
                 logger.info("Пользователи в базе не найдены")
                 return
                 
-            logger.info(f"Найдено {len(users)} пользователей в базе")
+            logger.info(f"Найдено {users_count} пользователей в базе")
             
             update_count = 0
             error_count = 0
+            updates = []
             
             # Обновляем данные для каждого пользователя
-            for user_row in users:
-                user_id = user_row[0]
-                
+            async for (user_id,) in iter_users(db):
                 try:
                     # Получаем информацию о пользователе из Telegram
-                    user = await bot.get_chat(user_id)
-                    
-                    # Обновляем запись в базе данных
-                    await db.execute("""
-                        UPDATE Users 
-                        SET Username = ?, FirstName = ?, LastName = ? 
-                        WHERE UserID = ?
-                    """, (user.username, user.first_name, user.last_name, user_id))
+                    user = await client.get_chat(user_id)
                     
+                    # Копим обновление: транзакция не должна оставаться открытой, пока ждём Telegram,
+                    # иначе бот упрётся в блокировку записи
+                    updates.append((user.username, user.first_name, user.last_name, user_id))
                     update_count += 1
+                    if len(updates) >= NAMES_FLUSH_ROWS:
+                        await flush_updates(db, updates)
                     logger.info(f"Обновлены данные пользователя {user_id}: username={user.username}, first_name={user.first_name}, last_name={user.last_name}")
                     
                 except Exception as e:
                     error_count += 1
                     logger.error(f"Ошибка при получении данных пользователя {user_id}: {e}")
                     
-            await db.commit()
+            await flush_updates(db, updates)
             logger.info(f"Обновление завершено. Успешно: {update_count}, с ошибками: {error_count}")
     finally:
         # Важно: закрываем сессию бота
-        await bot.session.close()
+        await client.close()
+        client.log_stats("names")
 
 async def main():
     try:
@@ -69,4 +81,4 @@ async def main():
         logger.info("Скрипт завершен")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(run_job(main)) 
\ No newline at end of file
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пакетных заданий целиком против локального fake Bot API.
+
+Поднимает scripts/fake_bot_api.py в том же процессе, направляет на него TELEGRAM_API_SERVER,
+создаёт во временной директории базу на N пользователей, M групп и файл импорта и по очереди запускает:
+  1) import.main — сверка со списком и уведомления уволенным (sendMessage);
+  2) cleaner.main — план и баны уволенных в группах (getChatMember, banChatMember);
+  3) exclusions.check_exclusions — восстановление пользователей из EXCLUDED_EMAILS
+     (unbanChatMember, createChatInviteLink, sendMessage).
+Для каждого этапа печатает время, запросы к API по методам и запросы в секунду.
+Лимиты клиента — TG_GLOBAL_RPS / TG_CHAT_RPS из окружения (по умолчанию как в проде).
+
+    python scripts/bench_batch_jobs.py [пользователей=10000] [групп=5] [задержка_мс=20]
+    TG_GLOBAL_RPS=0 TG_CHAT_RPS=0 python scripts/bench_batch_jobs.py 100000   # без лимитов
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import datetime
+import importlib
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+USER_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+GROUP_COUNT = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+LATENCY_MS = float(sys.argv[3]) if len(sys.argv) > 3 else 20.0
+GROUP_BASE = -1000000
+CHANNEL_ID = -100
+# Каждый 1000-й пользователь — в списке исключений
+EXCLUDED_EVERY = 1000
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_batch_jobs_")
+PORT = free_port()
+# Скрипты работают с ./import, ./export и ./logs относительно текущей директории
+os.chdir(TMP_DIR)
+for subdir in ("import", "export", "logs"):
+    os.makedirs(subdir, exist_ok=True)
+os.environ["DB_PATH"] = os.path.join(TMP_DIR, "bench.db")
+os.environ["TELEGRAM_API_SERVER"] = f"http://127.0.0.1:{PORT}"
+os.environ["MAINTENANCE_MODE"] = "0"
+os.environ["EXCLUDED_EMAILS"] = ",".join(
+    f"user{uid}@example.com" for uid in range(EXCLUDED_EVERY, USER_COUNT + 1, EXCLUDED_EVERY)
+)
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": str(CHANNEL_ID),
+    # Redis в бенчмарке не нужен: ошибка публикации инвалидации только пишется в лог
+    "REDIS_HOST": "127.0.0.1",
+    "REDIS_PORT": "1",
+}.items():
+    os.environ.setdefault(var, value)
+
+from config import logger, TG_GLOBAL_RPS, TG_CHAT_RPS
+import database
+import cleaner
+import exclusions
+from utils.tg_client import create_bot
+from scripts.fake_bot_api import FakeBotApi
+
+import_job = importlib.import_module("import")
+
+
+async def seed() -> int:
+    """
+    Users: 90% верифицированы и есть в файле импорта, 3% верифицированы, но «уволены» (нет в файле),
+    остальные уже забанены раньше. Возвращает число UserID в файле импорта.
+    """
+    rows, active = [], []
+    for uid in range(1, USER_COUNT + 1):
+        bucket = uid % 100
+        if bucket < 90 or uid % EXCLUDED_EVERY == 0:
+            approve, banned = 1, 0
+            active.append(uid)
+        elif bucket < 93:
+            approve, banned = 1, 0
+        else:
+            approve, banned = 0, 1
+        rows.append((uid, f"user{uid}@example.com", f"user{uid}@example.com", approve, 1, 1, banned, banned))
+    async with database.get_db() as db:
+        await db.executemany("""
+            INSERT INTO Users (UserID, Email, EmailNorm, Approve, WasApproved, Synced, Banned, Notified)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        await db.executemany("""
+            INSERT INTO Groups (ChatID, Title, Type, Status, can_manage_chat, can_restrict_members,
+                                can_promote_members, can_invite_users, New)
+            VALUES (?, ?, 'supergroup', 'administrator', TRUE, TRUE, FALSE, TRUE, FALSE)
+        """, [(GROUP_BASE - i, f"Group_{GROUP_BASE - i}") for i in range(GROUP_COUNT)])
+        await db.commit()
+
+    filename = f"active_users_{datetime.date.today().strftime('%Y%m%d')}.csv"
+    with open(os.path.join("import", filename), "w", encoding="utf-8") as f:
+        f.write("UserID;Email\n")
+        f.writelines(f"{uid};user{uid}@example.com\n" for uid in active)
+    return len(active)
+
+
+async def prepare_cleaner():
+    """
+    cleaner.py ждёт успешный импорт за вчера (need_clean) и за последние 24 часа (файл импорта):
+    добавляем вчерашнюю запись, сегодняшнюю оставил import.main. Как в обычный день, полная сверка
+    была недавно, поэтому cleaner.py чистит только очередь PendingBans, заполненную import.main.
+    """
+    async with database.get_db() as db:
+        await db.execute("""
+            INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
+            VALUES ('import', '-', 0, DATETIME('now', 'localtime', '-1 day'), 'success')
+        """)
+        await db.execute("""
+            INSERT INTO CleanerRuns (StartedAt, FinishedAt, Status, Simulation, FullScan)
+            VALUES (DATETIME('now', 'localtime', '-1 day'), DATETIME('now', 'localtime', '-1 day'), 'done', FALSE, TRUE)
+        """)
+        await db.commit()
+
+
+async def prepare_exclusions():
+    """Исключённые пользователи, забаненные до попадания в EXCLUDED_EMAILS: путь полного восстановления."""
+    async with database.get_db() as db:
+        await db.execute(f"UPDATE Users SET Approve=FALSE, Banned=TRUE, WasApproved=TRUE WHERE UserID % {EXCLUDED_EVERY} = 0")
+        await db.commit()
+
+
+async def measure(title: str, fake: FakeBotApi, coro):
+    fake.reset()
+    started = time.perf_counter()
+    await coro
+    elapsed = time.perf_counter() - started
+    calls = fake.total_calls
+    methods = ", ".join(f"{method}={count}" for method, count in sorted(fake.calls.items()))
+    print(f"{title:<28} {elapsed:8.2f} s  запросов={calls:<7} {calls / elapsed:8.1f} req/s  {methods}")
+
+
+async def main():
+    logger.setLevel(logging.ERROR)
+
+    fake = FakeBotApi(LATENCY_MS)
+    runner, _ = await fake.start(port=PORT)
+    await database.initialize_db()
+    bot = create_bot()
+    try:
+        in_file = await seed()
+        print(f"пользователей: {USER_COUNT}, в файле импорта: {in_file}, групп: {GROUP_COUNT}, "
+              f"задержка API: {LATENCY_MS:g} мс, лимиты: {TG_GLOBAL_RPS:g}/{TG_CHAT_RPS:g} rps")
+
+        await measure("import.main + уведомления", fake, import_job.main())
+        await prepare_cleaner()
+        await measure("cleaner.main", fake, cleaner.main())
+        await prepare_exclusions()
+        await measure("exclusions.check_exclusions", fake, exclusions.check_exclusions(bot))
+    finally:
+        await bot.session.close()
+        await database.close_db()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пикового RSS пакетного прохода по Users: fetchall() против iter_rows/iter_users.
+
+Создаёт во временной директории базу на N пользователей (по умолчанию 1 000 000).
+Каждый режим запускается в отдельном процессе, который читает UserID и Email
+всех пользователей и пишет их в CSV (/dev/null), как export_all_emails.py.
+Печатается пиковый RSS процесса (ru_maxrss) и время прохода.
+Страницы файла БД, прочитанные через mmap (DB_MMAP_SIZE), тоже входят в RSS;
+чтобы сравнить только память Python-объектов, запускайте с DB_MMAP_SIZE=0.
+
+    python scripts/bench_batch_memory.py [кол-во_пользователей]
+"""
+import os
+import sys
+import csv
+import time
+import asyncio
+import logging
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+if "--child" not in sys.argv:
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_memory_"), "bench.db")
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": "-100",
+    "MAINTENANCE_MODE": "1",
+}.items():
+    os.environ.setdefault(var, value)
+
+from config import logger
+import database
+
+MODES = ["baseline", "fetchall", "iter_rows", "iter_users"]
+QUERY = "SELECT UserID, Email FROM Users WHERE Email IS NOT NULL AND Email != ''"
+
+
+async def child(mode: str):
+    logger.setLevel(logging.WARNING)
+    await database.open_pool(1)
+    started = time.perf_counter()
+    count = 0
+    async with database.get_db() as db:
+        with open(os.devnull, "w", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            if mode == "fetchall":
+                cursor = await db.execute(QUERY)
+                for user_id, email in await cursor.fetchall():
+                    writer.writerow([user_id, email])
+                    count += 1
+            elif mode == "iter_rows":
+                async for user_id, email in database.iter_rows(db, QUERY):
+                    writer.writerow([user_id, email])
+                    count += 1
+            elif mode == "iter_users":
+                async for user_id, email in database.iter_users(db, "UserID, Email", "Email IS NOT NULL AND Email != ''"):
+                    writer.writerow([user_id, email])
+                    count += 1
+    elapsed = time.perf_counter() - started
+    await database.close_db()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:<11} rows={count:<8} peak_rss={peak_mb:8.1f} MB  time={elapsed:6.2f} s")
+
+
+async def seed(user_count: int):
+    logger.setLevel(logging.WARNING)
+    await database.initialize_db()
+    async with database.get_db() as db:
+        batch = 50000
+        for start in range(1, user_count + 1, batch):
+            await db.executemany(
+                "INSERT INTO Users (UserID, Email, Approve, WasApproved, Synced) VALUES (?, ?, 1, 1, 1)",
+                ((uid, f"user{uid}@example.com") for uid in range(start, min(start + batch, user_count + 1)))
+            )
+        await db.commit()
+    await database.close_db()
+
+
+def main():
+    if "--child" in sys.argv:
+        asyncio.run(child(sys.argv[sys.argv.index("--child") + 1]))
+        return
+
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    asyncio.run(seed(user_count))
+    print(f"Пользователей в базе: {user_count}")
+    for mode in MODES:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк проверки членства и банов cleaner.py против локального fake Bot API.
+
+Поднимает scripts/fake_bot_api.py в том же процессе, создаёт во временной базе N
+неподтверждённых пользователей и M групп и прогоняет их:
+  1) последовательно (как раньше: пользователь за пользователем, группа за группой);
+  2) через BanEngine с лимитами TG_GLOBAL_RPS / TG_CHAT_RPS;
+  3) через BanEngine без лимитов (потолок параллельности);
+  4) через BanEngine без лимитов, когда сервер отвечает 429 на каждый 50-й запрос;
+  5) то же с начальным лимитом 100 rps: TelegramClient снижает его после каждого 429;
+  6) конвейером на каждую группу (BanEngine.run_groups, как в cleaner.py) с лимитами;
+  7) через BanEngine с индексом ChatMembership, заполненным как будто из обновлений chat_member
+     (Bot API нужен только для банов).
+Печатает время, запросы к API и запросы в секунду. MAINTENANCE_MODE=0: баны реально уходят на fake-сервер.
+
+    python scripts/bench_cleaner.py [пользователей=300] [групп=5] [задержка_мс=50]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_cleaner_")
+os.environ["DB_PATH"] = os.path.join(TMP_DIR, "bench.db")
+os.environ["MAINTENANCE_MODE"] = "0"
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": "-100",
+}.items():
+    os.environ.setdefault(var, value)
+
+from config import logger, TG_GLOBAL_RPS, TG_CHAT_RPS
+import database
+from utils.ban_engine import BanEngine
+from utils.tg_client import create_bot, TelegramClient
+from utils.membership import MembershipIndex, UPSERT_SQL
+from scripts.fake_bot_api import FakeBotApi
+
+GROUP_BASE = -1000000
+# Обработчиков пользователей в пуле «по пользователям» (прежняя схема cleaner.py до конвейера на группу)
+USER_WORKERS = 16
+
+
+async def seed(user_count: int):
+    async with database.get_db() as db:
+        await db.executemany(
+            "INSERT INTO Users (UserID, Email, EmailNorm, Approve, Banned) VALUES (?, ?, ?, FALSE, FALSE)",
+            [(uid, f"user{uid}@example.com", f"user{uid}@example.com") for uid in range(1, user_count + 1)]
+        )
+        await db.commit()
+
+
+async def reset_banned():
+    async with database.get_db() as db:
+        await db.execute("UPDATE Users SET Banned=FALSE")
+        await db.commit()
+
+
+async def run_sequential(bot, chat_ids: list[int]) -> tuple[int, int, str]:
+    """Прежний алгоритм cleaner.py: по одному запросу за раз."""
+    removed = calls = 0
+    async with database.get_db() as db:
+        async for user_id, _ in database.iter_users(db, "UserID, Email", "Approve=FALSE AND Banned=FALSE"):
+            for chat_id in chat_ids:
+                calls += 1
+                member = await bot.get_chat_member(chat_id, user_id)
+                if member.status in ['member', 'administrator', 'creator']:
+                    calls += 1
+                    await bot.ban_chat_member(chat_id, user_id)
+                    removed += 1
+            await db.execute("UPDATE Users SET Banned=TRUE WHERE UserID=?", (user_id,))
+            await db.commit()
+    return removed, calls, ""
+
+
+async def seed_membership(user_count: int, chat_ids: list[int]):
+    """Заполняет ChatMembership так, как его заполнили бы обновления chat_member."""
+    async with database.get_db() as db:
+        await db.executemany(UPSERT_SQL, [
+            (chat_id, uid, "member" if FakeBotApi.is_member(chat_id, uid) else "left")
+            for uid in range(1, user_count + 1) for chat_id in chat_ids
+        ])
+        await db.commit()
+
+
+async def remove_from_chats(engine: BanEngine, user_id: int, user_email: str, chat_ids: list[int],
+                            group_titles: dict[int, str], tag: str) -> dict[int, bool]:
+    """Удаляет пользователя из всех chat_ids параллельно. Возвращает {chat_id: был ли удалён}."""
+    known = await engine.index.fresh_statuses(user_id) if engine.index is not None else None
+    results = await asyncio.gather(*(
+        engine.remove(chat_id, user_id, user_email, group_titles.get(chat_id, f"Group_{chat_id}"), tag, known)
+        for chat_id in chat_ids
+    ))
+    return dict(zip(chat_ids, results))
+
+
+async def run_engine(engine: BanEngine, chat_ids: list[int], use_index: bool = False) -> tuple[int, int, str]:
+    removed = 0
+    titles = {chat_id: f"Group_{chat_id}" for chat_id in chat_ids}
+    async with database.get_db() as db:
+        if use_index:
+            engine.index = MembershipIndex(db)
+
+        async def clean_user(row):
+            nonlocal removed
+            user_id, email = row
+            results = await remove_from_chats(engine, user_id, email, chat_ids, titles, "bench")
+            removed += sum(results.values())
+            if engine.index is not None:
+                await engine.index.flush()
+            await db.execute("UPDATE Users SET Banned=TRUE WHERE UserID=?", (user_id,))
+            await db.commit()
+
+        await engine.run(database.iter_users(db, "UserID, Email", "Approve=FALSE AND Banned=FALSE"), clean_user, USER_WORKERS)
+    client = engine.client
+    return removed, engine.api_calls, f"повторов={client.retries} 429={client.floods} лимит={client.limiter.rate:g} rps"
+
+
+async def run_groups(engine: BanEngine, chat_ids: list[int]) -> tuple[int, int, str]:
+    """Конвейер на группу: каждая группа обходит всех пользователей своим пулом."""
+    titles = {chat_id: f"Group_{chat_id}" for chat_id in chat_ids}
+    async with database.get_db() as db:
+        async def clean_group(chat_id, progress):
+            async def remove_user(row):
+                user_id, email = row
+                progress.add(await engine.remove(chat_id, user_id, email, titles[chat_id], "bench"))
+
+            await engine.run(database.iter_users(db, "UserID, Email", "Approve=FALSE AND Banned=FALSE"),
+                             remove_user, engine.group_workers)
+
+        groups = await engine.run_groups({chat_id: 0 for chat_id in chat_ids}, titles, clean_group, "bench")
+        await db.execute("UPDATE Users SET Banned=TRUE WHERE Approve=FALSE")
+        await db.commit()
+    client = engine.client
+    return sum(group.removed for group in groups), engine.api_calls, \
+        f"повторов={client.retries} 429={client.floods} лимит={client.limiter.rate:g} rps"
+
+
+async def measure(title: str, fake: FakeBotApi, coro) -> None:
+    fake.banned.clear()
+    await reset_banned()
+    started = time.perf_counter()
+    removed, calls, extra = await coro
+    elapsed = time.perf_counter() - started
+    async with database.get_db() as db:
+        left = await database.count_users(db, "Banned=FALSE")
+    print(f"{title:<28} {elapsed:7.2f} s  удалений={removed:<5} запросов={calls:<6} "
+          f"{calls / elapsed:7.1f} req/s  не помечено Banned: {left}  {extra}")
+
+
+async def main():
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    group_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 50.0
+    logger.setLevel(logging.ERROR)
+
+    fake = FakeBotApi(latency_ms)
+    runner, base_url = await fake.start()
+    bot = create_bot(api_server=base_url)
+
+    await database.initialize_db()
+    chat_ids = [GROUP_BASE - i for i in range(group_count)]
+    try:
+        await seed(user_count)
+        print(f"пользователей: {user_count}, групп: {group_count}, задержка API: {latency_ms:g} мс, "
+              f"обработчиков: {USER_WORKERS}")
+
+        await measure("последовательно", fake, run_sequential(bot, chat_ids))
+        await measure(f"BanEngine {TG_GLOBAL_RPS:g}/{TG_CHAT_RPS:g} rps", fake,
+                      run_engine(BanEngine(TelegramClient(bot), simulate=False), chat_ids))
+        await measure("BanEngine без лимитов", fake,
+                      run_engine(BanEngine(TelegramClient(bot, 0, 0), simulate=False), chat_ids))
+        fake.flood_every = 50
+        await measure("BanEngine без лимитов, 429", fake,
+                      run_engine(BanEngine(TelegramClient(bot, 0, 0), simulate=False), chat_ids))
+        await measure("BanEngine 100 rps, 429", fake,
+                      run_engine(BanEngine(TelegramClient(bot, 100, 0), simulate=False), chat_ids))
+        fake.flood_every = 0
+        await measure(f"группы {TG_GLOBAL_RPS:g}/{TG_CHAT_RPS:g} rps", fake,
+                      run_groups(BanEngine(TelegramClient(bot), simulate=False), chat_ids))
+        await seed_membership(user_count, chat_ids)
+        await measure(f"BanEngine {TG_GLOBAL_RPS:g}/{TG_CHAT_RPS:g} + индекс", fake,
+                      run_engine(BanEngine(TelegramClient(bot), simulate=False), chat_ids, use_index=True))
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+        await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
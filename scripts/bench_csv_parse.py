@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк разбора файла active_users_*.csv: прежний parse_csv_users (csv.Sniffer + csv.DictReader,
+set[int]) против потокового разбора в IdSet (utils.file_ops.parse_csv_users) и чтения снимка импорта
+через mmap (utils.snapshots) на 10k, 100k и 1M строк.
+
+Для каждого размера печатает время разбора, пик памяти и объём результата (tracemalloc; страницы
+снимка в mmap принадлежат кэшу ОС и в объём не входят),
+а также время разности с предыдущей выгрузкой (1% изменений) и 100 000 проверок вхождения.
+Часть строк в файлах некорректна, чтобы было видно цену их обработки.
+
+    python scripts/bench_csv_parse.py [строк ...]   # по умолчанию 10000 100000 1000000
+"""
+import os
+import sys
+import csv
+import time
+import random
+import logging
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_csv_parse_")
+os.environ["DB_PATH"] = os.path.join(TMP_DIR, "bench.db")
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": "-100",
+    "MAINTENANCE_MODE": "1",
+}.items():
+    os.environ.setdefault(var, value)
+
+from config import logger
+from utils.file_ops import parse_csv_users, IMPORT_DIR
+from utils.snapshots import write_snapshot, load_snapshot, snapshot_path
+
+ROW_COUNTS = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+# Каждая 10000-я строка некорректна
+BAD_EVERY = 10000
+LOOKUPS = 100000
+
+
+def parse_csv_users_dictreader(filename: str) -> set[int]:
+    """Прежняя реализация: Sniffer, DictReader, словарь на строку и предупреждение на каждую плохую строку."""
+    filepath = Path(IMPORT_DIR) / filename
+    user_ids = set()
+    with filepath.open("r", encoding="utf-8") as f:
+        sample = f.read(1024)
+        f.seek(0)
+        dialect = csv.Sniffer().sniff(sample)
+        reader = csv.DictReader(f, delimiter=dialect.delimiter)
+        for row in reader:
+            try:
+                user_ids.add(int(row['UserID']))
+            except (ValueError, KeyError):
+                logger.warning(f"Некорректная строка: {row}")
+    return user_ids
+
+
+def write_file(filename: str, user_ids: list[int]):
+    with open(os.path.join(IMPORT_DIR, filename), "w", encoding="utf-8") as f:
+        f.write("UserID;Email\n")
+        for i, uid in enumerate(user_ids, start=1):
+            if i % BAD_EVERY == 0:
+                f.write(f"n/a;user{uid}@example.com\n")
+            else:
+                f.write(f"{uid};user{uid}@example.com\n")
+
+
+def measure(parse, filename: str):
+    """(результат, время разбора, пик памяти, объём результата) — время замеряется без tracemalloc."""
+    started = time.perf_counter()
+    parse(filename)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    result = parse(filename)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak, retained
+
+
+def timed(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def lookups(ids, probes):
+    return sum(1 for probe in probes if probe in ids)
+
+
+def read_snapshot(filename: str):
+    return load_snapshot(snapshot_path(filename))
+
+
+def main():
+    # Разбор пишет в лог каждую плохую строку — оставляем только ошибки, чтобы не мерить вывод
+    logger.setLevel(logging.ERROR)
+    os.chdir(TMP_DIR)
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    rng = random.Random(1)
+
+    for rows in ROW_COUNTS:
+        # Выгрузка в произвольном порядке id и предыдущая, отличающаяся на 1%
+        current = rng.sample(range(1, rows * 20), rows)
+        churn = max(rows // 100, 1)
+        previous = current[churn:] + rng.sample(range(rows * 20, rows * 21), churn)
+        write_file("current.csv", current)
+        write_file("previous.csv", previous)
+        probes = [rng.randrange(1, rows * 21) for _ in range(LOOKUPS)]
+        for filename in ("current.csv", "previous.csv"):
+            write_snapshot(parse_csv_users(filename), filename)
+
+        print(f"строк: {rows}")
+        for title, parse in (("DictReader, set[int]", parse_csv_users_dictreader),
+                             ("поток, IdSet", parse_csv_users),
+                             ("снимок, mmap", read_snapshot)):
+            ids, elapsed, peak, retained = measure(parse, "current.csv")
+            previous_ids = parse("previous.csv")
+            diff = timed(lambda: (len(ids - previous_ids), len(previous_ids - ids)))
+            lookup = timed(lookups, ids, probes)
+            print(f"  {title:<22} разбор {elapsed:7.3f} s  пик {peak / 2**20:7.1f} МБ  "
+                  f"результат {retained / 2**20:6.1f} МБ ({retained / max(len(ids), 1):5.1f} Б/id)  "
+                  f"разность {diff:6.3f} s  {LOOKUPS} проверок {lookup:6.3f} s")
+        assert set(parse_csv_users("current.csv")) == parse_csv_users_dictreader("current.csv") == set(read_snapshot("current.csv"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк выборки по большому набору UserID: IN (?, ?, ...) против временной
+таблицы (database.temp_id_table) на наборах 1k, 50k и 500k id.
+
+Создаёт во временной директории базу на N пользователей (по умолчанию 600 000).
+Для IN-списка больше лимита переменных SQLite печатается ошибка.
+
+    python scripts/bench_id_sets.py [кол-во_пользователей]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_id_sets_"), "bench.db")
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": "-100",
+    "MAINTENANCE_MODE": "1",
+}.items():
+    os.environ.setdefault(var, value)
+
+from config import logger
+import database
+
+SET_SIZES = [1000, 50000, 500000]
+
+
+async def select_in_list(db, ids: list[int]) -> int:
+    placeholders = ",".join(["?"] * len(ids))
+    cursor = await db.execute(f"SELECT UserID, Email FROM Users WHERE UserID IN ({placeholders})", tuple(ids))
+    return len(await cursor.fetchall())
+
+
+async def select_temp_table(db, ids: list[int]) -> int:
+    async with database.temp_id_table(db, ids) as ids_table:
+        cursor = await db.execute(f"""
+            SELECT u.UserID, u.Email
+              FROM {ids_table} t
+              JOIN Users u ON u.UserID = t.ID
+        """)
+        return len(await cursor.fetchall())
+
+
+async def timed(func, db, ids) -> str:
+    started = time.perf_counter()
+    try:
+        rows = await func(db, ids)
+    except sqlite3.OperationalError as e:
+        return f"ошибка: {e}"
+    return f"{(time.perf_counter() - started) * 1000:9.1f} ms (rows={rows})"
+
+
+async def main():
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 600000
+    logger.setLevel(logging.WARNING)
+
+    await database.initialize_db()
+    async with database.get_db() as db:
+        await db.executemany(
+            "INSERT INTO Users (UserID, Email) VALUES (?, ?)",
+            ((uid, f"user{uid}@example.com") for uid in range(1, user_count + 1))
+        )
+        await db.commit()
+
+        print(f"Пользователей в базе: {user_count}")
+        for size in SET_SIZES:
+            ids = random.sample(range(1, user_count + 1), min(size, user_count))
+            print(f"\nid в наборе: {len(ids)}")
+            print(f"  IN (?, ...)       {await timed(select_in_list, db, ids)}")
+            print(f"  temp_id_table     {await timed(select_temp_table, db, ids)}")
+            await db.rollback()
+    await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
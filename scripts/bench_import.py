@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сверки импорта на синтетической базе: полная reconcile_import против reconcile_import_delta.
+
+Создаёт во временной директории базу на N пользователей (по умолчанию 100 000),
+формирует список активных сотрудников (часть верифицированных «уволена»,
+часть забаненных «вернулась») и замеряет время reconcile_import, затем — время
+дельта-сверки для обычного дня (DAILY_CHANGES пропавших и столько же появившихся user_id).
+
+    python scripts/bench_import.py [кол-во_пользователей]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_import_")
+os.environ["DB_PATH"] = os.path.join(TMP_DIR, "bench.db")
+# Каждый сотый пользователь — в списке исключений
+os.environ["EXCLUDED_EMAILS"] = ",".join(f" User{uid}@Example.com" for uid in range(100, 100001, 100))
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": "-100",
+    "MAINTENANCE_MODE": "1",
+}.items():
+    os.environ.setdefault(var, value)
+
+from config import logger
+import database
+from utils.import_logic import reconcile_import, reconcile_import_delta
+
+DAILY_CHANGES = 50
+
+
+async def seed(user_count: int) -> set[int]:
+    """Заполняет Users и возвращает набор UserID для файла импорта."""
+    rows = []
+    active_user_ids = set()
+    for uid in range(1, user_count + 1):
+        r = random.random()
+        if r < 0.90:
+            approve, banned = 1, 0
+            if random.random() < 0.97:
+                active_user_ids.add(uid)       # остаётся в компании
+        elif r < 0.98:
+            approve, banned = 0, 1
+            if random.random() < 0.10:
+                active_user_ids.add(uid)       # вернулся в компанию
+        else:
+            approve, banned = 0, 0
+        rows.append((uid, f"User{uid}@Example.com", f"user{uid}@example.com", approve, 1, 1, banned))
+    async with database.get_db() as db:
+        await db.executemany("""
+            INSERT INTO Users (UserID, Email, EmailNorm, Approve, WasApproved, Synced, Banned)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        await db.commit()
+    return active_user_ids
+
+
+async def main():
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logger.setLevel(logging.WARNING)
+
+    await database.initialize_db()
+    try:
+        active_user_ids = await seed(user_count)
+
+        started = time.perf_counter()
+        changed, restored, protected, unbanned = await reconcile_import(active_user_ids)
+        elapsed = time.perf_counter() - started
+
+        print(f"пользователей: {user_count}, в файле импорта: {len(active_user_ids)}")
+        print(f"уволено: {len(changed)}, восстановлено: {len(restored)}, "
+              f"защищено: {len(protected)}, разбанено: {len(unbanned)}")
+        print(f"reconcile_import: {elapsed:.3f} s")
+
+        # Повторная сверка с тем же списком ничего не должна менять
+        started = time.perf_counter()
+        again = await reconcile_import(active_user_ids)
+        elapsed = time.perf_counter() - started
+        print(f"повторный запуск: {elapsed:.3f} s, изменений: {sum(len(part) for part in again)}")
+
+        # Обычный день: несколько десятков увольнений и выходов на работу
+        removed = random.sample(sorted(active_user_ids), DAILY_CHANGES)
+        added = random.sample(sorted(set(range(1, user_count + 1)) - active_user_ids), DAILY_CHANGES)
+        started = time.perf_counter()
+        changed, restored, _, _ = await reconcile_import_delta(removed, added)
+        elapsed = time.perf_counter() - started
+        print(f"reconcile_import_delta ({DAILY_CHANGES}/{DAILY_CHANGES}): {elapsed:.3f} s, "
+              f"уволено: {len(changed)}, восстановлено: {len(restored)}")
+    finally:
+        await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
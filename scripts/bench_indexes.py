@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк планов и времени запросов cron-скриптов до и после миграций с индексами.
+
+Создаёт во временной директории базу на N пользователей (по умолчанию 200 000),
+снимает EXPLAIN QUERY PLAN и время каждого запроса без индексов,
+затем применяет миграции и повторяет замеры.
+
+    python scripts/bench_indexes.py [кол-во_пользователей]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_indexes_")
+os.environ["DB_PATH"] = os.path.join(TMP_DIR, "bench.db")
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": "-100",
+    "MAINTENANCE_MODE": "1",
+}.items():
+    os.environ.setdefault(var, value)
+
+from config import logger
+import database
+from utils.migrations import MIGRATIONS
+
+REPEATS = 20
+
+QUERIES = {
+    "export": ("SELECT ID, UserID, Email FROM Users WHERE Approve=TRUE AND Synced=FALSE", ()),
+    "cleaner": ("SELECT UserID FROM Users WHERE Approve=FALSE AND Banned=FALSE", ()),
+    "unban_excluded": ("SELECT UserID FROM Users WHERE Banned=TRUE", ()),
+    "recover": (
+        "SELECT UserID FROM Users WHERE EmailNorm IN (?, ?, ?)",
+        ("user10@example.com", "user20@example.com", "user30@example.com"),
+    ),
+    "new_groups": ("SELECT ChatID FROM Groups WHERE New=TRUE AND can_restrict_members=TRUE", ()),
+}
+
+
+def random_status():
+    """Распределение, похожее на рабочую базу: большинство верифицированы и синхронизированы."""
+    r = random.random()
+    if r < 0.85:
+        return 1, 1, 1, 0   # Approve, WasApproved, Synced, Banned
+    if r < 0.90:
+        return 1, 1, 0, 0
+    if r < 0.98:
+        return 0, 1, 1, 1
+    return 0, 1, 1, 0
+
+
+async def seed(db, user_count: int):
+    rows = []
+    for uid in range(1, user_count + 1):
+        approve, was_approved, synced, banned = random_status()
+        rows.append((uid, f"User{uid}@Example.com", f"user{uid}@example.com", approve, was_approved, synced, banned))
+    await db.executemany("""
+        INSERT INTO Users (UserID, Email, EmailNorm, Approve, WasApproved, Synced, Banned)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    await db.executemany("""
+        INSERT INTO Groups (ChatID, Title, can_restrict_members, New) VALUES (?, ?, ?, ?)
+    """, [(-1000 - i, f"Group {i}", i % 3 != 0, i % 10 == 0) for i in range(2000)])
+    await db.commit()
+
+
+async def measure(db, title: str):
+    print(f"\n--- {title} ---")
+    for name, (query, params) in QUERIES.items():
+        cursor = await db.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        plan = "; ".join(row[3] for row in await cursor.fetchall())
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            cursor = await db.execute(query, params)
+            rows = await cursor.fetchall()
+        elapsed = (time.perf_counter() - started) / REPEATS * 1000
+        print(f"{name:<15} {elapsed:9.3f} ms  rows={len(rows):<7} {plan}")
+
+
+async def main():
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    logger.setLevel(logging.WARNING)
+
+    await database.initialize_db()
+    async with database.get_db() as db:
+        await seed(db, user_count)
+
+        # Состояние «до»: убираем индексы, созданные миграциями
+        cursor = await db.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%'")
+        for (index_name,) in await cursor.fetchall():
+            await db.execute(f"DROP INDEX {index_name}")
+        await db.commit()
+        await measure(db, f"без индексов, {user_count} пользователей")
+
+        for _, _, statements in MIGRATIONS:
+            for statement in statements:
+                # Колонки и таблицы уже созданы, повторяем только индексы
+                if statement.startswith("CREATE INDEX"):
+                    await db.execute(statement)
+        await db.commit()
+        await measure(db, f"после миграций, {user_count} пользователей")
+    await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки /start: пул соединений (initialize_db) против разового
+aiosqlite.connect на каждое сообщение.
+
+Хэндлер handle_start вызывается напрямую с заглушкой сообщения и FSM в памяти,
+поэтому Telegram не нужен. База создаётся во временной директории.
+
+    python scripts/bench_start.py [кол-во_пользователей] [кол-во_запросов]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_start_")
+os.environ["DB_PATH"] = os.path.join(TMP_DIR, "bench.db")
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": "-100",
+    "MAINTENANCE_MODE": "1",
+}.items():
+    os.environ.setdefault(var, value)
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import logger
+import database
+from handlers.start_handler import handle_start
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"user{user_id}"
+        self.first_name = "Bench"
+        self.last_name = "User"
+
+
+class FakeMessage:
+    """Минимальная заглушка aiogram.types.Message для handle_start."""
+    def __init__(self, user_id: int):
+        self.from_user = FakeUser(user_id)
+
+    async def answer(self, *args, **kwargs):
+        return None
+
+
+async def seed_users(count: int):
+    async with database.get_db() as db:
+        await db.executemany(
+            "INSERT OR IGNORE INTO Users (UserID, Email, Approve, WasApproved) VALUES (?, ?, ?, ?)",
+            ((uid, f"user{uid}@example.com", uid % 2, uid % 2) for uid in range(1, count + 1))
+        )
+        await db.commit()
+
+
+async def run_series(storage: MemoryStorage, user_count: int, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        user_id = random.randint(1, user_count)
+        state = FSMContext(storage=storage, key=StorageKey(bot_id=1, chat_id=user_id, user_id=user_id))
+        started = time.perf_counter()
+        await handle_start(FakeMessage(user_id), state)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(title: str, latencies: list[float]):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{title:<22} mean={statistics.mean(latencies):7.3f} ms  "
+          f"p50={statistics.median(latencies):7.3f} ms  p99={p99:7.3f} ms")
+
+
+async def main():
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    logger.setLevel(logging.WARNING)
+
+    await database.initialize_db()
+    await seed_users(user_count)
+    storage = MemoryStorage()
+
+    # Прогрев кэша страниц ОС и SQLite
+    await run_series(storage, user_count, 100)
+
+    await database.close_db()
+    without_pool = await run_series(storage, user_count, requests)
+
+    await database.open_pool()
+    with_pool = await run_series(storage, user_count, requests)
+    await database.close_db()
+
+    print(f"/start x{requests}, пользователей в базе: {user_count}")
+    report("без пула (connect)", without_pool)
+    report("с пулом", with_pool)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
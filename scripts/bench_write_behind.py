@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест групповой записи (write-behind) на всплеске /start от новых пользователей.
+
+Хэндлер handle_start вызывается напрямую с заглушкой сообщения и FSM в памяти
+для N новых пользователей при заданной конкуррентности: сначала с прямой записью
+(commit на каждый INSERT), затем через queue_write. Печатает commits/sec, rows/sec
+и задержку хэндлера. База создаётся во временной директории.
+
+    python scripts/bench_write_behind.py [кол-во_пользователей] [конкуррентность]
+    DB_SYNCHRONOUS=FULL python scripts/bench_write_behind.py   # с fsync на каждый commit
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_write_behind_")
+os.environ["DB_PATH"] = os.path.join(TMP_DIR, "bench.db")
+for var, value in {
+    "TELEGRAM_API_TOKEN": "123456:bench",
+    "WORK_MAIL": "example.com",
+    "UNI_EMAIL": "bench@example.com",
+    "COMPANY_CHANNEL_ID": "-100",
+    "MAINTENANCE_MODE": "1",
+}.items():
+    os.environ.setdefault(var, value)
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import logger
+import database
+from handlers.start_handler import handle_start
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"user{user_id}"
+        self.first_name = "Bench"
+        self.last_name = "User"
+
+
+class FakeMessage:
+    """Минимальная заглушка aiogram.types.Message для handle_start."""
+    def __init__(self, user_id: int):
+        self.from_user = FakeUser(user_id)
+
+    async def answer(self, *args, **kwargs):
+        return None
+
+
+async def run_burst(storage: MemoryStorage, user_ids: range, concurrency: int) -> tuple[list[float], float, int]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failed = 0
+
+    async def one(user_id: int):
+        async with semaphore:
+            state = FSMContext(storage=storage, key=StorageKey(bot_id=1, chat_id=user_id, user_id=user_id))
+            started = time.perf_counter()
+            await handle_start(FakeMessage(user_id), state)
+            latencies.append((time.perf_counter() - started) * 1000)
+            # read-your-writes: сразу после ответа пользователь уже виден в базе,
+            # иначе INSERT не прошёл (handle_start логирует ошибку и отвечает пользователю)
+            if await database.get_user_status(user_id) is None:
+                nonlocal failed
+                failed += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(user_id) for user_id in user_ids))
+    return latencies, time.perf_counter() - started, failed
+
+
+def report(title: str, latencies: list[float], elapsed: float, commits: int, failed: int):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    rows = len(latencies) - failed
+    print(f"{title:<14} {rows / elapsed:8.0f} rows/s  {commits / elapsed:8.0f} commits/s  "
+          f"p50={statistics.median(latencies):7.2f} ms  p99={p99:7.2f} ms  не записано: {failed}")
+
+
+async def main():
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    # handle_start логирует каждую неудачную запись как ERROR, в отчёте они считаются отдельно
+    logger.setLevel(logging.CRITICAL)
+
+    await database.initialize_db()
+    storage = MemoryStorage()
+    try:
+        direct_latencies, direct_elapsed, direct_failed = await run_burst(
+            storage, range(1, user_count + 1), concurrency
+        )
+
+        database.start_write_behind()
+        batched_latencies, batched_elapsed, batched_failed = await run_burst(
+            storage, range(user_count + 1, 2 * user_count + 1), concurrency
+        )
+        stats = database.write_behind_stats()
+    finally:
+        await database.close_db()
+
+    print(f"/start x{user_count} новых пользователей, конкуррентность {concurrency}, "
+          f"synchronous={os.getenv('DB_SYNCHRONOUS', 'NORMAL')}")
+    report("прямая запись", direct_latencies, direct_elapsed, user_count - direct_failed, direct_failed)
+    report("write-behind", batched_latencies, batched_elapsed, stats["commits"], batched_failed)
+    print(f"write-behind: {stats['rows']} записей в {stats['commits']} транзакциях, ошибок {stats['errors']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Локальный fake-сервер Telegram Bot API для бенчмарков пакетных скриптов.
+
+Отвечает на getMe, getChatMember, banChatMember, unbanChatMember, sendMessage, createChatInviteLink,
+getChatMemberCount и getChat с заданной задержкой.
+Членство детерминированное: пользователь состоит в чате, если (user_id + chat_id) % MEMBER_MOD == 0;
+сам бот (id из токена, как в aiogram) — администратор любого чата. 429 с retry_after можно получить двумя способами:
+каждый N-й запрос (flood_every) или превышение max_rps запросов за последнюю секунду (как у Telegram).
+
+    python scripts/fake_bot_api.py [порт] [задержка_мс] [429_каждый_N] [max_rps]
+    TELEGRAM_API_SERVER=http://127.0.0.1:8081 python cleaner.py
+"""
+import sys
+import json
+import time
+import asyncio
+from collections import deque
+from aiohttp import web
+
+MEMBER_MOD = 10
+
+
+class FakeBotApi:
+    def __init__(self, latency_ms: float = 50.0, flood_every: int = 0, retry_after: int = 1,
+                 max_rps: float = 0, member_count: int = 1000):
+        self.latency_ms = latency_ms
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self.member_count = member_count
+        self.calls: dict[str, int] = {}
+        self.banned: set[tuple[int, int]] = set()
+        self.messages: dict[int, int] = {}
+        self._total = 0
+        self._recent: deque[float] = deque()
+
+    @staticmethod
+    def is_member(chat_id: int, user_id: int) -> bool:
+        return (user_id + chat_id) % MEMBER_MOD == 0
+
+    def reset(self):
+        """Сбрасывает счётчики, баны и отправленные сообщения между замерами."""
+        self.calls.clear()
+        self.banned.clear()
+        self.messages.clear()
+        self._total = 0
+        self._recent.clear()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def _flooded(self, number: int) -> bool:
+        if self.flood_every and number % self.flood_every == 0:
+            return True
+        if self.max_rps:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_rps:
+                return True
+            self._recent.append(now)
+        return False
+
+    @staticmethod
+    def _user(user_id: int, is_bot: bool = False) -> dict:
+        return {"id": user_id, "is_bot": is_bot, "first_name": f"User{user_id}",
+                "last_name": "Fake", "username": f"user{user_id}"}
+
+    @staticmethod
+    def _chat(chat_id: int) -> dict:
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}",
+                    "last_name": "Fake", "username": f"user{chat_id}"}
+        return {"id": chat_id, "type": "supergroup", "title": f"Group_{chat_id}"}
+
+    async def _params(self, request: web.Request) -> dict:
+        params = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+        return params
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        bot_id = int(request.match_info["token"].split(":")[0])
+        params = await self._params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self._total += 1
+        number = self._total
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        if self._flooded(number):
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        if method == "getMe":
+            result = {"id": bot_id, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        elif method == "getChatMember":
+            chat_id, user_id = int(params["chat_id"]), int(params["user_id"])
+            if user_id == bot_id:
+                result = {"status": "administrator", "user": self._user(user_id, True), "can_be_edited": False,
+                          "is_anonymous": False, "can_manage_chat": True, "can_delete_messages": True,
+                          "can_manage_video_chats": True, "can_restrict_members": True,
+                          "can_promote_members": False, "can_change_info": True, "can_invite_users": True,
+                          "can_post_stories": False, "can_edit_stories": False, "can_delete_stories": False}
+            else:
+                member = self.is_member(chat_id, user_id) and (chat_id, user_id) not in self.banned
+                result = {"status": "member" if member else "left", "user": self._user(user_id)}
+        elif method == "banChatMember":
+            self.banned.add((int(params["chat_id"]), int(params["user_id"])))
+            result = True
+        elif method == "unbanChatMember":
+            self.banned.discard((int(params["chat_id"]), int(params["user_id"])))
+            result = True
+        elif method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            self.messages[chat_id] = self.messages.get(chat_id, 0) + 1
+            result = {"message_id": number, "date": int(time.time()), "chat": self._chat(chat_id),
+                      "text": params.get("text", "")}
+        elif method == "createChatInviteLink":
+            result = {"invite_link": f"https://t.me/+fake{number}", "creator": self._user(bot_id, True),
+                      "creates_join_request": False, "is_primary": False, "is_revoked": False,
+                      "member_limit": int(params.get("member_limit", 1))}
+        elif method == "getChatMemberCount":
+            result = self.member_count
+        elif method == "getChat":
+            result = {**self._chat(int(params["chat_id"])), "accent_color_id": 0, "max_reaction_count": 11}
+        else:
+            return web.json_response(
+                {"ok": False, "error_code": 404, "description": f"Not Found: method {method}"}, status=404
+            )
+        return web.Response(text=json.dumps({"ok": True, "result": result}), content_type="application/json")
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+        """Запускает сервер в текущем event loop. Возвращает (runner, базовый URL для TELEGRAM_API_SERVER)."""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+    flood_every = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    max_rps = float(sys.argv[4]) if len(sys.argv) > 4 else 0
+    web.run_app(FakeBotApi(latency_ms, flood_every, max_rps=max_rps).app(), host="127.0.0.1", port=port)
@@ -5,6 +5,7 @@ import asyncio
 import random
 import datetime
 import csv
+import gzip
 from pathlib import Path
 import time
 from dotenv import load_dotenv
@@ -51,9 +52,9 @@ async def add_fake_user():
 
     async with aiosqlite.connect(DB_PATH) as db:
         await db.execute("""
-            INSERT INTO Users (UserID, Email, Approve, WasApproved, Synced, Notified, Banned)
-            VALUES (?, ?, ?, ?, 0, 0, 0)
-        """, (user_id, plain_email, approve, was_approved))
+            INSERT INTO Users (UserID, Email, EmailNorm, Approve, WasApproved, Synced, Notified, Banned)
+            VALUES (?, ?, ?, ?, ?, 0, 0, 0)
+        """, (user_id, plain_email, plain_email, approve, was_approved))
         await db.commit()
 
     masked_email = mask_email(plain_email)
@@ -64,14 +65,14 @@ async def add_fake_user():
 # -------------------------
 async def simulate_company_actions():
     """
-    - Забираем все export_*.csv из папки EXPORT_DIR,
+    - Забираем все export_*.csv (и .csv.gz) из папки EXPORT_DIR,
     - Обновляем таблицу Company,
     - Пытаемся уволить (удалить) некую часть сотрудников:
          Если увольнение (n) не превышает 30% от общего числа, реально удаляем.
          Если n > 30%, то не меняем таблицу, а для итогового файла выбираем случайную выборку из (total - n).
     - Формируем файл active_users_YYYYmmDD.csv в папке IMPORT_DIR.
     """
-    exports = sorted(Path(EXPORT_DIR).glob("export_*.csv"))
+    exports = sorted(Path(EXPORT_DIR).glob("export_*.csv*"))
     if not exports:
         print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] No export files found.")
         return
@@ -81,7 +82,8 @@ async def simulate_company_actions():
         await ensure_company_table()
 
         for file in exports:
-            with file.open("r", encoding="utf-8") as f:
+            opener = gzip.open if file.suffix == ".gz" else open
+            with opener(file, "rt", encoding="utf-8") as f:
                 reader = csv.DictReader(f, delimiter=";")
                 # Ожидаем поля: UserID, Email
                 for row in reader:
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Что происходило с пользователем: действия import.py, cleaner.py и exclusions.py
+из журнала SyncAction (поиск по индексу UserID, новые первыми).
+
+    python scripts/user_history.py <user_id> [лимит=100]
+"""
+import os
+import sys
+import asyncio
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_db, run_job
+from utils.sync_log import get_user_actions
+
+
+async def main():
+    user_id = int(sys.argv[1])
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    async with get_db() as db:
+        rows = await get_user_actions(db, user_id, limit)
+    if not rows:
+        print(f"Для user_id={user_id} действий в SyncAction нет.")
+        return
+    for sync_date, sync_type, filename, chat_id, action, result in rows:
+        chat = f" чат {chat_id}" if chat_id is not None else ""
+        details = f" ({result})" if result else ""
+        print(f"{sync_date}  {sync_type:<16} {action}{details}{chat}  [{filename}]")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(run_job(main))
@@ -0,0 +1,205 @@
+# utils/ban_engine.py
+
+import time
+import asyncio
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from config import logger, MAINTENANCE_MODE, CLEANER_GROUP_WORKERS
+from utils.tg_client import TelegramClient, TRANSIENT_ERRORS
+from utils.membership import MembershipIndex, PRESENT_STATUSES
+
+
+class GroupProgress:
+    """Прогресс одной группы в BanEngine.run_groups: обработано задач, удалено, время обработки."""
+
+    def __init__(self, chat_id: int, title: str, total: int, tag: str):
+        self.chat_id = chat_id
+        self.title = title
+        self.total = total
+        self.tag = tag
+        self.done = 0
+        self.removed = 0
+        self.started = time.monotonic()
+        self.elapsed: float | None = None
+        self._step = max(total // 10, 1)
+
+    def add(self, removed: bool):
+        self.done += 1
+        self.removed += removed
+        if self.done % self._step == 0 and self.done < self.total:
+            logger.info(f"[{self.tag}] Группа {self.chat_id}:{self.title}: {self.done}/{self.total}, удалено {self.removed}")
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started
+        logger.info(f"[{self.tag}] Группа {self.chat_id}:{self.title} обработана за {self.elapsed:.1f} с: "
+                    f"задач {self.done}, удалено {self.removed}")
+
+
+class BanEngine:
+    """
+    Проверка членства и бан пользователей в чатах для cleaner.py.
+    Все запросы к Bot API идут через общий TelegramClient (лимит на чат и общий лимит, 429, повторы).
+    Основной режим — конвейер на каждую группу (см. run_groups): группы обрабатываются одновременно,
+    каждая своим пулом, поэтому большая группа не ждёт маленькие, а лимиты на чат используются параллельно.
+    С index (MembershipIndex) членство берётся из ChatMembership, а Bot API спрашивается
+    только для отсутствующих или устаревших записей; результаты живых проверок и баны
+    записываются обратно в индекс.
+    Если запрос не удался и после всех повторов (429 или временная ошибка), исключение
+    пробрасывается и останавливает пул: прогон продолжится со следующего запуска, а бан не потеряется.
+    """
+
+    def __init__(self, client: TelegramClient, simulate: bool | None = None,
+                 index: MembershipIndex | None = None, group_workers: int = CLEANER_GROUP_WORKERS):
+        self.client = client
+        self.group_workers = max(group_workers, 1)
+        self.simulate = MAINTENANCE_MODE == "1" if simulate is None else simulate
+        self.index = index
+
+    @property
+    def api_calls(self) -> int:
+        return self.client.calls
+
+    async def member_status(self, chat_id: int, user_id: int) -> str | None:
+        """
+        Живая проверка: статус пользователя в чате или None, если Telegram отказал
+        (пользователь или чат не найден, нет прав). Временные ошибки пробрасываются.
+        """
+        try:
+            member = await self.client.get_chat_member(chat_id, user_id)
+            return member.status
+        except (TelegramRetryAfter, *TRANSIENT_ERRORS):
+            raise
+        except TelegramAPIError as e:
+            logger.debug(f"Не удалось проверить членство user_id={user_id} в chat_id={chat_id}: {e}")
+            return None
+
+    async def is_member(self, chat_id: int, user_id: int) -> bool:
+        """
+        Проверяет, является ли пользователь членом группы (member, administrator, creator).
+        Если не удалось получить информацию, считаем, что пользователя в группе нет.
+        """
+        return await self.member_status(chat_id, user_id) in PRESENT_STATUSES
+
+    async def _status(self, chat_id: int, user_id: int, known: dict[int, str] | None) -> str | None:
+        status = None
+        if self.index is not None:
+            status = known.get(chat_id) if known is not None else await self.index.fresh_status(chat_id, user_id)
+            self.index.count(status)
+        if status is None:
+            status = await self.member_status(chat_id, user_id)
+            if status is not None and self.index is not None:
+                self.index.record(chat_id, user_id, status)
+        return status
+
+    async def ban(self, chat_id: int, user_id: int, user_email: str, group_name: str, tag: str) -> bool:
+        """
+        Банит пользователя в чате без проверки членства (в режиме симуляции только пишет в лог):
+        для задач, где индекс уже показал, что пользователь в чате.
+        Возвращает True, если пользователь был удалён.
+        """
+        simulation = "[SIMULATION] " if self.simulate else ""
+        try:
+            if not self.simulate:
+                await self.client.ban_chat_member(chat_id, user_id)
+                if self.index is not None:
+                    self.index.record(chat_id, user_id, "kicked")
+            logger.info(f"[{tag}] {simulation}Удалён user_id={user_id}:{user_email} из чата={chat_id}:{group_name}")
+            return True
+        except (TelegramRetryAfter, *TRANSIENT_ERRORS):
+            logger.error(f"[{tag}] {simulation}Не удалось удалить user_id={user_id}:{user_email} из {chat_id}:{group_name} "
+                         f"после повторов, прогон будет остановлен")
+            raise
+        except Exception as e:
+            logger.warning(f"[{tag}] {simulation}Не удалось удалить user_id={user_id}:{user_email} из {chat_id}:{group_name}: {e}")
+            return False
+
+    async def remove(self, chat_id: int, user_id: int, user_email: str, group_name: str, tag: str,
+                     known: dict[int, str] | None = None) -> bool:
+        """
+        Удаляет пользователя из чата, если он там есть (в режиме симуляции только пишет в лог).
+        known — заранее загруженные свежие статусы пользователя в чатах из индекса ({chat_id: статус}),
+        чтобы не читать индекс на каждый чат; пустой словарь — сразу живая проверка.
+        Возвращает True, если пользователь был удалён.
+        """
+        try:
+            status = await self._status(chat_id, user_id, known)
+        except (TelegramRetryAfter, *TRANSIENT_ERRORS):
+            logger.error(f"[{tag}] Не удалось проверить user_id={user_id}:{user_email} в {chat_id}:{group_name} "
+                         f"после повторов, прогон будет остановлен")
+            raise
+        except Exception as e:
+            logger.warning(f"[{tag}] Не удалось проверить user_id={user_id}:{user_email} в {chat_id}:{group_name}: {e}")
+            return False
+        if status not in PRESENT_STATUSES:
+            logger.debug(f"[{tag}] user_id={user_id}:{user_email} не является членом чата={chat_id}:{group_name}, пропускаем")
+            return False
+        return await self.ban(chat_id, user_id, user_email, group_name, tag)
+
+    async def run(self, items, handler, workers: int):
+        """
+        Передаёт элементы асинхронного итератора items в handler(item) пулом из workers задач.
+        Ошибка handler останавливает весь пул и пробрасывается.
+        """
+        workers = max(workers, 1)
+        queue = asyncio.Queue(maxsize=workers * 2)
+        errors = []
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                if errors:
+                    continue  # после ошибки только освобождаем очередь
+                try:
+                    await handler(item)
+                except Exception as e:
+                    errors.append(e)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            async for item in items:
+                if errors:
+                    break
+                await queue.put(item)
+            for _ in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        if errors:
+            raise errors[0]
+
+    async def run_groups(self, totals: dict[int, int], titles: dict[int, str], job, tag: str) -> list[GroupProgress]:
+        """
+        Конвейер на каждую группу: job(chat_id, progress) для всех групп из totals ({chat_id: задач})
+        запускаются одновременно; внутри job обычно вызывает run(..., workers=self.group_workers).
+        Темп каждой группы ограничивает её лимит на чат, все вместе — общий лимит клиента.
+        Ошибка любой группы останавливает остальные и пробрасывается.
+        Возвращает прогресс групп с временем обработки.
+        """
+        progress = {
+            chat_id: GroupProgress(chat_id, titles.get(chat_id, f"Group_{chat_id}"), total, tag)
+            for chat_id, total in totals.items()
+        }
+
+        async def run_group(group: GroupProgress):
+            await job(group.chat_id, group)
+            group.finish()
+
+        tasks = [asyncio.create_task(run_group(group)) for group in progress.values()]
+        if not tasks:
+            return []
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        slowest = sorted(progress.values(), key=lambda group: group.elapsed or 0, reverse=True)[:5]
+        logger.info(f"[{tag}] Обработано групп: {len(progress)}, дольше всех: " +
+                    ", ".join(f"{group.chat_id}:{group.title} {group.elapsed:.1f} с" for group in slowest))
+        return list(progress.values())
@@ -0,0 +1,448 @@
+# utils/cleaner_runs.py
+
+import csv
+import asyncio
+import aiosqlite
+from config import (
+    logger,
+    DB_CHUNK_SIZE,
+    CLEANER_CHECKPOINT_USERS,
+    CLEANER_RESUME_HOURS,
+    CLEANER_FULL_SCAN_DAYS,
+    MEMBERSHIP_TTL_HOURS,
+    NEW_GROUPS_SWEEP,
+)
+from database import NOT_EXCLUDED_SQL, EXCLUDED_SQL, iter_rows
+from utils.membership import MembershipIndex, PRESENT_STATUSES
+from utils.sync_log import insert_sync_history, ACTION_REMOVED, ACTION_BANNED
+from utils.pending_bans import prune_pending_bans, SOURCE_FULL_SCAN
+
+# Фазы плана: основная очистка (пользователи очереди PendingBans с Approve=FALSE AND Banned=FALSE во всех группах)
+# и полная очистка новых групп (все Approve=FALSE в группах с New=TRUE)
+PHASE_REGULAR = "regular"
+PHASE_NEW_GROUPS = "new_groups"
+
+# Действия плана (прогноз по индексу ChatMembership на момент планирования)
+ACTION_BAN = "ban"       # пользователь в чате — бан без проверки
+ACTION_CHECK = "check"   # записи нет или она устарела — живая проверка, затем бан
+ACTION_SKIP = "skip"     # пользователя в чате нет
+
+_PRESENT_SQL = ", ".join(f"'{status}'" for status in PRESENT_STATUSES)
+
+# Действие задачи по свежей записи ChatMembership m (LEFT JOIN)
+_ACTION_SQL = f"""
+    CASE
+        WHEN m.Status IS NULL THEN '{ACTION_CHECK}'
+        WHEN m.Status IN ({_PRESENT_SQL}) THEN '{ACTION_BAN}'
+        ELSE '{ACTION_SKIP}'
+    END
+"""
+
+# Результаты задач: NULL — ещё не выполнена
+RESULT_REMOVED = "removed"   # пользователь был в чате и удалён (или удаление симулировано)
+RESULT_CHECKED = "checked"   # пользователя в чате нет либо удалить не удалось
+RESULT_SKIPPED = "skipped"   # к моменту продолжения прогона пользователь снова подтверждён или исключён
+
+# Задачи пользователей, получивших Banned=TRUE: все выполненные задачи основной фазы
+# и удаления в новых группах
+_BANNED_SQL = f"""
+    RunID=? AND ((Phase='{PHASE_REGULAR}' AND Result<>'{RESULT_SKIPPED}')
+                 OR (Phase='{PHASE_NEW_GROUPS}' AND Result='{RESULT_REMOVED}'))
+"""
+
+
+async def find_resumable_run(db: aiosqlite.Connection, simulation: bool) -> int | None:
+    """
+    Возвращает RunID незавершённого прогона, если его можно продолжить.
+    Прогоны старше CLEANER_RESUME_HOURS или в другом режиме (симуляция/рабочий) помечаются abandoned.
+    """
+    cursor = await db.execute("""
+        SELECT RunID, Simulation, StartedAt >= DATETIME('now', 'localtime', ?)
+        FROM CleanerRuns
+        WHERE Status='running'
+        ORDER BY RunID DESC
+    """, (f"-{CLEANER_RESUME_HOURS} hours",))
+    rows = await cursor.fetchall()
+
+    resumable = None
+    for run_id, run_simulation, is_recent in rows:
+        if resumable is None and is_recent and bool(run_simulation) == simulation:
+            resumable = run_id
+            continue
+        await db.execute("""
+            UPDATE CleanerRuns
+            SET Status='abandoned', FinishedAt=DATETIME('now', 'localtime')
+            WHERE RunID=?
+        """, (run_id,))
+        logger.warning(f"[cleaner] Незавершённый прогон run_id={run_id} не будет продолжен (устарел или другой режим)")
+    await db.commit()
+    return resumable
+
+
+async def needs_full_scan(db: aiosqlite.Connection) -> bool:
+    """
+    Нужна ли полная сверка всех Approve=FALSE вместо очереди PendingBans: при CLEANER_FULL_SCAN_DAYS=0
+    всегда, иначе если за CLEANER_FULL_SCAN_DAYS дней не было завершённого рабочего прогона с полной сверкой.
+    """
+    if CLEANER_FULL_SCAN_DAYS <= 0:
+        return True
+    cursor = await db.execute("""
+        SELECT 1 FROM CleanerRuns
+        WHERE FullScan=TRUE AND Status='done' AND Simulation=FALSE
+          AND StartedAt >= DATETIME('now', 'localtime', ?)
+        LIMIT 1
+    """, (f"-{CLEANER_FULL_SCAN_DAYS} days",))
+    return await cursor.fetchone() is None
+
+
+async def create_run(db: aiosqlite.Connection, simulation: bool, full_scan: bool = False) -> tuple[int, int]:
+    """
+    Создаёт прогон и его план одной транзакцией: пары (группа, пользователь) для обеих фаз
+    по группам с can_restrict_members=TRUE, с действием по индексу ChatMembership.
+    Основная фаза строится по очереди PendingBans; при full_scan в очередь сначала добавляются
+    все Approve=FALSE AND Banned=FALSE, которых там не оказалось.
+    Для новых групп (NEW_GROUPS_SWEEP=members) в план попадают только их известные участники,
+    если индекс ведёт группу дольше MEMBERSHIP_TTL_HOURS, иначе — все Approve=FALSE.
+    Возвращает (run_id, число пользователей в основной фазе).
+    """
+    max_age = f"-{MEMBERSHIP_TTL_HOURS} hours"
+    # Проверки перед прогоном (temp_id_table в check_import_users_in_db) могли оставить открытой
+    # неявную транзакцию только по temp-таблице: фиксируем её, иначе BEGIN IMMEDIATE упадёт
+    if db.in_transaction:
+        await db.commit()
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = await db.execute("""
+            INSERT INTO CleanerRuns (StartedAt, Status, Simulation, FullScan)
+            VALUES (DATETIME('now', 'localtime'), 'running', ?, ?)
+        """, (simulation, full_scan))
+        run_id = cursor.lastrowid
+
+        if full_scan:
+            # Страховка от пропусков очереди: Approve=FALSE, выставленный в обход import.py, exclusions и /start.
+            # Все источники ставят пользователей в очередь сами, поэтому каждый найденный здесь — настоящий пропуск
+            cursor = await db.execute(f"""
+                INSERT OR IGNORE INTO PendingBans (UserID, Source, EnqueuedAt)
+                SELECT UserID, ?, DATETIME('now', 'localtime') FROM Users
+                WHERE Approve=FALSE AND Banned=FALSE AND UserID IS NOT NULL AND {NOT_EXCLUDED_SQL}
+            """, (SOURCE_FULL_SCAN,))
+            if cursor.rowcount:
+                logger.warning(f"[cleaner] Полная сверка: {cursor.rowcount} пользователей не было в очереди PendingBans")
+
+        await db.execute(f"""
+            INSERT INTO CleanerTasks (RunID, Phase, ChatID, UserID, Action)
+            SELECT ?, ?, g.ChatID, Users.UserID, {_ACTION_SQL}
+            FROM PendingBans p
+            JOIN Users ON Users.UserID = p.UserID
+            CROSS JOIN Groups g
+            LEFT JOIN ChatMembership m
+                   ON m.ChatID = g.ChatID AND m.UserID = Users.UserID
+                  AND m.UpdatedAt >= DATETIME('now', 'localtime', ?)
+            WHERE Users.Approve=FALSE AND Users.Banned=FALSE AND g.can_restrict_members=TRUE
+              AND {NOT_EXCLUDED_SQL}
+        """, (run_id, PHASE_REGULAR, max_age))
+
+        # Новые группы берутся в прогон целиком: пометку New снимет clean_new_groups
+        await db.execute("""
+            INSERT INTO CleanerRunGroups (RunID, ChatID)
+            SELECT ?, ChatID FROM Groups WHERE New=TRUE AND can_restrict_members=TRUE
+        """, (run_id,))
+        # NEW_GROUPS_SWEEP=members: по известным участникам чистятся только группы, которые индекс ведёт
+        # дольше MEMBERSHIP_TTL_HOURS (самая старая запись группы старше TTL). Только что добавленную группу,
+        # по которой в ChatMembership почти ничего нет, проверяем по всем Approve=FALSE, как при all:
+        # пометка New снимается после прогона, и второго шанса у группы не будет
+        sweep_members = NEW_GROUPS_SWEEP != "all"
+        covered_sql = f"""
+            COALESCE((SELECT MIN(c.UpdatedAt) FROM ChatMembership c WHERE c.ChatID = rg.ChatID),
+                     DATETIME('now', 'localtime')) < DATETIME('now', 'localtime', ?)
+        """
+        if sweep_members:
+            cursor = await db.execute(f"""
+                SELECT COUNT(*) FROM CleanerRunGroups rg WHERE rg.RunID=? AND NOT {covered_sql}
+            """, (run_id, max_age))
+            (uncovered,) = await cursor.fetchone()
+            if uncovered:
+                logger.info(f"[cleaner] Новых групп без истории в индексе ChatMembership: {uncovered}, "
+                            f"они проверяются по всем Approve=FALSE")
+
+        # Все Approve=FALSE в каждой новой группе (при members — только в группах без истории в индексе)
+        all_filter = f"AND NOT {covered_sql}" if sweep_members else ""
+        await db.execute(f"""
+            INSERT INTO CleanerTasks (RunID, Phase, ChatID, UserID, Action)
+            SELECT ?, ?, rg.ChatID, Users.UserID, {_ACTION_SQL}
+            FROM CleanerRunGroups rg
+            CROSS JOIN Users
+            LEFT JOIN ChatMembership m
+                   ON m.ChatID = rg.ChatID AND m.UserID = Users.UserID
+                  AND m.UpdatedAt >= DATETIME('now', 'localtime', ?)
+            WHERE rg.RunID=? {all_filter} AND Users.Approve=FALSE AND {NOT_EXCLUDED_SQL}
+        """, (run_id, PHASE_NEW_GROUPS, max_age, run_id, *((max_age,) if sweep_members else ())))
+        if sweep_members:
+            # Только известные участники новой группы (chat_member и вступления, записанные ботом),
+            # пересечённые с Approve=FALSE: план растёт с размером группы, а не таблицы Users
+            await db.execute(f"""
+                INSERT INTO CleanerTasks (RunID, Phase, ChatID, UserID, Action)
+                SELECT ?, ?, rg.ChatID, Users.UserID,
+                       CASE WHEN m.UpdatedAt >= DATETIME('now', 'localtime', ?) THEN '{ACTION_BAN}'
+                            ELSE '{ACTION_CHECK}' END
+                FROM CleanerRunGroups rg
+                JOIN ChatMembership m ON m.ChatID = rg.ChatID
+                JOIN Users ON Users.UserID = m.UserID
+                WHERE rg.RunID=? AND {covered_sql} AND m.Status IN ({_PRESENT_SQL})
+                  AND Users.Approve=FALSE AND {NOT_EXCLUDED_SQL}
+            """, (run_id, PHASE_NEW_GROUPS, max_age, run_id, max_age))
+
+        cursor = await db.execute("""
+            SELECT COUNT(DISTINCT UserID) FROM CleanerTasks WHERE RunID=? AND Phase=?
+        """, (run_id, PHASE_REGULAR))
+        (user_count,) = await cursor.fetchone()
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    logger.info(f"[cleaner] Создан прогон run_id={run_id}{' (полная сверка)' if full_scan else ''}, "
+                f"пользователей в основной фазе: {user_count}")
+    return run_id, user_count
+
+
+async def skip_no_longer_eligible(db: aiosqlite.Connection, run_id: int) -> int:
+    """
+    При продолжении прогона снимает задачи пользователей, которых с момента планирования
+    подтвердили (импорт вернул в компанию) или добавили в EXCLUDED_EMAILS.
+    """
+    cursor = await db.execute(f"""
+        UPDATE CleanerTasks
+        SET Result=?, DoneAt=DATETIME('now', 'localtime')
+        WHERE RunID=? AND Result IS NULL
+          AND UserID IN (SELECT UserID FROM Users WHERE Approve=TRUE OR {EXCLUDED_SQL})
+    """, (RESULT_SKIPPED, run_id))
+    await db.commit()
+    return cursor.rowcount
+
+
+async def complete_skipped_tasks(db: aiosqlite.Connection, run_id: int) -> int:
+    """
+    Отмечает выполненными (RESULT_CHECKED) задачи skip прогона без запросов к Bot API: по индексу
+    пользователя в чате нет. Пользователи основной фазы, у которых не осталось других задач,
+    сразу получают Banned=TRUE, как после обработки последней группы. Возвращает число задач.
+    """
+    cursor = await db.execute("""
+        UPDATE CleanerTasks
+        SET Result=?, DoneAt=DATETIME('now', 'localtime')
+        WHERE RunID=? AND Action=? AND Result IS NULL
+    """, (RESULT_CHECKED, run_id, ACTION_SKIP))
+    completed = cursor.rowcount
+    await db.execute(f"""
+        UPDATE Users SET Banned=TRUE
+        WHERE Banned=FALSE AND Approve=FALSE AND {NOT_EXCLUDED_SQL}
+          AND UserID IN (SELECT UserID FROM CleanerTasks WHERE RunID=? AND Phase=? AND Action=?)
+          AND NOT EXISTS (
+              SELECT 1 FROM CleanerTasks t
+              WHERE t.RunID=? AND t.Phase=? AND t.UserID=Users.UserID AND t.Result IS NULL
+          )
+    """, (run_id, PHASE_REGULAR, ACTION_SKIP, run_id, PHASE_REGULAR))
+    await db.commit()
+    return completed
+
+
+async def iter_pending_users(db: aiosqlite.Connection, run_id: int, phase: str, chat_id: int | None = None,
+                             chunk_size: int = DB_CHUNK_SIZE):
+    """
+    Отдаёт (UserID, Email, Action) невыполненных задач фазы в чате chat_id (без chat_id — по всем чатам фазы,
+    пользователь повторяется для каждого своего действия) порциями в порядке UserID. Как и iter_users,
+    каждая порция — отдельный запрос «UserID > последний», поэтому результаты можно записывать
+    через это же соединение.
+    """
+    chat_filter = "" if chat_id is None else "AND t.ChatID = ?"
+    chat_params = () if chat_id is None else (chat_id,)
+    last_user_id = -1 << 63
+    while True:
+        cursor = await db.execute(f"""
+            SELECT DISTINCT t.UserID, u.Email, t.Action
+            FROM CleanerTasks t
+            JOIN Users u ON u.UserID = t.UserID
+            WHERE t.RunID=? AND t.Phase=? {chat_filter} AND t.Result IS NULL AND t.UserID > ?
+            ORDER BY t.UserID
+            LIMIT ?
+        """, (run_id, phase, *chat_params, last_user_id, chunk_size))
+        rows = await cursor.fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last_user_id = rows[-1][0]
+
+
+async def get_phase_chats(db: aiosqlite.Connection, run_id: int, phase: str) -> list[int]:
+    cursor = await db.execute("""
+        SELECT DISTINCT ChatID FROM CleanerTasks WHERE RunID=? AND Phase=?
+    """, (run_id, phase))
+    return [row[0] for row in await cursor.fetchall()]
+
+
+async def get_pending_counts(db: aiosqlite.Connection, run_id: int, phase: str) -> dict[int, int]:
+    """Число невыполненных задач фазы по группам: {chat_id: задач}."""
+    cursor = await db.execute("""
+        SELECT ChatID, COUNT(*) FROM CleanerTasks
+        WHERE RunID=? AND Phase=? AND Result IS NULL
+        GROUP BY ChatID
+    """, (run_id, phase))
+    return dict(await cursor.fetchall())
+
+
+async def get_run_new_groups(db: aiosqlite.Connection, run_id: int) -> list[int]:
+    """Новые группы, взятые в прогон (в том числе те, где чистить некого)."""
+    cursor = await db.execute("SELECT ChatID FROM CleanerRunGroups WHERE RunID=? ORDER BY ChatID", (run_id,))
+    return [row[0] for row in await cursor.fetchall()]
+
+
+class RunCheckpoint:
+    """
+    Копит результаты задач прогона и пишет их порциями: результаты задач, Banned=TRUE
+    и статусы для ChatMembership фиксируются одним commit раз в batch_users вызовов add().
+    После падения повторно выполняются только задачи последней незафиксированной порции.
+    Группы обрабатываются параллельно, поэтому Banned=TRUE ставится при записи последней
+    задачи пользователя в фазе: пока в других группах остались невыполненные задачи, бана нет.
+    Конвейеры групп делят одно соединение, поэтому все их записи идут через flush() под блокировкой:
+    commit одного конвейера не может разрезать транзакцию другого (результаты задач без Banned=TRUE).
+    """
+
+    def __init__(self, db: aiosqlite.Connection, run_id: int, index: MembershipIndex,
+                 batch_users: int = CLEANER_CHECKPOINT_USERS):
+        self.db = db
+        self.run_id = run_id
+        self.index = index
+        self.batch_users = max(batch_users, 1)
+        self._results: list[tuple[str, int, str, int, int]] = []
+        self._banned: set[tuple[str, int]] = set()
+        self._done_groups: list[int] = []
+        self._users = 0
+        self._lock = asyncio.Lock()
+
+    async def add(self, phase: str, user_id: int, results: dict[int, bool], ban: bool = False):
+        """
+        Записывает результаты пользователя {chat_id: удалён ли}; ban — поставить Users.Banned=TRUE,
+        когда у пользователя не останется невыполненных задач фазы.
+        """
+        for chat_id, removed in results.items():
+            self._results.append((RESULT_REMOVED if removed else RESULT_CHECKED, self.run_id, phase, chat_id, user_id))
+        if ban:
+            self._banned.add((phase, user_id))
+        self._users += 1
+        if self._users >= self.batch_users:
+            await self.flush()
+
+    async def finish_group(self, chat_id: int):
+        """Снимает с новой группы пометку New вместе с последними результатами её задач."""
+        self._done_groups.append(chat_id)
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            await self._flush()
+
+    async def _flush(self):
+        results, self._results = self._results, []
+        banned, self._banned = self._banned, set()
+        done_groups, self._done_groups = self._done_groups, []
+        self._users = 0
+        if results:
+            await self.db.executemany("""
+                UPDATE CleanerTasks
+                SET Result=?, DoneAt=DATETIME('now', 'localtime')
+                WHERE RunID=? AND Phase=? AND ChatID=? AND UserID=?
+            """, results)
+        if banned:
+            await self.db.executemany("""
+                UPDATE Users SET Banned=TRUE
+                WHERE UserID=? AND NOT EXISTS (
+                    SELECT 1 FROM CleanerTasks
+                    WHERE RunID=? AND Phase=? AND UserID=? AND Result IS NULL
+                )
+            """, [(user_id, self.run_id, phase, user_id) for phase, user_id in banned])
+        if done_groups:
+            await self.db.executemany("UPDATE Groups SET New=FALSE WHERE ChatID=?", ((chat_id,) for chat_id in done_groups))
+        await self.index.flush()
+        await self.db.commit()
+
+
+async def get_run_summary(db: aiosqlite.Connection, run_id: int) -> tuple[int, int, int]:
+    """
+    Итоги всего прогона, включая части до перезапуска:
+    (удалений в основной фазе, удалений в новых группах, забанено пользователей).
+    """
+    cursor = await db.execute("""
+        SELECT Phase, COUNT(*)
+        FROM CleanerTasks
+        WHERE RunID=? AND Result=?
+        GROUP BY Phase
+    """, (run_id, RESULT_REMOVED))
+    removed = dict(await cursor.fetchall())
+
+    cursor = await db.execute(f"SELECT COUNT(DISTINCT UserID) FROM CleanerTasks WHERE {_BANNED_SQL}", (run_id,))
+    (banned_count,) = await cursor.fetchone()
+    return removed.get(PHASE_REGULAR, 0), removed.get(PHASE_NEW_GROUPS, 0), banned_count
+
+
+async def get_plan_summary(db: aiosqlite.Connection, run_id: int) -> dict[str, dict[str, int]]:
+    """Число задач плана по фазам и действиям: {phase: {action: count}}."""
+    cursor = await db.execute("""
+        SELECT Phase, Action, COUNT(*)
+        FROM CleanerTasks
+        WHERE RunID=?
+        GROUP BY Phase, Action
+    """, (run_id,))
+    summary = {}
+    for phase, action, count in await cursor.fetchall():
+        summary.setdefault(phase, {})[action] = count
+    return summary
+
+
+async def write_plan_file(db: aiosqlite.Connection, run_id: int, path: str) -> int:
+    """
+    Пишет план прогона для просмотра (CSV с разделителем ;): только задачи ban и check,
+    skip учитываются лишь в сводке. Возвращает число строк.
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["Phase", "ChatID", "Title", "UserID", "Email", "Action"])
+        async for row in iter_rows(db, """
+            SELECT t.Phase, t.ChatID, g.Title, t.UserID, u.Email, t.Action
+            FROM CleanerTasks t
+            JOIN Users u ON u.UserID = t.UserID
+            LEFT JOIN Groups g ON g.ChatID = t.ChatID
+            WHERE t.RunID=? AND t.Action<>?
+            ORDER BY t.Phase DESC, t.ChatID, t.UserID
+        """, (run_id, ACTION_SKIP)):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+async def finish_run(db: aiosqlite.Connection, run_id: int, total_removed: int, comment: str):
+    """
+    Закрывает прогон и одной транзакцией пишет итоговую строку SyncHistory (счётчики)
+    и поимённые действия в SyncAction: удаления из чатов и Banned=TRUE — прямо из CleanerTasks.
+    Забаненные прогоном пользователи уходят из очереди PendingBans.
+    """
+    await db.execute("""
+        UPDATE CleanerRuns
+        SET Status='done', FinishedAt=DATETIME('now', 'localtime')
+        WHERE RunID=?
+    """, (run_id,))
+    sync_id = await insert_sync_history(db, "cleaner", "-", total_removed, comment)
+    await db.execute("""
+        INSERT INTO SyncAction (SyncID, UserID, ChatID, Action, Result)
+        SELECT ?, UserID, ChatID, ?, Phase
+        FROM CleanerTasks
+        WHERE RunID=? AND Result=?
+    """, (sync_id, ACTION_REMOVED, run_id, RESULT_REMOVED))
+    await db.execute(f"""
+        INSERT INTO SyncAction (SyncID, UserID, ChatID, Action, Result)
+        SELECT DISTINCT ?, UserID, NULL, ?, NULL
+        FROM CleanerTasks
+        WHERE {_BANNED_SQL}
+    """, (sync_id, ACTION_BANNED, run_id))
+    await prune_pending_bans(db)
+    await db.commit()
@@ -4,16 +4,23 @@ import os
 import csv
 import datetime
 import shutil
+from array import array
 from pathlib import Path
 from config import logger
+from utils.id_set import IdSet
 
 IMPORT_DIR = "./import"
 ARCHIVE_SKIPPED = "./import/skipped"
 ARCHIVE_DONE = "./import/archived"
 EXPORT_DIR = "./export"
+# Недописанные выгрузки: на том же томе, что и ./export, чтобы os.replace был атомарным
+EXPORT_PARTIAL_DIR = "./export/.partial"
 
 def is_export_empty() -> bool:
-    """Возвращает True, если папка /export пустая (нет файлов), иначе False."""
+    """
+    Возвращает True, если папка /export пустая (нет файлов), иначе False.
+    Подпапки (в том числе EXPORT_PARTIAL_DIR) не учитываются.
+    """
     exports = [f for f in os.listdir(EXPORT_DIR) 
                if os.path.isfile(os.path.join(EXPORT_DIR, f))]
     return len(exports) == 0
@@ -61,51 +68,75 @@ def archive_import_file(filename: str, success=True):
     logger.info(f"Файл {filename} перемещён в {ARCHIVE_DONE}.")
 
 
-def parse_csv_users(filename: str) -> set[int]:
+# Разделители, которые встречаются в выгрузках кадровой системы
+CSV_DELIMITERS = ";,\t|"
+# Сколько номеров некорректных строк показать в логе
+BAD_ROWS_SAMPLE = 5
+
+
+def _detect_delimiter(header: str) -> str | None:
+    """Разделитель по строке заголовка: тот, при котором среди колонок есть UserID."""
+    for delimiter in CSV_DELIMITERS:
+        if "UserID" in next(csv.reader([header], delimiter=delimiter)):
+            return delimiter
+    return None
+
+
+def parse_csv_users(filename: str) -> IdSet:
     """
-    Читает CSV-файл, автоматически определяя разделитель, и собирает уникальные user_id (int) из колонки 'UserID'.
-    Возвращает пустое множество, если файл пуст, не найден, или отсутствует колонка 'UserID'.
+    Потоково читает CSV-файл и собирает уникальные user_id из колонки 'UserID'.
+    Разделитель определяется один раз по заголовку, из каждой строки берётся только колонка UserID;
+    некорректные строки считаются, в лог попадают их число и первые номера.
+    Возвращает пустой набор, если файл пуст, не найден, или отсутствует колонка 'UserID'.
 
     Args:
         filename (str): Имя файла в директории IMPORT_DIR.
 
     Returns:
-        set[int]: Множество user_id из файла.
+        IdSet: Отсортированный набор user_id из файла.
     """
     filepath = Path(IMPORT_DIR) / filename
     if not filepath.is_file():
         logger.warning(f"parse_csv_users: файл {filepath} не найден.")
-        return set()
+        return IdSet()
 
-    user_ids = set()
+    user_ids = array("q")
+    bad_rows, bad_sample = 0, []
     try:
-        with filepath.open("r", encoding="utf-8") as f:
-            # Читаем первые 1024 байта для анализа разделителя
-            sample = f.read(1024)
-            if not sample:
+        with filepath.open("r", encoding="utf-8", newline="") as f:
+            header = f.readline().lstrip("\ufeff")
+            if not header.strip():
                 logger.warning(f"Файл {filename} пустой.")
-                return set()
-            f.seek(0)  # Возвращаемся в начало файла
+                return IdSet()
 
-            # Определяем диалект CSV с помощью Sniffer
-            dialect = csv.Sniffer().sniff(sample)
-            delimiter = dialect.delimiter
-            logger.info(f"Определен разделитель: '{delimiter}' для файла {filename}")
-
-            # Читаем файл как словарь с заголовками
-            reader = csv.DictReader(f, delimiter=delimiter)
-            if 'UserID' not in reader.fieldnames:
+            delimiter = _detect_delimiter(header)
+            if delimiter is None:
                 logger.error(f"В файле {filename} отсутствует колонка 'UserID'.")
-                return set()
+                return IdSet()
+            logger.info(f"Определен разделитель: '{delimiter}' для файла {filename}")
+            column = next(csv.reader([header], delimiter=delimiter)).index("UserID")
 
-            for row in reader:
+            # Строка 1 — заголовок. Строки без кавычек режутся split до колонки UserID,
+            # остальные разбираются csv.reader
+            for line_number, line in enumerate(f, start=2):
                 try:
-                    uid = int(row['UserID'])
-                    user_ids.add(uid)
-                except (ValueError, KeyError):
-                    logger.warning(f"Некорректная строка: {row}")
+                    if '"' in line:
+                        row = next(csv.reader([line], delimiter=delimiter), None)
+                        if not row:
+                            continue
+                        user_ids.append(int(row[column]))
+                    else:
+                        user_ids.append(int(line.split(delimiter, column + 1)[column]))
+                except (ValueError, IndexError, OverflowError):
+                    if not line.strip():
+                        continue
+                    bad_rows += 1
+                    if len(bad_sample) < BAD_ROWS_SAMPLE:
+                        bad_sample.append(line_number)
     except Exception as e:
         logger.error(f"Ошибка чтения файла {filepath}: {e}")
-        return set()
+        return IdSet()
 
-    return user_ids
+    if bad_rows:
+        logger.warning(f"В файле {filename} некорректных строк: {bad_rows} (первые: {bad_sample})")
+    return IdSet(user_ids)
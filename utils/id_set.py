@@ -0,0 +1,89 @@
+# utils/id_set.py
+
+import operator
+from array import array
+from bisect import bisect_left
+from itertools import islice, groupby
+
+
+class IdSet:
+    """
+    Неизменяемый набор user_id в отсортированном array('q') без повторов: 8 байт на id
+    вместо ~70 у set[int]. Проверка вхождения — бинарный поиск, разность — слияние
+    двух отсортированных массивов. Итерация идёт по возрастанию, поэтому temp_id_table
+    вставляет id в конец индекса.
+    """
+
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids=()):
+        if not isinstance(ids, array) or ids.typecode != "q":
+            ids = array("q", ids)
+        if not _is_strictly_sorted(ids):
+            ids = array("q", sorted(ids))
+            if not _is_strictly_sorted(ids):
+                # Повторы: оставляем по одному
+                ids = array("q", (user_id for user_id, _ in groupby(ids)))
+        self._ids = ids
+
+    @classmethod
+    def from_sorted(cls, ids) -> "IdSet":
+        """
+        Оборачивает уже отсортированный массив без повторов без проверки и копирования:
+        array('q') или memoryview формата 'q' (например, снимок импорта в mmap).
+        """
+        result = cls.__new__(cls)
+        result._ids = ids
+        return result
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, user_id) -> bool:
+        ids = self._ids
+        i = bisect_left(ids, user_id)
+        return i < len(ids) and ids[i] == user_id
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, IdSet):
+            return self._ids == other._ids
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"IdSet({len(self._ids)} ids)"
+
+    def __sub__(self, other: "IdSet") -> "IdSet":
+        return self.difference(other)
+
+    def difference(self, other: "IdSet") -> "IdSet":
+        """Id из self, которых нет в other (слиянием, за O(len(self) + len(other)))."""
+        if not isinstance(other, IdSet):
+            other = IdSet(other)
+        left, right = self._ids, other._ids
+        result = array("q")
+        j, right_len = 0, len(right)
+        for i, user_id in enumerate(left):
+            while j < right_len and right[j] < user_id:
+                j += 1
+            if j == right_len:
+                # other закончился: остаток self целиком
+                result.extend(left[i:])
+                break
+            if right[j] != user_id:
+                result.append(user_id)
+        return IdSet.from_sorted(result)
+
+    def tobytes(self) -> bytes:
+        """Id в порядке возрастания как int64 с порядком байт платформы."""
+        return self._ids.tobytes()
+
+    def nbytes(self) -> int:
+        """Объём данных набора в байтах."""
+        return self._ids.itemsize * len(self._ids)
+
+
+def _is_strictly_sorted(ids: array) -> bool:
+    return all(map(operator.lt, ids, islice(ids, 1, None)))
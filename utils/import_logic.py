@@ -1,180 +1,113 @@
 # utils/import_logic.py
 
 import aiosqlite
-from config import logger, DB_PATH, EXCLUDED_EMAILS
-from database import get_user_email
+from contextlib import AsyncExitStack
+from config import logger
+from database import get_db, temp_id_table, EXCLUDED_SQL, NOT_EXCLUDED_SQL
+from utils.pending_bans import enqueue_pending_bans, SOURCE_IMPORT
 
-async def process_unapproved_in_db(active_user_ids: set[int], in_filename: str) -> list[int]:
+
+async def _select_and_update(db: aiosqlite.Connection, where: str, set_expr: str) -> list[int]:
     """
-    Ставим Approve=FALSE тем, у кого Approve=TRUE и Synced=TRUE но кто не в active_user_ids.
-    Пропускаем (не трогаем) тех, у кого email в EXCLUDED_EMAILS.
-    Возвращаем список user_id, кому сброшен Approve.
+    Выбирает UserID по условию where и применяет к тем же строкам SET set_expr.
+    Вызывается внутри транзакции BEGIN IMMEDIATE, поэтому между SELECT и UPDATE
+    никто другой не может изменить эти строки.
     """
-    changed_users = []
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("""
-            SELECT UserID, Email FROM Users
-             WHERE Approve=TRUE
-              AND Synced=TRUE
-        """)
-        rows = await cursor.fetchall()
-
-        for user_id, enc_email in rows:
-            if user_id not in active_user_ids:
-                # Проверяем email
-                plain_email = await get_user_email(user_id)
-                email_lower = plain_email.strip().lower()
-                if email_lower in [ex.strip().lower() for ex in EXCLUDED_EMAILS if ex.strip()]:
-                    continue
-                # Иначе снимаем Approve
-                changed_users.append(user_id)
-
-        if changed_users:
-            placeholders = ",".join("?" * len(changed_users))
-            query = f"""
-                UPDATE Users
-                   SET Approve=FALSE,
-                       WasApproved=TRUE,
-                       Banned=FALSE
-                 WHERE UserID IN ({placeholders})
-            """
-            await db.execute(query, tuple(changed_users))
-            await db.commit()
-            logger.info(f"Approve=FALSE выставлен для {len(changed_users)} пользователей.")
-        else:
-            logger.info("Никого не перевели на Approve=FALSE.")
+    cursor = await db.execute(f"SELECT UserID FROM Users WHERE {where}")
+    user_ids = [row[0] for row in await cursor.fetchall()]
+    if user_ids:
+        await db.execute(f"UPDATE Users SET {set_expr} WHERE {where}")
+    return user_ids
 
-    return changed_users
 
-async def protect_excluded_users() -> list[int]:
+async def _reconcile(fired_sql: str, restored_sql: str, tables: dict[str, object], mode: str
+                     ) -> tuple[list[int], list[int], list[int], list[int]]:
     """
-    Дополнительная защита: устанавливаем Approve=TRUE для всех пользователей из EXCLUDED_EMAILS,
-    независимо от их текущего статуса Synced.
-    Возвращаем список ID пользователей, которым восстановлен доступ.
+    Общая часть полной и дельта-сверки. Наборы id из tables загружаются во временные таблицы
+    temp.<имя>, на которые ссылаются fired_sql (кого уволить) и restored_sql (кому вернуть доступ);
+    шаги применяются одной транзакцией.
     """
-    protected_users = []
-    excluded_emails_lower = [ex.strip().lower() for ex in EXCLUDED_EMAILS if ex.strip()]
-    
-    if not excluded_emails_lower:
-        return protected_users
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем всех пользователей
-        cursor = await db.execute("SELECT UserID FROM Users")
-        all_users = await cursor.fetchall()
-        
-        for (user_id,) in all_users:
-            plain_email = await get_user_email(user_id)
-            if plain_email:
-                email_lower = plain_email.strip().lower()
-                if email_lower in excluded_emails_lower:
-                    # Проверяем текущий статус
-                    cursor_check = await db.execute("""
-                        SELECT Approve, Banned FROM Users WHERE UserID = ?
-                    """, (user_id,))
-                    current_status = await cursor_check.fetchone()
-                    
-                    if current_status:
-                        approve, banned = current_status
-                        if not approve or banned:
-                            # Восстанавливаем доступ для исключенного пользователя
-                            await db.execute("""
-                                UPDATE Users 
-                                SET Approve = TRUE, Banned = FALSE 
-                                WHERE UserID = ?
-                            """, (user_id,))
-                            protected_users.append(user_id)
-                            logger.info(f"Защищен исключенный пользователь {user_id}:{plain_email} - Approve=TRUE, Banned=FALSE")
-        
-        if protected_users:
+    async with get_db() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            async with AsyncExitStack() as stack:
+                for name, ids in tables.items():
+                    await stack.enter_async_context(temp_id_table(db, ids, name))
+
+                changed_users = await _select_and_update(db, f"""
+                    Approve=TRUE
+                    AND Synced=TRUE
+                    AND {fired_sql}
+                    AND {NOT_EXCLUDED_SQL}
+                """, "Approve=FALSE, WasApproved=TRUE, Banned=FALSE")
+                await enqueue_pending_bans(db, changed_users, SOURCE_IMPORT)
+
+                restored_users = await _select_and_update(db, f"""
+                    (Approve=FALSE OR Banned=TRUE)
+                    AND {restored_sql}
+                """, "Approve=TRUE, Synced=TRUE, Banned=FALSE")
+
+            protected_users = await _select_and_update(db, f"""
+                (Approve=FALSE OR Banned=TRUE)
+                AND {EXCLUDED_SQL}
+            """, "Approve=TRUE, Banned=FALSE")
+
+            unbanned_users = await _select_and_update(db, f"""
+                Banned=TRUE
+                AND {EXCLUDED_SQL}
+            """, "Banned=FALSE, Approve=TRUE")
+
             await db.commit()
-            logger.info(f"Защищено {len(protected_users)} исключенных пользователей после импорта.")
-    
-    return protected_users
+        except Exception:
+            await db.rollback()
+            logger.exception("Ошибка сверки импорта, изменения отменены.")
+            raise
+
+    logger.info(
+        f"Сверка импорта ({mode}) применена: Approve=FALSE для {len(changed_users)}, "
+        f"восстановлено {len(restored_users)}, защищено {len(protected_users)}, "
+        f"разбанено {len(unbanned_users)} исключенных пользователей."
+    )
+    return changed_users, restored_users, protected_users, unbanned_users
 
-async def restore_banned_users(active_user_ids: set[int]) -> list[int]:
+
+async def reconcile_import(active_user_ids) -> tuple[list[int], list[int], list[int], list[int]]:
     """
-    Восстанавливаем доступ пользователям, которые ранее были забанены или потеряли доступ, 
-    но присутствуют в новом списке активных пользователей.
-    
-    Для таких пользователей устанавливаем:
-    - Approve = TRUE (разрешаем доступ)
-    - Synced = TRUE (помечаем как синхронизированных)
-    - Banned = FALSE (снимаем бан)
-    
-    Возвращает список ID пользователей, которым восстановлен доступ.
+    Полная сверка таблицы Users со списком активных сотрудников из файла импорта.
+    Все наборы считаются в SQL относительно временной таблицы с active_user_ids
+    и таблицы ExcludedEmails и применяются одной транзакцией, по шагам:
+
+    1. Уволенные: Approve=TRUE, Synced=TRUE, нет в active_user_ids и email не в EXCLUDED_EMAILS
+       -> Approve=FALSE, WasApproved=TRUE, Banned=FALSE; они же ставятся в очередь PendingBans,
+       по которой утром cleaner.py удаляет их из групп.
+    2. Восстановленные: есть в active_user_ids, но Approve=FALSE или Banned=TRUE
+       -> Approve=TRUE, Synced=TRUE, Banned=FALSE.
+    3. Защищённые: email в EXCLUDED_EMAILS и Approve=FALSE или Banned=TRUE
+       -> Approve=TRUE, Banned=FALSE.
+    4. Разбаненные: email в EXCLUDED_EMAILS и Banned=TRUE (могли быть забанены между cleaner и import)
+       -> Banned=FALSE, Approve=TRUE.
+
+    Возвращает (changed_users, restored_users, protected_users, unbanned_users).
     """
-    restored_users = []
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем всех пользователей, которым нужно восстановить доступ
-        # (они есть в списке активных, но у них Approve=FALSE или Banned=TRUE)
-        cursor = await db.execute("""
-            SELECT UserID FROM Users
-            WHERE (Approve=FALSE OR Banned=TRUE)
-              AND UserID IN ({})
-        """.format(','.join('?' * len(active_user_ids))), tuple(active_user_ids))
-        
-        rows = await cursor.fetchall()
-        
-        if rows:
-            # Извлекаем ID пользователей из результатов запроса
-            users_to_restore = [row[0] for row in rows]
-            
-            # Восстанавливаем доступ пользователям
-            query = """
-                UPDATE Users
-                SET Approve=TRUE,
-                    Synced=TRUE,
-                    Banned=FALSE
-                WHERE UserID IN ({})
-            """.format(','.join('?' * len(users_to_restore)))
-            
-            await db.execute(query, tuple(users_to_restore))
-            await db.commit()
-            
-            logger.info(f"Восстановлен доступ для {len(users_to_restore)} пользователей.")
-            restored_users = users_to_restore
-        else:
-            logger.info("Нет пользователей для восстановления доступа.")
-    
-    return restored_users
-
-async def unban_excluded_users() -> list[int]:
+    return await _reconcile(
+        "UserID NOT IN (SELECT ID FROM temp.tmp_active)",
+        "UserID IN (SELECT ID FROM temp.tmp_active)",
+        {"tmp_active": active_user_ids},
+        "полная",
+    )
+
+
+async def reconcile_import_delta(fire_candidates, restore_candidates) -> tuple[list[int], list[int], list[int], list[int]]:
     """
-    Разбанивает пользователей из EXCLUDED_EMAILS, которые могли быть забанены
-    между запуском cleaner и import.
-    Возвращает список ID пользователей, которые были разбанены.
+    Сверка только по изменениям относительно предыдущего импорта: шаги те же, что у reconcile_import,
+    но увольнение проверяется лишь для fire_candidates (пропавшие из списка и выгруженные после
+    предыдущего импорта, которых в списке нет), а восстановление — для restore_candidates
+    (появившиеся в списке и пользователи из него, получившие Approve=FALSE или Banned=TRUE после
+    предыдущего импорта). Шаги 3–4 по EXCLUDED_EMAILS выполняются как обычно.
     """
-    unbanned_users = []
-    excluded_emails_lower = [ex.strip().lower() for ex in EXCLUDED_EMAILS if ex.strip()]
-    
-    if not excluded_emails_lower:
-        return unbanned_users
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем всех забаненных пользователей
-        cursor = await db.execute("""
-            SELECT UserID FROM Users WHERE Banned=TRUE
-        """)
-        banned_users = await cursor.fetchall()
-        
-        for (user_id,) in banned_users:
-            plain_email = await get_user_email(user_id)
-            if plain_email:
-                email_lower = plain_email.strip().lower()
-                if email_lower in excluded_emails_lower:
-                    # Разбаниваем исключенного пользователя
-                    await db.execute("""
-                        UPDATE Users 
-                        SET Banned = FALSE, Approve = TRUE 
-                        WHERE UserID = ?
-                    """, (user_id,))
-                    unbanned_users.append(user_id)
-                    logger.info(f"Разбанен исключенный пользователь {user_id}:{plain_email} - Banned=FALSE, Approve=TRUE")
-        
-        if unbanned_users:
-            await db.commit()
-            logger.info(f"Разбанено {len(unbanned_users)} исключенных пользователей.")
-    
-    return unbanned_users
+    return await _reconcile(
+        "UserID IN (SELECT ID FROM temp.tmp_fire)",
+        "UserID IN (SELECT ID FROM temp.tmp_restore)",
+        {"tmp_fire": fire_candidates, "tmp_restore": restore_candidates},
+        "дельта",
+    )
@@ -0,0 +1,57 @@
+# utils/job_lock.py
+
+import os
+import time
+import fcntl
+import asyncio
+import datetime
+from contextlib import asynccontextmanager
+from config import logger, JOB_LOCK_FILE, JOB_LOCK_TIMEOUT
+
+
+class JobLockTimeout(TimeoutError):
+    """Блокировку пакетных заданий не удалось получить за отведённое время."""
+
+
+@asynccontextmanager
+async def job_lock(tag: str, timeout: float = JOB_LOCK_TIMEOUT):
+    """
+    Взаимоисключение пакетных заданий (import.py, cleaner.py, import_watcher.py) через flock
+    на JOB_LOCK_FILE. Файл лежит рядом с базой, поэтому блокировка общая для контейнеров с этим томом.
+    Если блокировку держит другое задание, ждёт до timeout секунд и бросает JobLockTimeout.
+    Блокировка снимается ОС и при падении процесса.
+    """
+    os.makedirs(os.path.dirname(JOB_LOCK_FILE) or ".", exist_ok=True)
+    f = open(JOB_LOCK_FILE, "a+")
+    started = time.monotonic()
+    waiting = False
+    try:
+        while True:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if not waiting:
+                    f.seek(0)
+                    holder = f.read().strip() or "неизвестно"
+                    logger.info(f"[{tag}] Ждём завершения другого пакетного задания: {holder}")
+                    waiting = True
+                if time.monotonic() - started >= timeout:
+                    raise JobLockTimeout(f"[{tag}] Блокировка {JOB_LOCK_FILE} занята дольше {timeout:g} с")
+                await asyncio.sleep(1)
+
+        if waiting:
+            logger.info(f"[{tag}] Блокировка получена через {time.monotonic() - started:.0f} с")
+        f.seek(0)
+        f.truncate()
+        f.write(f"{tag} pid={os.getpid()} с {datetime.datetime.now():%Y-%m-%d %H:%M:%S}\n")
+        f.flush()
+        try:
+            yield
+        finally:
+            f.seek(0)
+            f.truncate()
+            f.flush()
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    finally:
+        f.close()
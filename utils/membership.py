@@ -0,0 +1,76 @@
+# utils/membership.py
+
+import aiosqlite
+from config import logger, MEMBERSHIP_TTL_HOURS
+from database import queue_write
+
+# Статусы, при которых пользователь считается участником чата (как в прежней проверке cleaner.py)
+PRESENT_STATUSES = ("member", "administrator", "creator")
+
+UPSERT_SQL = """
+    INSERT INTO ChatMembership (ChatID, UserID, Status, UpdatedAt)
+    VALUES (?, ?, ?, DATETIME('now', 'localtime'))
+    ON CONFLICT(ChatID, UserID) DO UPDATE SET Status=excluded.Status, UpdatedAt=excluded.UpdatedAt
+"""
+
+
+async def record_chat_member(chat_id: int, user_id: int, status: str):
+    """Сохраняет статус из обновления chat_member (бот, через групповую запись)."""
+    await queue_write(UPSERT_SQL, (chat_id, user_id, status))
+
+
+class MembershipIndex:
+    """
+    Индекс членства ChatMembership для пакетных скриптов.
+    Свежими считаются записи моложе ttl_hours: их статусу верим без запроса к Bot API.
+    Если записи нет или она устарела, скрипт проверяет членство вживую и сохраняет результат через record().
+    record() только копит строки в памяти, чтобы не держать блокировку записи на время запросов
+    к Bot API; flush() пишет их одним executemany, а commit делает сам скрипт.
+    """
+
+    def __init__(self, db: aiosqlite.Connection, ttl_hours: int = MEMBERSHIP_TTL_HOURS):
+        self.db = db
+        self.max_age = f"-{ttl_hours} hours"
+        self.hits = 0
+        self.misses = 0
+        self._pending: list[tuple[int, int, str]] = []
+
+    async def fresh_statuses(self, user_id: int) -> dict[int, str]:
+        """Свежие статусы пользователя во всех чатах: {chat_id: status}."""
+        cursor = await self.db.execute("""
+            SELECT ChatID, Status
+            FROM ChatMembership
+            WHERE UserID=? AND UpdatedAt >= DATETIME('now', 'localtime', ?)
+        """, (user_id, self.max_age))
+        return {chat_id: status for chat_id, status in await cursor.fetchall()}
+
+    async def fresh_status(self, chat_id: int, user_id: int) -> str | None:
+        """Свежий статус пользователя в чате или None, если нужна живая проверка."""
+        cursor = await self.db.execute("""
+            SELECT Status
+            FROM ChatMembership
+            WHERE ChatID=? AND UserID=? AND UpdatedAt >= DATETIME('now', 'localtime', ?)
+        """, (chat_id, user_id, self.max_age))
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+    def count(self, status: str | None):
+        """Учитывает попадание (статус из индекса) или промах (нужна живая проверка)."""
+        if status is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def record(self, chat_id: int, user_id: int, status: str):
+        self._pending.append((chat_id, user_id, status))
+
+    async def flush(self) -> int:
+        """Пишет накопленные статусы (без commit). Возвращает число строк."""
+        rows, self._pending = self._pending, []
+        if rows:
+            await self.db.executemany(UPSERT_SQL, rows)
+        return len(rows)
+
+    def log_stats(self, tag: str):
+        total = self.hits + self.misses
+        logger.info(f"[{tag}] Индекс ChatMembership: из индекса {self.hits} из {total} проверок, живых проверок {self.misses}")
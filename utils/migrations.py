@@ -0,0 +1,178 @@
+# utils/migrations.py
+
+import aiosqlite
+from config import logger
+
+# Версионированные миграции схемы: (версия, описание, список SQL-операторов).
+# Новые миграции добавляются только в конец списка, уже выпущенные не меняются.
+MIGRATIONS = [
+    (1, "Индексы по флагам статуса Users", [
+        # export.py: Approve=TRUE AND Synced=FALSE; clean_new_groups: Approve=FALSE
+        "CREATE INDEX IF NOT EXISTS idx_users_approve_synced ON Users(Approve, Synced)",
+        # cleaner.py: Approve=FALSE AND Banned=FALSE; reconcile_import: Banned=TRUE
+        "CREATE INDEX IF NOT EXISTS idx_users_banned_approve ON Users(Banned, Approve)",
+    ]),
+    (2, "Индекс по нормализованному email", [
+        # scripts/recover.py: lower(Email) IN (...)
+        "CREATE INDEX IF NOT EXISTS idx_users_email_lower ON Users(lower(Email))",
+    ]),
+    (3, "Индекс Groups(can_restrict_members, New)", [
+        "CREATE INDEX IF NOT EXISTS idx_groups_restrict_new ON Groups(can_restrict_members, New)",
+    ]),
+    (4, "Колонка Users.EmailNorm и таблица ExcludedEmails", [
+        # EmailNorm = Email.strip().lower(), пишется в set_user_email; NULL, если email нет
+        "ALTER TABLE Users ADD COLUMN EmailNorm TEXT",
+        "UPDATE Users SET EmailNorm = NULLIF(lower(trim(Email, ' ' || char(9, 10, 13))), '')",
+        "CREATE INDEX IF NOT EXISTS idx_users_email_norm ON Users(EmailNorm)",
+        # Заменён индексом по EmailNorm
+        "DROP INDEX IF EXISTS idx_users_email_lower",
+        # Содержимое синхронизируется с EXCLUDED_EMAILS в initialize_db()
+        "CREATE TABLE IF NOT EXISTS ExcludedEmails (EmailNorm TEXT PRIMARY KEY)",
+    ]),
+    (5, "Таблица ChatMembership", [
+        # Статус пользователя в чате по обновлениям chat_member и проверкам cleaner.py
+        """
+        CREATE TABLE IF NOT EXISTS ChatMembership (
+            ChatID INTEGER NOT NULL,
+            UserID INTEGER NOT NULL,
+            Status TEXT NOT NULL,
+            UpdatedAt DATETIME NOT NULL,
+            PRIMARY KEY (ChatID, UserID)
+        ) WITHOUT ROWID
+        """,
+        # cleaner.py: все чаты одного пользователя
+        "CREATE INDEX IF NOT EXISTS idx_chat_membership_user ON ChatMembership(UserID)",
+    ]),
+    (6, "Таблицы прогонов cleaner.py", [
+        # Прогон cleaner.py: running → done (или abandoned, если продолжать уже нельзя)
+        """
+        CREATE TABLE IF NOT EXISTS CleanerRuns (
+            RunID INTEGER PRIMARY KEY AUTOINCREMENT,
+            StartedAt DATETIME NOT NULL,
+            FinishedAt DATETIME,
+            Status TEXT NOT NULL,
+            Simulation BOOLEAN NOT NULL DEFAULT FALSE
+        )
+        """,
+        # План прогона: пары (чат, пользователь) по фазам; Result IS NULL — задача не выполнена
+        """
+        CREATE TABLE IF NOT EXISTS CleanerTasks (
+            RunID INTEGER NOT NULL,
+            Phase TEXT NOT NULL,
+            ChatID INTEGER NOT NULL,
+            UserID INTEGER NOT NULL,
+            Result TEXT,
+            DoneAt DATETIME,
+            PRIMARY KEY (RunID, Phase, ChatID, UserID)
+        ) WITHOUT ROWID
+        """,
+        # Основная фаза: невыполненные задачи по пользователям
+        "CREATE INDEX IF NOT EXISTS idx_cleaner_tasks_user ON CleanerTasks(RunID, Phase, UserID)",
+    ]),
+    (7, "Действие в плане cleaner.py", [
+        # ban — индекс ChatMembership говорит, что пользователь в чате; skip — что его там нет;
+        # check — записи нет или она устарела, нужна живая проверка
+        "ALTER TABLE CleanerTasks ADD COLUMN Action TEXT NOT NULL DEFAULT 'check'",
+    ]),
+    (8, "Новые группы прогона cleaner.py", [
+        # Группы с New=TRUE на момент планирования: clean_new_groups снимает с них пометку,
+        # даже если в плане для группы нет ни одной задачи
+        """
+        CREATE TABLE IF NOT EXISTS CleanerRunGroups (
+            RunID INTEGER NOT NULL,
+            ChatID INTEGER NOT NULL,
+            PRIMARY KEY (RunID, ChatID)
+        ) WITHOUT ROWID
+        """,
+        "INSERT OR IGNORE INTO CleanerRunGroups (RunID, ChatID) "
+        "SELECT DISTINCT RunID, ChatID FROM CleanerTasks WHERE Phase='new_groups'",
+    ]),
+    (9, "Журнал действий SyncAction", [
+        # Поимённые действия import.py, cleaner.py и exclusions.py вместо списков uid:email в SyncHistory.Comment;
+        # ChatID — для действий в конкретном чате (удаление cleaner.py), иначе NULL
+        """
+        CREATE TABLE IF NOT EXISTS SyncAction (
+            SyncID INTEGER NOT NULL,
+            UserID INTEGER NOT NULL,
+            ChatID INTEGER,
+            Action TEXT NOT NULL,
+            Result TEXT
+        )
+        """,
+        # «Что случилось с пользователем X»
+        "CREATE INDEX IF NOT EXISTS idx_sync_action_user ON SyncAction(UserID, SyncID)",
+        "CREATE INDEX IF NOT EXISTS idx_sync_action_sync ON SyncAction(SyncID)",
+    ]),
+    (10, "Очередь на удаление PendingBans", [
+        # Пользователи, которых cleaner.py должен удалить из групп: ставит import.py (уволенные)
+        # и проверка исключений (некорпоративный email), убирает cleaner.py после бана
+        """
+        CREATE TABLE IF NOT EXISTS PendingBans (
+            UserID INTEGER PRIMARY KEY,
+            Source TEXT NOT NULL,
+            EnqueuedAt DATETIME NOT NULL
+        ) WITHOUT ROWID
+        """,
+        # Уже ожидающие очистки пользователи переходят в очередь
+        "INSERT OR IGNORE INTO PendingBans (UserID, Source, EnqueuedAt) "
+        "SELECT UserID, 'full_scan', DATETIME('now', 'localtime') FROM Users "
+        "WHERE Approve=FALSE AND Banned=FALSE AND UserID IS NOT NULL",
+        # Прогон со сверкой всех Approve=FALSE, а не только очереди
+        "ALTER TABLE CleanerRuns ADD COLUMN FullScan BOOLEAN NOT NULL DEFAULT FALSE",
+    ]),
+    (11, "Неверифицированные пользователи в очереди PendingBans", [
+        # /start теперь ставит нового пользователя в очередь сразу; добавленные после миграции 10
+        # и так и не верифицированные ждали бы полной сверки
+        "INSERT OR IGNORE INTO PendingBans (UserID, Source, EnqueuedAt) "
+        "SELECT UserID, 'unverified', DATETIME('now', 'localtime') FROM Users "
+        "WHERE Approve=FALSE AND Banned=FALSE AND WasApproved=FALSE AND UserID IS NOT NULL",
+    ]),
+]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    """Возвращает номер последней применённой миграции (0, если миграций не было)."""
+    cursor = await db.execute("SELECT COALESCE(MAX(Version), 0) FROM schema_version")
+    (version,) = await cursor.fetchone()
+    return version
+
+
+async def apply_migrations(db: aiosqlite.Connection) -> int:
+    """
+    Применяет недостающие миграции по порядку, каждую в своей транзакции.
+    Транзакция открывается через BEGIN IMMEDIATE, поэтому бот и cron,
+    стартующие одновременно, не применят одну миграцию дважды.
+    Возвращает текущую версию схемы.
+    """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            Version INTEGER PRIMARY KEY,
+            Description TEXT,
+            AppliedAt DATETIME
+        )
+    """)
+    await db.commit()
+
+    current = await get_schema_version(db)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= await get_schema_version(db):
+                await db.rollback()
+                continue
+            for statement in statements:
+                await db.execute(statement)
+            await db.execute("""
+                INSERT INTO schema_version (Version, Description, AppliedAt)
+                VALUES (?, ?, DATETIME('now', 'localtime'))
+            """, (version, description))
+            await db.commit()
+            logger.info(f"Применена миграция {version}: {description}")
+        except Exception:
+            await db.rollback()
+            logger.exception(f"Ошибка миграции {version}: {description}")
+            raise
+
+    return await get_schema_version(db)
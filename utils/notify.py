@@ -1,8 +1,8 @@
 # utils/notify.py
 
-from aiogram import Bot
-import aiosqlite
-from config import logger, API_TOKEN, DB_PATH
+from config import logger
+from database import get_db, temp_id_table
+from utils.tg_client import TelegramClient
 
 NOTIFICATION_TEXT = (
     "Здравствуйте! \n"
@@ -19,26 +19,25 @@ async def notify_newly_fired(user_ids: list[int]) -> list[int]:
     if not user_ids:
         return []
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with get_db() as db:
         # Выбираем только тех, у кого Notified=FALSE
-        placeholders = ",".join("?" * len(user_ids))
-        cursor = await db.execute(
-            f"SELECT UserID FROM Users WHERE UserID IN ({placeholders}) AND Notified=FALSE",
-            tuple(user_ids)
-        )
-        rows = await cursor.fetchall()
+        async with temp_id_table(db, user_ids) as ids_table:
+            cursor = await db.execute(
+                f"SELECT UserID FROM Users WHERE UserID IN (SELECT ID FROM {ids_table}) AND Notified=FALSE"
+            )
+            rows = await cursor.fetchall()
         to_notify = [r[0] for r in rows]
 
     if not to_notify:
         logger.info("Все пользователи из списка уже получили уведомление (Notified=TRUE).")
         return []
 
-    bot = Bot(token=API_TOKEN)
+    client = TelegramClient()
     notified_users = []
     try:
         for uid in to_notify:
             try:
-                await bot.send_message(uid, NOTIFICATION_TEXT)
+                await client.send_message(uid, NOTIFICATION_TEXT)
                 logger.info(f"[notify_newly_fired] Отправлено уведомление user_id={uid}")
                 notified_users.append(uid)
             except Exception as e:
@@ -46,16 +45,16 @@ async def notify_newly_fired(user_ids: list[int]) -> list[int]:
 
         # Проставляем Notified=TRUE тем, кому отправляли
         if notified_users:
-            async with aiosqlite.connect(DB_PATH) as db:
-                placeholders = ",".join("?" * len(notified_users))
-                await db.execute(
-                    f"UPDATE Users SET Notified=TRUE WHERE UserID IN ({placeholders})",
-                    tuple(notified_users)
-                )
+            async with get_db() as db:
+                async with temp_id_table(db, notified_users) as ids_table:
+                    await db.execute(
+                        f"UPDATE Users SET Notified=TRUE WHERE UserID IN (SELECT ID FROM {ids_table})"
+                    )
                 await db.commit()
             logger.info(f"[notify_newly_fired] Установлен Notified=TRUE для {len(notified_users)} пользователей.")
 
     finally:
-        await bot.session.close()
+        await client.close()
+        client.log_stats("notify_newly_fired")
     
     return notified_users
@@ -0,0 +1,47 @@
+# utils/pending_bans.py
+
+import aiosqlite
+from database import NOT_EXCLUDED_SQL
+
+# Кто поставил пользователя в очередь PendingBans
+SOURCE_IMPORT = "import"                # import.py: Approve=FALSE, нет в списке сотрудников
+SOURCE_NON_CORPORATE = "non_corporate"  # exclusions: снят Approve из-за некорпоративного email
+SOURCE_UNVERIFIED = "unverified"        # /start: новый пользователь ещё не прошёл верификацию
+SOURCE_FULL_SCAN = "full_scan"          # cleaner.py: найден полной сверкой, но в очереди его не было
+
+# Пользователи очереди, которых cleaner.py должен удалить из групп
+PENDING_USERS_SQL = "UserID IN (SELECT UserID FROM PendingBans)"
+
+# Постановка одного пользователя через групповую запись бота (queue_write); уже стоящего в очереди не трогает
+ENQUEUE_PENDING_BAN_SQL = """
+    INSERT OR IGNORE INTO PendingBans (UserID, Source, EnqueuedAt)
+    VALUES (?, ?, DATETIME('now', 'localtime'))
+"""
+
+
+async def enqueue_pending_bans(db: aiosqlite.Connection, user_ids, source: str):
+    """
+    Ставит пользователей в очередь на удаление из групп (без commit, в транзакции вызывающего).
+    Повторная постановка обновляет источник и время.
+    """
+    await db.executemany("""
+        INSERT INTO PendingBans (UserID, Source, EnqueuedAt)
+        VALUES (?, ?, DATETIME('now', 'localtime'))
+        ON CONFLICT(UserID) DO UPDATE SET Source=excluded.Source, EnqueuedAt=excluded.EnqueuedAt
+    """, ((user_id, source) for user_id in user_ids))
+
+
+async def prune_pending_bans(db: aiosqlite.Connection) -> int:
+    """
+    Убирает из очереди тех, кого удалять уже не нужно (без commit): забаненных, снова
+    подтверждённых, исключённых и отсутствующих в Users. Возвращает число удалённых записей.
+    """
+    cursor = await db.execute(f"""
+        DELETE FROM PendingBans
+        WHERE NOT EXISTS (
+            SELECT 1 FROM Users
+            WHERE Users.UserID = PendingBans.UserID
+              AND Approve=FALSE AND Banned=FALSE AND {NOT_EXCLUDED_SQL}
+        )
+    """)
+    return cursor.rowcount
@@ -0,0 +1,95 @@
+# utils/rate_limit.py
+
+import time
+import asyncio
+
+
+class TokenBucket:
+    """
+    Token bucket: rate токенов в секунду, не больше capacity в запасе.
+    acquire() ждёт токен; ожидающие обслуживаются по очереди. rate <= 0 — без ограничения.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (например, после 429 с retry_after)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        if self.rate <= 0 and not self._paused_until:
+            return
+        async with self._lock:
+            while (delay := self._paused_until - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            if self.rate <= 0:
+                return
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class RateLimiter:
+    """
+    Лимит запросов к Bot API: общий на бота и отдельный на каждый чат.
+    Сначала берётся токен чата, затем общий, чтобы ожидание одного «горячего» чата
+    не занимало общий лимит.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+
+    async def acquire(self, chat_id: int | str | None = None):
+        if chat_id is not None:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+            await bucket.acquire()
+        await self.global_bucket.acquire()
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    RateLimiter, который подстраивает общий лимит под 429 (AIMD): после flood control лимит
+    уменьшается вдвое (не ниже min_rate), а каждый успешный запрос возвращает increase rps,
+    пока лимит не дойдёт до исходного global_rate. Если global_rate <= 0, лимит не вводится.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, min_rate: float = 1.0, increase: float = 0.1):
+        super().__init__(global_rate, chat_rate)
+        self.max_rate = global_rate
+        self.min_rate = min(min_rate, global_rate) if global_rate > 0 else 0.0
+        self.increase = increase
+
+    @property
+    def rate(self) -> float:
+        return self.global_bucket.rate
+
+    def on_success(self):
+        bucket = self.global_bucket
+        if 0 < bucket.rate < self.max_rate:
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def on_flood(self, retry_after: float, chat_id: int | str | None = None):
+        """429: пауза чата (или всего бота, если чат неизвестен) и уменьшение общего лимита."""
+        if chat_id is not None and chat_id in self._chat_buckets:
+            self._chat_buckets[chat_id].pause(retry_after)
+        else:
+            self.global_bucket.pause(retry_after)
+        if self.global_bucket.rate > 0:
+            self.global_bucket.rate = max(self.min_rate, self.global_bucket.rate / 2)
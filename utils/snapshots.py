@@ -0,0 +1,116 @@
+# utils/snapshots.py
+
+import os
+import sys
+import mmap
+import zlib
+import struct
+from array import array
+from pathlib import Path
+from config import logger
+from utils.id_set import IdSet
+from utils.file_ops import ARCHIVE_DONE, parse_csv_users
+
+# Снимки успешных импортов: отсортированные user_id как int64 (little-endian) после заголовка
+SNAPSHOT_DIR = "./import/snapshots"
+SNAPSHOT_SUFFIX = ".ids"
+SNAPSHOT_MAGIC = b"WCBIDS01"
+# Заголовок: магия, число id, CRC32 данных, длина имени исходного файла; затем имя и выравнивание до 8 байт
+_HEADER = struct.Struct("<8sQIH")
+
+
+def snapshot_path(source_filename: str) -> Path:
+    """Путь снимка для файла импорта active_users_YYYYmmdd.csv."""
+    return Path(SNAPSHOT_DIR) / (Path(source_filename).stem + SNAPSHOT_SUFFIX)
+
+
+def write_snapshot(ids: IdSet, source_filename: str) -> Path:
+    """
+    Пишет снимок набора ids импорта source_filename. Файл пишется рядом под временным именем
+    и подменяется через os.replace, поэтому читатель видит либо старый снимок, либо новый целиком.
+    """
+    data = ids.tobytes()
+    if sys.byteorder != "little":
+        swapped = array("q", data)
+        swapped.byteswap()
+        data = swapped.tobytes()
+    name = Path(source_filename).name.encode("utf-8")
+    header = _HEADER.pack(SNAPSHOT_MAGIC, len(ids), zlib.crc32(data), len(name)) + name
+    header += b"\0" * (-len(header) % 8)
+
+    path = snapshot_path(source_filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    logger.info(f"Снимок импорта {source_filename}: {len(ids)} id, {path}")
+    return path
+
+
+def load_snapshot(path: Path) -> IdSet | None:
+    """
+    Открывает снимок через mmap без копирования id в память процесса: IdSet работает прямо
+    по отображению файла. Проверяет заголовок и CRC32; при ошибке пишет предупреждение и возвращает None.
+    """
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError("файл короче заголовка")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, checksum, name_len = _HEADER.unpack_from(mapped)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("неизвестный формат")
+        offset = _HEADER.size + name_len
+        offset += -offset % 8
+        data = memoryview(mapped)[offset:]
+        if len(data) != count * 8:
+            raise ValueError(f"ожидалось {count} id, в файле {len(data) // 8}")
+        if zlib.crc32(data) != checksum:
+            raise ValueError("не совпала контрольная сумма")
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Снимок {path} не прочитан: {e}")
+        return None
+
+    if sys.byteorder != "little":
+        ids = array("q", data)
+        ids.byteswap()
+        return IdSet.from_sorted(ids)
+    return IdSet.from_sorted(data.cast("q"))
+
+
+def read_import_ids(filename: str) -> IdSet | None:
+    """
+    User_id успешного импорта filename: из снимка, а если его нет или он повреждён —
+    из CSV в ./import/archived (снимок при этом создаётся). None, если нет ни снимка, ни файла.
+    """
+    path = snapshot_path(filename)
+    if path.is_file():
+        ids = load_snapshot(path)
+        if ids is not None:
+            return ids
+
+    if not (Path(ARCHIVE_DONE) / filename).is_file():
+        return None
+    # parse_csv_users читает относительно ./import
+    ids = parse_csv_users(str(Path(ARCHIVE_DONE).relative_to("import") / filename))
+    if ids:
+        write_snapshot(ids, filename)
+    return ids
+
+
+def find_latest_import(exclude: str | None = None) -> str | None:
+    """
+    Имя файла последнего успешного импорта (active_users_YYYYmmdd.csv) по снимкам, без exclude.
+    Пока снимков нет, ищет последний файл в ./import/archived.
+    """
+    names = [p.stem + ".csv" for p in Path(SNAPSHOT_DIR).glob(f"active_users_*{SNAPSHOT_SUFFIX}")]
+    if not names:
+        names = [p.name for p in Path(ARCHIVE_DONE).glob("active_users_*.csv")]
+    names = [name for name in names if name != exclude]
+    if not names:
+        return None
+    return max(names, key=lambda name: Path(name).stem.split('_')[-1])
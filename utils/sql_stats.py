@@ -0,0 +1,190 @@
+# utils/sql_stats.py
+
+import re
+import time
+import sqlite3
+from functools import lru_cache
+import aiosqlite
+from aiosqlite.context import contextmanager
+from config import logger, SQL_SLOW_QUERY_MS
+
+# Верхние границы корзин гистограммы задержек, мс (последняя — всё, что дольше)
+HISTOGRAM_BOUNDS_MS = (1, 5, 10, 50, 100, 500, 1000, float("inf"))
+
+_WRITE_RE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+_TEMP_RE = re.compile(r"\b(INTO|UPDATE|FROM)\s+temp\.", re.IGNORECASE)
+_BEGIN_LOCK_RE = re.compile(r"^\s*BEGIN\s+(IMMEDIATE|EXCLUSIVE)\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """
+    Приводит запрос к «отпечатку»: литералы заменяются на ?, списки (?, ?, ...) сворачиваются,
+    пробелы схлопываются. Запросы, отличающиеся только параметрами, попадают в одну строку статистики.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", sql)
+    return " ".join(sql.split())
+
+
+class QueryStats:
+    __slots__ = ("calls", "total_ms", "max_ms", "rows", "lock_wait_ms", "fetch_ms", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.lock_wait_ms = 0.0
+        self.fetch_ms = 0.0
+        self.histogram = [0] * len(HISTOGRAM_BOUNDS_MS)
+
+
+class SqlStats:
+    """
+    Статистика запросов процесса по отпечаткам: задержки (гистограмма), строки
+    (изменённые для записи, прочитанные для SELECT) и ожидание блокировки записи.
+    """
+
+    def __init__(self):
+        self._queries: dict[str, QueryStats] = {}
+
+    def _get(self, sql: str) -> QueryStats:
+        key = fingerprint(sql)
+        stats = self._queries.get(key)
+        if stats is None:
+            stats = self._queries[key] = QueryStats()
+        return stats
+
+    def record(self, sql: str, elapsed_ms: float, rows: int = 0, lock_wait_ms: float = 0.0):
+        stats = self._get(sql)
+        stats.calls += 1
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.rows += max(rows, 0)
+        stats.lock_wait_ms += lock_wait_ms
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if elapsed_ms <= bound:
+                stats.histogram[i] += 1
+                break
+        if SQL_SLOW_QUERY_MS and elapsed_ms >= SQL_SLOW_QUERY_MS:
+            logger.warning(
+                f"[sql] Медленный запрос {elapsed_ms:.1f} мс (ожидание блокировки {lock_wait_ms:.1f} мс, "
+                f"строк {rows}): {fingerprint(sql)[:300]}"
+            )
+
+    def record_fetch(self, sql: str, elapsed_ms: float, rows: int):
+        stats = self._get(sql)
+        stats.fetch_ms += elapsed_ms
+        stats.rows += rows
+
+    def reset(self):
+        self._queries.clear()
+
+    def report(self, top: int = 15) -> list[str]:
+        """Строки отчёта по top отпечаткам с наибольшим суммарным временем (выполнение + чтение строк)."""
+        items = sorted(self._queries.items(), key=lambda kv: kv[1].total_ms + kv[1].fetch_ms, reverse=True)
+        lines = []
+        for key, s in items[:top]:
+            histogram = " ".join(
+                f"≤{bound:g}:{count}" if bound != float("inf") else f">{HISTOGRAM_BOUNDS_MS[-2]:g}:{count}"
+                for bound, count in zip(HISTOGRAM_BOUNDS_MS, s.histogram) if count
+            )
+            lines.append(
+                f"{s.total_ms + s.fetch_ms:9.1f} мс  вызовов={s.calls} строк={s.rows} "
+                f"макс={s.max_ms:.1f} мс чтение={s.fetch_ms:.1f} мс блокировка={s.lock_wait_ms:.1f} мс "
+                f"[{histogram}]  {key[:200]}"
+            )
+        return lines
+
+    def log_summary(self, title: str, top: int = 15):
+        if not self._queries:
+            return
+        total_ms = sum(s.total_ms + s.fetch_ms for s in self._queries.values())
+        lock_ms = sum(s.lock_wait_ms for s in self._queries.values())
+        calls = sum(s.calls for s in self._queries.values())
+        logger.info(
+            f"[sql] Сводка {title}: {calls} запросов, {len(self._queries)} отпечатков, "
+            f"{total_ms:.1f} мс в SQLite, из них ожидание блокировки {lock_ms:.1f} мс"
+        )
+        for line in self.report(top):
+            logger.info(f"[sql] {line}")
+
+
+sql_stats = SqlStats()
+
+
+class InstrumentedCursor(aiosqlite.Cursor):
+    """Курсор, который учитывает время и количество прочитанных строк в sql_stats."""
+
+    def __init__(self, conn: aiosqlite.Connection, cursor: sqlite3.Cursor, sql: str):
+        super().__init__(conn, cursor)
+        self._sql = sql
+
+    def _record_fetch(self, started: float, rows: int):
+        sql_stats.record_fetch(self._sql, (time.perf_counter() - started) * 1000, rows)
+
+    async def fetchone(self):
+        started = time.perf_counter()
+        row = await super().fetchone()
+        self._record_fetch(started, 0 if row is None else 1)
+        return row
+
+    async def fetchmany(self, size: int | None = None):
+        started = time.perf_counter()
+        rows = await super().fetchmany(size)
+        self._record_fetch(started, len(rows))
+        return rows
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        rows = await super().fetchall()
+        self._record_fetch(started, len(rows))
+        return rows
+
+
+class InstrumentedConnection(aiosqlite.Connection):
+    """
+    Соединение aiosqlite, которое пишет задержку, строки и ожидание блокировки каждого
+    оператора в sql_stats. Только наблюдает: транзакции открываются так же, как без обёртки
+    (неявный BEGIN модуля sqlite3 перед первой записью), поэтому SQL_STATS не влияет на блокировки.
+    """
+
+    @staticmethod
+    def _takes_write_lock(sql: str, in_transaction: bool) -> bool:
+        # BEGIN IMMEDIATE/EXCLUSIVE ничего не делает, кроме захвата блокировки записи. Первая запись
+        # вне транзакции (кроме temp-таблиц) захватывает её после неявного BEGIN: всё время такого
+        # оператора засчитывается как ожидание — это верхняя оценка
+        if _BEGIN_LOCK_RE.match(sql):
+            return True
+        return not in_transaction and bool(_WRITE_RE.match(sql)) and not _TEMP_RE.search(sql)
+
+    async def _timed(self, fn, sql: str, parameters):
+        takes_lock = self._takes_write_lock(sql, self.in_transaction)
+        started = time.perf_counter()
+        cursor = await self._execute(fn, sql, parameters)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        sql_stats.record(sql, elapsed_ms, cursor.rowcount, elapsed_ms if takes_lock else 0.0)
+        return InstrumentedCursor(self, cursor, sql)
+
+    @contextmanager
+    async def execute(self, sql: str, parameters=None) -> aiosqlite.Cursor:
+        return await self._timed(self._conn.execute, sql, [] if parameters is None else parameters)
+
+    @contextmanager
+    async def executemany(self, sql: str, parameters) -> aiosqlite.Cursor:
+        return await self._timed(self._conn.executemany, sql, parameters)
+
+    async def commit(self):
+        started = time.perf_counter()
+        await super().commit()
+        sql_stats.record("COMMIT", (time.perf_counter() - started) * 1000)
+
+
+def connect_instrumented(database: str, **kwargs) -> InstrumentedConnection:
+    """Аналог aiosqlite.connect(), возвращающий InstrumentedConnection."""
+    def connector() -> sqlite3.Connection:
+        return sqlite3.connect(database, **kwargs)
+
+    return InstrumentedConnection(connector, 64)
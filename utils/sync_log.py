@@ -0,0 +1,86 @@
+# utils/sync_log.py
+
+import aiosqlite
+from database import get_db
+
+# Действия журнала SyncAction (что случилось с пользователем в рамках записи SyncHistory)
+ACTION_FIRED = "fired"              # import: Approve=FALSE, нет в списке сотрудников
+ACTION_RESTORED = "restored"        # import/exclusions: снова в списке — доступ восстановлен
+ACTION_PROTECTED = "protected"      # import: исключённый пользователь защищён от увольнения
+ACTION_UNBANNED = "unbanned"        # import/exclusions: снят Banned
+ACTION_NOTIFIED = "notified"        # import: отправлено уведомление об увольнении
+ACTION_APPROVED = "approved"        # exclusions: Approve=TRUE для исключённого пользователя
+ACTION_UNAPPROVED = "unapproved"    # exclusions: снят Approve из-за некорпоративного email
+ACTION_REMOVED = "removed"          # cleaner: пользователь удалён из чата ChatID (Result — фаза прогона)
+ACTION_BANNED = "banned"            # cleaner: Banned=TRUE после обхода групп
+ACTION_EXPORTED = "exported"        # export: выгружен компании, Synced=TRUE
+
+
+async def insert_sync_history(db: aiosqlite.Connection, sync_type: str, filename: str, count: int,
+                              comment: str = "") -> int:
+    """Добавляет строку SyncHistory (без commit). Возвращает её ID для SyncAction."""
+    cursor = await db.execute("""
+        INSERT INTO SyncHistory (SyncType, FileName, RecordCount, SyncDate, Comment)
+        VALUES (?, ?, ?, DATETIME('now', 'localtime'), ?)
+    """, (sync_type, filename, count, comment))
+    return cursor.lastrowid
+
+
+async def insert_sync_actions(db: aiosqlite.Connection, sync_id: int, action: str, user_ids,
+                              chat_id: int | None = None, result: str | None = None):
+    """Пишет одно действие для набора пользователей одним executemany (без commit)."""
+    await db.executemany(
+        "INSERT INTO SyncAction (SyncID, UserID, ChatID, Action, Result) VALUES (?, ?, ?, ?, ?)",
+        ((sync_id, user_id, chat_id, action, result) for user_id in user_ids)
+    )
+
+
+async def write_sync_history(sync_type: str, filename: str, count: int, comment: str = "",
+                             actions: dict[str, list[int]] | None = None) -> int:
+    """
+    Пишет строку SyncHistory (только счётчики в Comment) и поимённые действия в SyncAction
+    одной транзакцией. actions — {действие: [user_id, ...]}. Возвращает ID строки SyncHistory.
+    """
+    async with get_db() as db:
+        sync_id = await insert_sync_history(db, sync_type, filename, count, comment)
+        for action, user_ids in (actions or {}).items():
+            await insert_sync_actions(db, sync_id, action, user_ids)
+        await db.commit()
+    return sync_id
+
+
+async def get_user_actions(db: aiosqlite.Connection, user_id: int, limit: int = 100) -> list[tuple]:
+    """
+    Что происходило с пользователем: последние limit действий по индексу SyncAction(UserID),
+    новые первыми. Строки: (SyncDate, SyncType, FileName, ChatID, Action, Result).
+    """
+    cursor = await db.execute("""
+        SELECT h.SyncDate, h.SyncType, h.FileName, a.ChatID, a.Action, a.Result
+        FROM SyncAction a
+        JOIN SyncHistory h ON h.ID = a.SyncID
+        WHERE a.UserID=?
+        ORDER BY a.SyncID DESC, a.ChatID
+        LIMIT ?
+    """, (user_id, limit))
+    return await cursor.fetchall()
+
+
+async def get_last_sync_id(db: aiosqlite.Connection, sync_type: str, filename: str | None = None) -> int | None:
+    """ID последней успешной (Comment начинается с success) строки SyncHistory типа sync_type, при filename — этого файла."""
+    file_filter = "" if filename is None else "AND FileName=?"
+    file_params = () if filename is None else (filename,)
+    cursor = await db.execute(f"""
+        SELECT MAX(ID) FROM SyncHistory
+        WHERE SyncType=? {file_filter} AND Comment LIKE 'success%'
+    """, (sync_type, *file_params))
+    (sync_id,) = await cursor.fetchone()
+    return sync_id
+
+
+async def get_action_users_since(db: aiosqlite.Connection, action: str, since_sync_id: int) -> list[int]:
+    """Пользователи с действием action в строках SyncHistory новее since_sync_id."""
+    cursor = await db.execute("""
+        SELECT DISTINCT UserID FROM SyncAction
+        WHERE SyncID > ? AND Action=?
+    """, (since_sync_id, action))
+    return [row[0] for row in await cursor.fetchall()]
@@ -0,0 +1,120 @@
+# utils/tg_client.py
+
+import random
+import asyncio
+import weakref
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+from config import (
+    logger,
+    API_TOKEN,
+    TELEGRAM_API_SERVER,
+    TG_GLOBAL_RPS,
+    TG_CHAT_RPS,
+    TG_MIN_RPS,
+    TG_MAX_RETRIES,
+    TG_BACKOFF_BASE,
+    TG_BACKOFF_MAX,
+)
+from utils.rate_limit import AdaptiveRateLimiter
+
+# Временные ошибки: сеть, таймауты и 5xx. Остальные TelegramAPIError (400, 403, 404) не повторяются.
+TRANSIENT_ERRORS = (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)
+
+
+def create_bot(token: str = API_TOKEN, api_server: str = TELEGRAM_API_SERVER) -> Bot:
+    """
+    Создаёт Bot для пакетных скриптов. Если задан TELEGRAM_API_SERVER, запросы идут
+    на этот сервер (локальный Bot API или fake-сервер из scripts/fake_bot_api.py).
+    """
+    if not api_server:
+        return Bot(token=token)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_server.rstrip("/")))
+    return Bot(token=token, session=session)
+
+
+class TelegramClient:
+    """
+    Общий клиент Bot API для пакетных скриптов и фоновых операций бота.
+    Каждый запрос проходит через AdaptiveRateLimiter (лимит на бота и на чат, снижение после 429),
+    на TelegramRetryAfter ждёт retry_after и повторяет, временные ошибки повторяет с
+    экспоненциальной задержкой со случайным разбросом. Не более TG_MAX_RETRIES повторов,
+    после чего исключение пробрасывается — запрос не теряется молча.
+    """
+
+    _by_bot: "weakref.WeakKeyDictionary[Bot, TelegramClient]" = weakref.WeakKeyDictionary()
+
+    def __init__(self, bot: Bot | None = None, global_rate: float = TG_GLOBAL_RPS,
+                 chat_rate: float = TG_CHAT_RPS, max_retries: int = TG_MAX_RETRIES):
+        self.bot = bot or create_bot()
+        self._owns_bot = bot is None
+        self.limiter = AdaptiveRateLimiter(global_rate, chat_rate, min_rate=TG_MIN_RPS)
+        self.max_retries = max_retries
+        self.calls = 0
+        self.retries = 0
+        self.floods = 0
+
+    @classmethod
+    def for_bot(cls, bot: Bot) -> "TelegramClient":
+        """Клиент для уже созданного Bot (например, бота из main.py): один на экземпляр, чтобы лимиты были общими."""
+        client = cls._by_bot.get(bot)
+        if client is None:
+            client = cls._by_bot[bot] = cls(bot)
+        return client
+
+    async def call(self, method, *args, chat_id: int | str | None = None, **kwargs):
+        """Вызывает метод Bot (bot.ban_chat_member и т.п.) с лимитами и повторами. chat_id — для лимита на чат."""
+        attempt = 0
+        while True:
+            await self.limiter.acquire(chat_id)
+            self.calls += 1
+            try:
+                result = await method(*args, **kwargs)
+                self.limiter.on_success()
+                return result
+            except TelegramRetryAfter as e:
+                self.floods += 1
+                self.limiter.on_flood(e.retry_after, chat_id)
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"[tg_client] Flood control (чат {chat_id}): ждём {e.retry_after} с, "
+                               f"лимит снижен до {self.limiter.rate:g} rps")
+                # Пауза уже выставлена в лимитере: следующий acquire дождётся retry_after
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(TG_BACKOFF_MAX, TG_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"[tg_client] Временная ошибка (чат {chat_id}): {e}. Повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+            attempt += 1
+            self.retries += 1
+
+    async def get_chat_member(self, chat_id: int | str, user_id: int):
+        return await self.call(self.bot.get_chat_member, chat_id, user_id, chat_id=chat_id)
+
+    async def ban_chat_member(self, chat_id: int | str, user_id: int):
+        return await self.call(self.bot.ban_chat_member, chat_id, user_id, chat_id=chat_id)
+
+    async def unban_chat_member(self, chat_id: int | str, user_id: int, only_if_banned: bool = True):
+        return await self.call(self.bot.unban_chat_member, chat_id, user_id,
+                               only_if_banned=only_if_banned, chat_id=chat_id)
+
+    async def send_message(self, chat_id: int | str, text: str, **kwargs):
+        return await self.call(self.bot.send_message, chat_id, text, chat_id=chat_id, **kwargs)
+
+    async def get_chat(self, chat_id: int | str):
+        return await self.call(self.bot.get_chat, chat_id, chat_id=chat_id)
+
+    async def get_chat_member_count(self, chat_id: int | str):
+        return await self.call(self.bot.get_chat_member_count, chat_id, chat_id=chat_id)
+
+    def log_stats(self, tag: str):
+        logger.info(f"[{tag}] Запросов к Bot API: {self.calls}, повторов: {self.retries}, 429: {self.floods}, "
+                    f"текущий лимит: {self.limiter.rate:g} rps")
+
+    async def close(self):
+        """Закрывает сессию, если бот создан клиентом."""
+        if self._owns_bot:
+            await self.bot.session.close()
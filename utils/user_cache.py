@@ -0,0 +1,129 @@
+# utils/user_cache.py
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import NamedTuple
+from redis.asyncio import Redis
+from config import logger, REDIS_HOST, REDIS_PORT, USER_CACHE_SIZE, USER_CACHE_TTL
+
+# Канал Redis, через который cron-контейнер сообщает боту об изменённых пользователях.
+# Сообщение: "*" (сбросить всё) или список UserID через запятую.
+INVALIDATION_CHANNEL = "wincheckbot:user_cache:invalidate"
+
+
+class UserStatus(NamedTuple):
+    approve: bool
+    was_approved: bool
+    invite_count: int
+    email: str
+
+
+class UserStatusCache:
+    """
+    Ограниченный LRU-кэш UserID -> UserStatus с временем жизни записей.
+    Счётчик generation растёт при каждой инвалидации: значение, прочитанное из БД
+    до инвалидации, не попадёт в кэш (см. put).
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[int, tuple[float, UserStatus]] = OrderedDict()
+
+    def get(self, user_id: int) -> UserStatus | None:
+        item = self._items.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._items[user_id]
+            self.misses += 1
+            return None
+        self._items.move_to_end(user_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, user_id: int, status: UserStatus, generation: int):
+        if generation != self.generation or self.max_size <= 0:
+            return
+        self._items[user_id] = (time.monotonic() + self.ttl, status)
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, user_ids=None):
+        """Сбрасывает записи для user_ids или весь кэш, если user_ids=None."""
+        self.generation += 1
+        if user_ids is None:
+            self._items.clear()
+            return
+        for user_id in user_ids:
+            self._items.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+user_cache = UserStatusCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+async def publish_invalidation(user_ids=None):
+    """
+    Сообщает другим процессам (боту) об изменении пользователей через Redis pub/sub.
+    Ошибки Redis не прерывают пакетный скрипт: устаревшая запись всё равно истечёт через TTL.
+    """
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+    payload = "*" if user_ids is None else ",".join(str(uid) for uid in user_ids)
+    try:
+        redis = Redis(host=REDIS_HOST, port=REDIS_PORT, socket_timeout=5)
+        try:
+            await redis.publish(INVALIDATION_CHANNEL, payload)
+        finally:
+            await redis.aclose()
+    except Exception as e:
+        logger.warning(f"[user_cache] Не удалось отправить инвалидацию кэша через Redis: {e}")
+
+
+def _apply_invalidation(payload: str):
+    if payload == "*":
+        user_cache.invalidate()
+        logger.info("[user_cache] Кэш статусов сброшен по сигналу из Redis.")
+        return
+    user_ids = [int(uid) for uid in payload.split(",") if uid]
+    user_cache.invalidate(user_ids)
+    logger.info(f"[user_cache] Инвалидировано {len(user_ids)} записей по сигналу из Redis.")
+
+
+async def listen_invalidations(redis: Redis):
+    """
+    Фоновая задача бота: слушает INVALIDATION_CHANNEL и сбрасывает записи кэша.
+    После разрыва соединения кэш сбрасывается целиком, так как сигналы могли потеряться.
+    """
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                data = message["data"]
+                _apply_invalidation(data.decode() if isinstance(data, bytes) else data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[user_cache] Подписка на инвалидации прервана: {e}. Переподключение через 5 с.")
+            user_cache.invalidate()
+            await asyncio.sleep(5)
+        finally:
+            await pubsub.aclose()